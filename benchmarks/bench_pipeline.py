@@ -0,0 +1,285 @@
+"""
+Benchmark the whole main() pipeline and each of its stages on synthetic
+PII datasets, against an in-process moto S3 stand-in.
+
+Run from the repository root with:
+
+    python -m benchmarks.bench_pipeline --sizes small medium --output results.json
+
+Each stage is timed as the best of several runs, then run once more under
+tracemalloc to record its peak traced allocations. The process peak RSS
+is read after each dataset; it is a high-water mark for the whole run, so
+size classes are benchmarked from smallest to largest. Pass the JSON of an
+earlier run as --baseline to flag stages that have become slower.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+import pandas as pd
+import pyarrow as pa
+from benchmarks.synthetic import (
+    FILE_TYPES,
+    SIZE_CLASSES,
+    dataset_bytes,
+    generate_dataset,
+)
+
+BUCKET = "benchmark-bucket"
+
+
+def peak_rss_mb():
+    """
+    Return the peak resident set size of this process so far, in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS bytes
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def measure(function, repeats, *args):
+    """
+    Time a function as the best of several runs, then run it once under
+    tracemalloc to find its peak traced allocations.
+
+    Returns:
+        tuple: The measurements and the function's result.
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds": min(timings),
+        "peak_traced_mb": peak / 1e6,
+    }, result
+
+
+def _throughput(measurement, rows, size):
+    """
+    Add rows/s and MB/s, measured against the input, to a measurement.
+    """
+    seconds = max(measurement["seconds"], 1e-9)
+    return {
+        **measurement,
+        "rows_per_second": rows / seconds,
+        "mb_per_second": size / 1e6 / seconds,
+    }
+
+
+def benchmark_dataset(s3, file_type, size_class, rows, dataset, repeats):
+    """
+    Upload one synthetic dataset and benchmark main() and its stages on it.
+    """
+    from src.file_handling import (
+        bytes_to_dataframe,
+        dataframe_to_bytes,
+        download_s3_file_bytes,
+    )
+    from src.main import main
+    from src.utils import obfuscate_pii_fields
+
+    df, pii_fields = dataset
+    file_content = dataset_bytes(df, file_type)
+    key = f"{size_class}.{file_type}"
+    s3.put_object(Bucket=BUCKET, Key=key, Body=file_content)
+    file_path = f"s3://{BUCKET}/{key}"
+    input_json = json.dumps(
+        {"file_to_obfuscate": file_path, "pii_fields": pii_fields}
+    )
+
+    stages = {}
+    stages["download"], _ = measure(
+        download_s3_file_bytes, repeats, file_path
+    )
+    # JSON Lines files are never loaded into a DataFrame
+    if file_type != "jsonl":
+        stages["parse"], parsed = measure(
+            bytes_to_dataframe, repeats, file_content, file_type
+        )
+        stages["obfuscate_pii_fields"], obfuscated = measure(
+            obfuscate_pii_fields, repeats, parsed, pii_fields
+        )
+        stages["dataframe_to_bytes"], _ = measure(
+            dataframe_to_bytes, repeats, obfuscated, file_type
+        )
+    stages["main"], _ = measure(main, repeats, input_json)
+
+    return {
+        "file_type": file_type,
+        "size_class": size_class,
+        "rows": rows,
+        "columns": len(df.columns),
+        "pii_fields": len(pii_fields),
+        "bytes": len(file_content),
+        "stages": {
+            name: _throughput(measurement, rows, len(file_content))
+            for name, measurement in stages.items()
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run(args):
+    """
+    Generate every requested dataset and benchmark it in every format.
+
+    Returns:
+        dict: The environment, the settings and a result for each dataset.
+    """
+    import boto3
+    from moto import mock_aws
+    from src.connection import configure_s3_client
+
+    # moto needs credentials to sign requests, even though none are sent
+    for name, value in [
+        ("AWS_ACCESS_KEY_ID", "benchmark"),
+        ("AWS_SECRET_ACCESS_KEY", "benchmark"),
+        ("AWS_DEFAULT_REGION", "eu-west-2"),
+    ]:
+        os.environ.setdefault(name, value)
+
+    results = []
+    with mock_aws():
+        # The shared client is rebuilt inside the mock
+        configure_s3_client()
+        s3 = boto3.client("s3", region_name=os.environ["AWS_DEFAULT_REGION"])
+        s3.create_bucket(
+            Bucket=BUCKET,
+            CreateBucketConfiguration={
+                "LocationConstraint": os.environ["AWS_DEFAULT_REGION"]
+            },
+        )
+
+        for size_class in sorted(args.sizes, key=SIZE_CLASSES.get):
+            rows = SIZE_CLASSES[size_class]
+            dataset = generate_dataset(
+                rows,
+                args.columns,
+                args.pii_fraction,
+                args.null_rate,
+                args.string_length,
+                args.seed,
+            )
+            for file_type in args.formats:
+                result = benchmark_dataset(
+                    s3, file_type, size_class, rows, dataset, args.repeats
+                )
+                results.append(result)
+                main_stage = result["stages"]["main"]
+                print(
+                    f"{file_type:8} {size_class:7} {rows:>9} rows "
+                    f"{result['bytes'] / 1e6:8.1f} MB  "
+                    f"main {main_stage['seconds']:7.3f}s "
+                    f"{main_stage['rows_per_second']:>12,.0f} rows/s "
+                    f"{main_stage['mb_per_second']:7.1f} MB/s  "
+                    f"peak RSS {result['peak_rss_mb']:.0f} MB"
+                )
+        configure_s3_client()
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pandas": pd.__version__,
+            "pyarrow": pa.__version__,
+        },
+        "settings": {
+            "columns": args.columns,
+            "pii_fraction": args.pii_fraction,
+            "null_rate": args.null_rate,
+            "string_length": args.string_length,
+            "seed": args.seed,
+            "repeats": args.repeats,
+        },
+        "results": results,
+    }
+
+
+def find_regressions(report, baseline, tolerance):
+    """
+    Compare the stage timings of a report with those of a baseline report.
+
+    Args:
+        report (dict): The results of this run.
+        baseline (dict): The results of an earlier run.
+        tolerance (float): How much slower a stage may be, e.g. 0.2 for 20%.
+
+    Returns:
+        list: A description of each stage slower than the tolerance allows.
+    """
+    baseline_stages = {
+        (result["file_type"], result["size_class"], stage): measurement
+        for result in baseline["results"]
+        for stage, measurement in result["stages"].items()
+    }
+
+    regressions = []
+    for result in report["results"]:
+        for stage, measurement in result["stages"].items():
+            previous = baseline_stages.get(
+                (result["file_type"], result["size_class"], stage)
+            )
+            if previous and measurement["seconds"] > previous["seconds"] * (
+                1 + tolerance
+            ):
+                regressions.append(
+                    f"{result['file_type']} {result['size_class']} {stage}: "
+                    f"{previous['seconds']:.3f}s -> {measurement['seconds']:.3f}s"
+                )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes", nargs="+", choices=SIZE_CLASSES, default=["small", "medium"]
+    )
+    parser.add_argument(
+        "--formats", nargs="+", choices=FILE_TYPES, default=FILE_TYPES
+    )
+    parser.add_argument("--columns", type=int, default=10)
+    parser.add_argument("--pii-fraction", type=float, default=0.3)
+    parser.add_argument("--null-rate", type=float, default=0.05)
+    parser.add_argument("--string-length", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument(
+        "--baseline", help="Compare with the JSON results of an earlier run"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="How much slower a stage may get before it is reported",
+    )
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = find_regressions(
+                report, json.load(baseline), args.tolerance
+            )
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,145 @@
+"""
+Benchmark the 'redact' strategy on a large synthetic free-text column, such
+as the notes of support-ticket exports, against one pass per pattern and
+against Python's re module.
+
+Run from the repository root with, for example:
+
+    python -m benchmarks.bench_redaction --size 2G --threads 4
+
+The column is redacted in chunks of --chunk-size, as the streaming engines
+and Parquet row groups would, and the same generated chunk is reused for
+the rest of the column so large sizes do not take long to set up.
+"""
+
+import argparse
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from src.cli import parse_size
+from src.masking import REDACTION_PATTERNS, redact_text, redaction_regex
+from src.utils import MASK_VALUE
+
+WORDS = (
+    "the customer called about their order and asked for a refund "
+    "because the parcel arrived late please check the account"
+).split()
+PII_SNIPPETS = [
+    "email jane.doe{i}@example.com",
+    "call +44 7700 900{i:03d}",
+    "ring 020 7946 {i:04d}",
+    "IBAN GB82 WEST 1234 5698 7654 32",
+    "NI AB 12 34 56 C",
+    "postcode SW1A 1AA",
+]
+TERMS = ["Acme Corp", "Jane Doe", "John Smith", "Globex"]
+
+
+def make_notes(size, pii_rate=0.3, seed=0):
+    """
+    Build a column of free-text notes of about size bytes, where a share
+    of the notes mention some PII.
+
+    Args:
+        size (int): The approximate size of the column in bytes.
+        pii_rate (float): The share of notes that contain PII.
+        seed (int): Seed for the random generator, for reproducible data.
+
+    Returns:
+        pa.Array: The notes.
+    """
+    rng = np.random.default_rng(seed)
+    notes, total, i = [], 0, 0
+    while total < size:
+        words = list(rng.choice(WORDS, rng.integers(8, 40)))
+        if rng.random() < pii_rate:
+            snippet = PII_SNIPPETS[i % len(PII_SNIPPETS)].format(i=i % 1000)
+            words.insert(int(rng.integers(0, len(words))), snippet)
+        if i % 50 == 0:
+            words.append(TERMS[i % len(TERMS)])
+        note = " ".join(words)
+        notes.append(note)
+        total += len(note)
+        i += 1
+    return pa.array(notes, type=pa.string())
+
+
+def combined_pass(chunk):
+    """
+    Redact every pattern and term in a single pass, as the strategy does.
+    """
+    return redact_text(chunk, list(REDACTION_PATTERNS), TERMS)
+
+
+def pass_per_pattern(chunk):
+    """
+    Redact with one pass over the text for each pattern and term.
+    """
+    for name in REDACTION_PATTERNS:
+        chunk = pc.replace_substring_regex(
+            chunk, REDACTION_PATTERNS[name], MASK_VALUE
+        )
+    return pc.replace_substring_regex(
+        chunk, redaction_regex([], TERMS), MASK_VALUE
+    )
+
+
+def python_re(chunk):
+    """
+    Redact each value with Python's re module and the combined pattern.
+    """
+    pattern = re.compile(redaction_regex(list(REDACTION_PATTERNS), TERMS))
+    return [
+        None if value is None else pattern.sub(MASK_VALUE, value)
+        for value in chunk.to_pylist()
+    ]
+
+
+def throughput(function, chunk, chunks, threads):
+    """
+    Redact chunks copies of a chunk on a number of threads, returning the
+    wall-clock seconds and the throughput in MB/s.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        for _ in executor.map(function, [chunk] * chunks):
+            pass
+    seconds = time.perf_counter() - start
+    return seconds, chunk.nbytes * chunks / seconds / 1e6
+
+
+def run(size, chunk_size, threads, python_size):
+    chunk = make_notes(chunk_size)
+    chunks = max(size // chunk.nbytes, 1)
+    print(
+        f"{chunks} chunks of {len(chunk)} notes, "
+        f"{chunk.nbytes * chunks / 1e9:.2f} GB in total, {threads} threads"
+    )
+    for name, function in [
+        ("combined pattern", combined_pass),
+        ("pass per pattern", pass_per_pattern),
+    ]:
+        seconds, rate = throughput(function, chunk, chunks, threads)
+        print(f"  {name + ':':20}{seconds:8.2f}s {rate:8.1f} MB/s")
+
+    # Python's re holds the GIL, so it is timed on a smaller sample only
+    sample = make_notes(python_size)
+    seconds, rate = throughput(python_re, sample, 1, 1)
+    print(f"  {'python re (1 thread):':20}{seconds:8.2f}s {rate:8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=parse_size, default=parse_size("1G"))
+    parser.add_argument(
+        "--chunk-size", type=parse_size, default=parse_size("64M")
+    )
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument(
+        "--python-size", type=parse_size, default=parse_size("16M")
+    )
+    args = parser.parse_args()
+    run(args.size, args.chunk_size, args.threads, args.python_size)
@@ -0,0 +1,136 @@
+"""
+Reproducible synthetic PII datasets for the benchmarks.
+
+Every dataset is generated from a seed, so the same arguments always give
+the same rows, and results can be compared across versions.
+"""
+
+import numpy as np
+import pandas as pd
+from src.file_handling import dataframe_to_bytes
+
+# Rows generated for each size class
+SIZE_CLASSES = {
+    "small": 1_000,
+    "medium": 100_000,
+    "large": 1_000_000,
+}
+FILE_TYPES = ["csv", "json", "jsonl", "parquet"]
+
+
+def random_strings(rng, rows, length):
+    """
+    Generate lower-case ASCII strings of a fixed length.
+
+    Args:
+        rng (np.random.Generator): The random generator.
+        rows (int): The number of strings.
+        length (int): The length of each string.
+
+    Returns:
+        np.ndarray: An array of Python strings.
+    """
+    codes = rng.integers(ord("a"), ord("z") + 1, (rows, max(length, 1)))
+    return (
+        codes.astype(np.uint8).view(f"S{max(length, 1)}").ravel().astype(str)
+    )
+
+
+def _with_nulls(rng, values, null_rate):
+    """
+    Replace a random fraction of values with None.
+    """
+    values = values.astype(object)
+    values[rng.random(len(values)) < null_rate] = None
+    return values
+
+
+def generate_dataset(
+    rows,
+    columns=10,
+    pii_fraction=0.3,
+    null_rate=0.05,
+    string_length=12,
+    seed=0,
+):
+    """
+    Generate a synthetic table with PII and non-PII columns.
+
+    PII columns cycle through names, email addresses and phone numbers.
+    The other columns cycle through integers, floats, strings and dates.
+    Nulls are added to every column except the integer ones, so their
+    types stay the same in every format.
+
+    Args:
+        rows (int): The number of rows.
+        columns (int): The total number of columns.
+        pii_fraction (float): The fraction of the columns that hold PII.
+            At least one column is always PII.
+        null_rate (float): The fraction of values in each column that are null.
+        string_length (int): The length of generated names and strings.
+        seed (int): Seed for the random generator.
+
+    Returns:
+        tuple: The DataFrame and the list of PII column names.
+    """
+    rng = np.random.default_rng(seed)
+    pii_columns = min(max(round(columns * pii_fraction), 1), columns)
+
+    data = {}
+    pii_fields = []
+    for i in range(columns):
+        if i < pii_columns:
+            kind = ("name", "email", "phone")[i % 3]
+            if kind == "name":
+                values = random_strings(rng, rows, string_length)
+            elif kind == "email":
+                values = np.char.add(
+                    random_strings(rng, rows, string_length), "@example.com"
+                )
+            else:
+                values = np.char.add(
+                    "07", rng.integers(10**8, 10**9, rows).astype(str)
+                )
+            name = f"{kind}_{i}"
+            data[name] = _with_nulls(rng, values, null_rate)
+            pii_fields.append(name)
+            continue
+
+        kind = ("id", "amount", "text", "date")[i % 4]
+        if kind == "id":
+            values = rng.integers(0, 10**9, rows)
+        elif kind == "amount":
+            values = rng.random(rows) * 1000
+            values[rng.random(rows) < null_rate] = np.nan
+        elif kind == "text":
+            values = _with_nulls(
+                rng, random_strings(rng, rows, string_length), null_rate
+            )
+        else:
+            values = _with_nulls(
+                rng,
+                (
+                    np.datetime64("2020-01-01")
+                    + rng.integers(0, 2000, rows).astype("timedelta64[D]")
+                ).astype(str),
+                null_rate,
+            )
+        data[f"{kind}_{i}"] = values
+
+    return pd.DataFrame(data), pii_fields
+
+
+def dataset_bytes(df, file_type):
+    """
+    Serialise a generated dataset in one of the supported file formats.
+
+    Args:
+        df (pd.DataFrame): The dataset.
+        file_type (str): 'csv', 'json', 'jsonl' or 'parquet'.
+
+    Returns:
+        bytes: The file content.
+    """
+    if file_type == "jsonl":
+        return df.to_json(orient="records", lines=True).encode("utf-8")
+    return dataframe_to_bytes(df, file_type)
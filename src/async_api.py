@@ -0,0 +1,377 @@
+import asyncio
+import functools
+import logging
+import weakref
+from concurrent.futures import ThreadPoolExecutor, wait
+from botocore.exceptions import ClientError
+from src.file_handling import (
+    DEFAULT_DOWNLOAD_CONCURRENCY,
+    DEFAULT_DOWNLOAD_PART_SIZE,
+    DEFAULT_PART_SIZE,
+    DEFAULT_UPLOAD_CONCURRENCY,
+    _get_s3_range,
+    get_s3_client,
+    split_s3_path,
+)
+from src.local_files import is_local_path
+from src.main import (
+    _download_settings,
+    _resolve_pii_fields,
+    _uses_partitions,
+    obfuscate_file_content,
+)
+from src.partitioning import obfuscate_partitioned
+from src.stdlib_engine import DEFAULT_FAST_PATH_MAX_BYTES
+from src.utils import get_file_type, read_json_input, read_optional_input
+
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_MAX_CONCURRENT_REQUESTS = 16
+
+_max_concurrent_requests = DEFAULT_MAX_CONCURRENT_REQUESTS
+# asyncio semaphores belong to one event loop, so each loop gets its own
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def configure_async_concurrency(max_concurrent_requests):
+    """
+    Set the most obfuscate calls that run at once in each event loop.
+    Calls over the limit wait for a running one to finish.
+
+    Args:
+        max_concurrent_requests (int): The most concurrent calls.
+
+    Raises:
+        ValueError: If the limit is not a positive integer.
+    """
+    global _max_concurrent_requests
+
+    if not isinstance(max_concurrent_requests, int) or (
+        max_concurrent_requests < 1
+    ):
+        logging.error(
+            f"Invalid concurrent request limit: {max_concurrent_requests}"
+        )
+        raise ValueError(
+            "Invalid concurrency limit: it must be a positive integer."
+        )
+    _max_concurrent_requests = max_concurrent_requests
+    _semaphores.clear()
+
+
+def _request_semaphore():
+    """
+    Return the semaphore limiting concurrent calls in the running loop.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(
+            _max_concurrent_requests
+        )
+    return semaphore
+
+
+async def download_s3_file_bytes_async(
+    file_to_obfuscate,
+    part_size=DEFAULT_DOWNLOAD_PART_SIZE,
+    max_concurrency=DEFAULT_DOWNLOAD_CONCURRENCY,
+):
+    """
+    Download a file from S3 without blocking the event loop, fetching
+    objects larger than part_size with concurrent ranged GETs.
+
+    Args:
+        file_to_obfuscate (str): The S3 URI of the file to download.
+        part_size (int): The size in bytes of each ranged GET.
+        max_concurrency (int): The most ranged GETs in flight at once.
+
+    Returns:
+        bytes: The content of the S3 object.
+
+    Raises:
+        ClientError: If there is an error fetching the file from S3.
+    """
+    bucket_name, key = split_s3_path(file_to_obfuscate)
+    logging.info(f"Downloading file {key} from bucket {bucket_name}.")
+
+    def fetch(byte_range, etag=None):
+        response = _get_s3_range(bucket_name, key, byte_range, etag)
+        return response, response["Body"].read()
+
+    try:
+        response, first_part = await asyncio.to_thread(
+            fetch, f"0-{part_size - 1}"
+        )
+    except ClientError as e:
+        # An empty object has no byte ranges to request
+        if e.response["Error"]["Code"] == "InvalidRange":
+            return b""
+        logging.error(f"Failed to download from S3: {e}")
+        raise
+
+    size = int(response["ContentRange"].rsplit("/", 1)[1])
+    limit = asyncio.Semaphore(max_concurrency)
+
+    async def fetch_part(start):
+        end = min(start + part_size, size) - 1
+        async with limit:
+            _, part = await asyncio.to_thread(
+                fetch, f"{start}-{end}", response["ETag"]
+            )
+        return part
+
+    try:
+        parts = await asyncio.gather(
+            *map(fetch_part, range(part_size, size, part_size))
+        )
+    except ClientError as e:
+        logging.error(f"Failed to download from S3: {e}")
+        raise
+    return b"".join([first_part, *parts])
+
+
+async def upload_bytes_to_s3_async(
+    content,
+    destination,
+    part_size=DEFAULT_PART_SIZE,
+    max_concurrency=DEFAULT_UPLOAD_CONCURRENCY,
+):
+    """
+    Upload content to S3 without blocking the event loop, using a multipart
+    upload with parts sent in parallel when it is larger than one part.
+
+    If the upload fails or the calling task is cancelled, the parts still
+    being sent are allowed to finish and the multipart upload is aborted,
+    so no incomplete upload is left behind.
+
+    Args:
+        content (bytes): The content to upload.
+        destination (str): The S3 URI to upload to.
+        part_size (int): The size in bytes of each uploaded part.
+        max_concurrency (int): The most parts uploaded at once.
+
+    Returns:
+        str: The S3 URI the content was uploaded to.
+
+    Raises:
+        ClientError: If there is an error uploading to S3.
+        asyncio.CancelledError: If the calling task is cancelled.
+    """
+    s3 = get_s3_client()
+    bucket_name, key = split_s3_path(destination)
+
+    if len(content) <= part_size:
+        logging.info(f"Uploading file {key} to bucket {bucket_name}.")
+        try:
+            await asyncio.to_thread(
+                s3.put_object, Bucket=bucket_name, Key=key, Body=content
+            )
+        except ClientError as e:
+            logging.error(f"Failed to upload to S3: {e}")
+            raise
+        return destination
+
+    logging.info(f"Starting multipart upload of {key} to bucket {bucket_name}.")
+    created = asyncio.ensure_future(
+        asyncio.to_thread(
+            s3.create_multipart_upload, Bucket=bucket_name, Key=key
+        )
+    )
+
+    def upload_part(upload_id, part_number, start):
+        response = s3.upload_part(
+            Bucket=bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=content[start : start + part_size],
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    # The parts run on their own pool, so a cancelled upload can wait for
+    # the parts already being sent before it is aborted
+    pool = ThreadPoolExecutor(max_workers=max_concurrency)
+    futures = []
+    try:
+        # Shielded, so an upload created as the task is cancelled is aborted
+        upload_id = (await asyncio.shield(created))["UploadId"]
+        futures = [
+            pool.submit(upload_part, upload_id, part_number, start)
+            for part_number, start in enumerate(
+                range(0, len(content), part_size), 1
+            )
+        ]
+        parts = await asyncio.gather(
+            *(asyncio.wrap_future(future) for future in futures)
+        )
+        await asyncio.to_thread(
+            s3.complete_multipart_upload,
+            Bucket=bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+        logging.info(
+            f"Completed multipart upload of {key} in {len(parts)} parts."
+        )
+        return destination
+    except BaseException as e:
+        logging.error(f"Multipart upload failed, aborting: {e!r}")
+        pool.shutdown(wait=False, cancel_futures=True)
+        # Shielded, so cancelling the task again does not skip the abort
+        await asyncio.shield(_abort_multipart_upload(s3, created, futures))
+        raise
+    finally:
+        pool.shutdown(wait=False)
+
+
+async def _abort_multipart_upload(s3, created, futures):
+    """
+    Abort a multipart upload once it has been created and the parts still
+    being sent have finished.
+    """
+    try:
+        response = await created
+    except Exception:
+        # The upload was never created, so there is nothing to abort
+        return
+
+    def abort():
+        # Parts cancelled before they started are never marked done
+        wait([future for future in futures if not future.cancelled()])
+        s3.abort_multipart_upload(
+            Bucket=response["Bucket"],
+            Key=response["Key"],
+            UploadId=response["UploadId"],
+        )
+
+    try:
+        await asyncio.to_thread(abort)
+    except ClientError as e:
+        # The original error is more useful than a failed abort
+        logging.error(f"Failed to abort the multipart upload: {e}")
+
+
+def _obfuscate_content(file_content, file_type, pii_fields, options):
+    """
+    Mask downloaded file content as main does, for running in an executor.
+    """
+    if _uses_partitions(file_type, options):
+        return b"".join(
+            obfuscate_partitioned(
+                file_content,
+                file_type,
+                pii_fields,
+                options["masking"],
+                options["compression_level"],
+                options["workers"],
+                csv_engine=options["csv_engine"] or "pandas",
+            )
+        )
+
+    fast_path_max_bytes = options["fast_path_max_bytes"]
+    return obfuscate_file_content(
+        file_content,
+        file_type,
+        pii_fields,
+        fast_path_max_bytes=(
+            DEFAULT_FAST_PATH_MAX_BYTES
+            if fast_path_max_bytes is None
+            else fast_path_max_bytes
+        ),
+        masking=options["masking"],
+        compression_level=options["compression_level"],
+        csv_engine=options["csv_engine"] or "pandas",
+    )
+
+
+async def obfuscate(input_json, executor=None):
+    """
+    Asynchronous variant of main for use inside an asyncio event loop, such
+    as a web service.
+
+    S3 reads and writes are awaited without blocking the loop, so many calls
+    overlap on network I/O, and only the CPU-bound masking is sent to an
+    executor. At most the number of calls set by configure_async_concurrency
+    run at once; the rest wait their turn. Cancelling the calling task
+    aborts any multipart upload to the destination.
+
+    boto3 has no asynchronous client, so each S3 request runs on a thread
+    of the loop's default executor while the loop carries on.
+
+    Args:
+        input_json (str): A JSON string with the same keys as main accepts.
+        executor (concurrent.futures.Executor): Where to run the masking,
+            e.g. a ProcessPoolExecutor. Defaults to the loop's default executor.
+
+    Returns:
+        bytes | str: The obfuscated file content in its original format, or
+                     the destination S3 URI when a destination is provided.
+
+    Raises:
+        Exception: If any error occurs during the process.
+    """
+    try:
+        file_path, pii_fields = read_json_input(input_json)
+        options = read_optional_input(input_json)
+        file_type = options["file_type"] or get_file_type(file_path)
+        if is_local_path(file_path) or is_local_path(
+            options["destination"] or ""
+        ):
+            logging.error("Local path passed to the async API.")
+            raise ValueError(
+                "The async API only reads and writes S3 objects; use main for local files."
+            )
+        download_settings = _download_settings(options)
+
+        async with _request_semaphore():
+            logging.info(f"Starting the obfuscation of {file_path}.")
+            # Sampling the file for PII columns reads it with blocking calls
+            pii_fields = await asyncio.to_thread(
+                _resolve_pii_fields, file_path, file_type, pii_fields, options
+            )
+            file_content = await download_s3_file_bytes_async(
+                file_path,
+                download_settings["download_part_size"],
+                download_settings["download_concurrency"],
+            )
+
+            logging.info(
+                f"Obfuscating PII fields: {pii_fields} for file type: {file_type}."
+            )
+            result_bytes = await asyncio.get_running_loop().run_in_executor(
+                executor,
+                functools.partial(
+                    _obfuscate_content,
+                    file_content,
+                    file_type,
+                    pii_fields,
+                    options,
+                ),
+            )
+            del file_content
+
+            if not options["destination"]:
+                logging.info("Obfuscation process completed successfully.")
+                return result_bytes
+
+            destination = await upload_bytes_to_s3_async(
+                result_bytes,
+                options["destination"],
+                part_size=int(
+                    (options["part_size_mb"] or 0) * 1024 * 1024
+                    or DEFAULT_PART_SIZE
+                ),
+                max_concurrency=options["upload_concurrency"]
+                or DEFAULT_UPLOAD_CONCURRENCY,
+            )
+            logging.info("Obfuscation process completed successfully.")
+            return destination
+
+    except Exception as e:
+        logging.error(
+            f"An error occurred during the obfuscation process: {e}",
+            exc_info=True,
+        )
+        raise
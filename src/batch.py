@@ -0,0 +1,293 @@
+import logging
+import multiprocessing
+from functools import partial
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from src.file_handling import download_s3_file_bytes, list_s3_files
+from src.main import obfuscate_file_content
+from src.manifest import Manifest, config_hash, head_s3_etag
+from src.utils import check_file_type, get_file_type
+
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_IO_WORKERS = 8
+
+
+def _obfuscate_one(
+    file_to_obfuscate,
+    pii_fields,
+    masking,
+    compression_level,
+    cpu_pool,
+    etag=None,
+):
+    """
+    Download, obfuscate and return a single file, sending the masking to the
+    process pool when one is configured.
+    """
+    file_type = get_file_type(file_to_obfuscate)
+    check_file_type(file_type)
+
+    file_content = download_s3_file_bytes(file_to_obfuscate, etag=etag)
+    if cpu_pool is None:
+        return obfuscate_file_content(
+            file_content,
+            file_type,
+            pii_fields,
+            masking=masking,
+            compression_level=compression_level,
+        )
+    return cpu_pool.submit(
+        obfuscate_file_content,
+        file_content,
+        file_type,
+        pii_fields,
+        masking=masking,
+        compression_level=compression_level,
+    ).result()
+
+
+def _obfuscate_if_changed(
+    file_to_obfuscate,
+    pii_fields,
+    masking,
+    compression_level,
+    cpu_pool,
+    manifest,
+    fingerprint,
+    destination,
+):
+    """
+    Obfuscate a single file unless the manifest shows its output is current
+    at the destination, deciding with a HeadObject request rather than a
+    download.
+
+    Returns the obfuscated bytes, or None if the file was skipped, with the
+    ETag the file was checked at.
+    """
+    check_file_type(get_file_type(file_to_obfuscate))
+
+    etag = head_s3_etag(file_to_obfuscate)
+    if manifest.is_current(file_to_obfuscate, etag, fingerprint, destination):
+        return None, etag
+    # The download fails if the object changes after the HeadObject
+    return (
+        _obfuscate_one(
+            file_to_obfuscate,
+            pii_fields,
+            masking,
+            compression_level,
+            cpu_pool,
+            etag,
+        ),
+        etag,
+    )
+
+
+def _record_output(manifest_path, *output):
+    """
+    Record an output in a manifest file the batch opened from its path, and
+    may already have closed.
+    """
+    with Manifest(manifest_path) as manifest:
+        manifest.record(*output)
+
+
+def obfuscate_batch(
+    files_to_obfuscate,
+    pii_fields,
+    io_workers=DEFAULT_IO_WORKERS,
+    cpu_workers=0,
+    max_in_flight=None,
+    masking=None,
+    compression_level=None,
+    manifest=None,
+    destination_for=None,
+):
+    """
+    Obfuscate many S3 files concurrently, yielding a result for each one.
+
+    Downloads run on a bounded thread pool. When cpu_workers is set, the
+    CPU-heavy masking is sent to a process pool; otherwise it runs on the
+    I/O threads. At most max_in_flight files are downloaded or held in
+    memory at once, and new files are only started as results are consumed,
+    so memory stays bounded however many files the batch covers. Hash
+    tokens are memoized in a cache shared by every file in the batch.
+
+    A failure on one file is reported in its result and does not stop the
+    rest of the batch.
+
+    With a manifest, each file is checked with a HeadObject request first
+    and skipped without being downloaded if the manifest shows it was
+    already obfuscated at its current ETag with the same PII fields,
+    masking strategies and compression level, and written to the
+    destination destination_for gives for it. The batch does not write the
+    output itself, so a file is only recorded in the manifest when the
+    caller calls the result's 'record' function after writing it. A batch
+    that is stopped part way, or whose writes fail, can then be re-run to
+    finish only the remaining files. Changing the hash key is not
+    detected, so it needs a new manifest.
+
+    Args:
+        files_to_obfuscate (str | Iterable[str]): A list of S3 URIs, or an
+            S3 prefix such as 's3://bucket/exports/' to obfuscate every object under.
+        pii_fields (list): A list of fields to obfuscate in every file.
+        io_workers (int): The number of threads downloading files.
+        cpu_workers (int): The number of processes masking files, or 0 to mask on the I/O threads.
+        max_in_flight (int): The most files being processed at once. Defaults to twice io_workers.
+        masking (dict): Optional masking strategy for each field, if not the default 'mask'.
+        compression_level (int): The level to compress compressed files back at, or None for the codec's default.
+        manifest (str | Manifest): Optionally, a Manifest or the path of its SQLite file, to skip unchanged files.
+        destination_for (Callable[[str], str]): Maps each S3 URI to where the caller writes its output. Required with a manifest.
+
+    Yields:
+        dict: The result for each file, in completion order, with the keys
+            'file_to_obfuscate', 'result' (the obfuscated bytes, or None on failure or skip),
+            'error' (the error message, or None on success), 'skipped'
+            (True if the manifest showed the file's output was current),
+            'destination' (from destination_for, or None without one) and
+            'record' (a function to call once the output has been written
+            to the destination, or None without a manifest or a result).
+
+    Raises:
+        ValueError: If pii_fields is empty, the worker limits are invalid or
+                    a manifest is given without destination_for.
+    """
+    if not pii_fields:
+        logging.error("'pii_fields' not provided.")
+        raise ValueError("Invalid input: 'pii_fields' are required.")
+
+    if manifest is not None and destination_for is None:
+        logging.error("A manifest was given without 'destination_for'.")
+        raise ValueError(
+            "Invalid input: 'destination_for' is required with a manifest."
+        )
+
+    max_in_flight = max_in_flight or io_workers * 2
+    if io_workers < 1 or cpu_workers < 0 or max_in_flight < 1:
+        logging.error("Invalid batch concurrency limits.")
+        raise ValueError(
+            "Invalid concurrency limits: io_workers and max_in_flight must be at least 1."
+        )
+
+    if isinstance(files_to_obfuscate, str):
+        files_to_obfuscate = list_s3_files(files_to_obfuscate)
+    files_to_obfuscate = iter(files_to_obfuscate)
+
+    owns_manifest = manifest is not None and not isinstance(
+        manifest, Manifest
+    )
+    if owns_manifest:
+        manifest = Manifest(manifest)
+    fingerprint = (
+        config_hash(pii_fields, masking, compression_level=compression_level)
+        if manifest is not None
+        else None
+    )
+    # Outputs are recorded by the caller, possibly after the batch has
+    # finished and closed a manifest it opened
+    record_output = (
+        partial(_record_output, manifest.path)
+        if owns_manifest
+        else getattr(manifest, "record", None)
+    )
+
+    cpu_pool = (
+        ProcessPoolExecutor(
+            max_workers=cpu_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        if cpu_workers
+        else None
+    )
+    try:
+        with ThreadPoolExecutor(max_workers=io_workers) as io_pool:
+            in_flight = {}
+            while True:
+                # Only start new files while below the in-flight limit
+                for file_to_obfuscate in files_to_obfuscate:
+                    destination = (
+                        destination_for(file_to_obfuscate)
+                        if destination_for is not None
+                        else None
+                    )
+                    if manifest is None:
+                        future = io_pool.submit(
+                            _obfuscate_one,
+                            file_to_obfuscate,
+                            pii_fields,
+                            masking,
+                            compression_level,
+                            cpu_pool,
+                        )
+                    else:
+                        future = io_pool.submit(
+                            _obfuscate_if_changed,
+                            file_to_obfuscate,
+                            pii_fields,
+                            masking,
+                            compression_level,
+                            cpu_pool,
+                            manifest,
+                            fingerprint,
+                            destination,
+                        )
+                    in_flight[future] = file_to_obfuscate, destination
+                    if len(in_flight) >= max_in_flight:
+                        break
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_to_obfuscate, destination = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logging.error(
+                            f"Failed to obfuscate {file_to_obfuscate}: {e}"
+                        )
+                        yield {
+                            "file_to_obfuscate": file_to_obfuscate,
+                            "result": None,
+                            "error": str(e),
+                            "skipped": False,
+                            "destination": destination,
+                            "record": None,
+                        }
+                        continue
+
+                    record = None
+                    if manifest is not None:
+                        result, etag = result
+                        if result is not None:
+                            record = partial(
+                                record_output,
+                                file_to_obfuscate,
+                                etag,
+                                fingerprint,
+                                destination,
+                            )
+                    yield {
+                        "file_to_obfuscate": file_to_obfuscate,
+                        "result": result,
+                        "error": None,
+                        "skipped": result is None,
+                        "destination": destination,
+                        "record": record,
+                    }
+    finally:
+        if cpu_pool is not None:
+            cpu_pool.shutdown(cancel_futures=True)
+        if owns_manifest:
+            manifest.close()
+        if masking and not cpu_workers:
+            # Worker processes each have their own cache
+            from src.masking import token_cache_stats
+
+            logging.info(f"Token cache statistics: {token_cache_stats()}")
@@ -0,0 +1,645 @@
+"""
+gdpr-obfuscate: obfuscate PII fields in S3 objects and local files from the
+command line.
+
+Run from the repository root with, for example:
+
+    python -m src.cli s3://raw/exports/ s3://clean/exports/ \\
+        --pii-fields name email_address --workers 4 --max-memory 2G
+
+The input and output can be S3 URIs, 'file://' URIs or plain local paths,
+or '-' for standard input and output. An input S3 prefix ending in '/', or
+a local directory, is processed as a whole: every supported file under it
+is obfuscated in parallel and written under the output prefix with the
+same relative path.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from src.compression import COMPRESSION_EXTENSIONS
+from src.local_files import (
+    FILE_SCHEME,
+    STDIO_PATH,
+    is_local_path,
+    local_file_path,
+)
+from src.utils import (
+    CSV_ENGINES,
+    NDJSON_FILE_TYPES,
+    SUPPORTED_FILE_TYPES,
+    get_file_type,
+)
+
+DEFAULT_MAX_MEMORY = 2 * 1024**3
+# A file that is masked whole, such as a JSON document, takes several times
+# its size in memory once it is loaded into a DataFrame
+WHOLE_FILE_MEMORY_FACTOR = 5
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+MIN_UPLOAD_PART_SIZE = 5 * 1024 * 1024
+
+
+def parse_size(size):
+    """
+    Parse a memory size such as '512M', '2G' or '1048576' into bytes.
+
+    Args:
+        size (str): A number of bytes, optionally followed by K, M, G or T.
+
+    Returns:
+        int: The size in bytes.
+
+    Raises:
+        argparse.ArgumentTypeError: If the size is not valid.
+    """
+    text = size.strip().upper().removesuffix("B").removesuffix("I")
+    unit = text[-1:] if text[-1:] in SIZE_UNITS else ""
+    try:
+        value = float(text[: len(text) - len(unit)])
+    except ValueError:
+        value = -1
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"Invalid memory size: {size}")
+    return int(value * SIZE_UNITS[unit])
+
+
+def _to_uri(path):
+    """
+    Turn a plain local path into a 'file://' URI, leaving URIs and '-' as
+    they are.
+    """
+    if path == STDIO_PATH or path.startswith(("s3://", FILE_SCHEME)):
+        return path
+    return FILE_SCHEME + os.path.abspath(path)
+
+
+def _is_collection(uri):
+    """
+    Check whether a URI names an S3 prefix or a local directory.
+    """
+    if uri.startswith("s3://"):
+        return uri.endswith("/")
+    return uri != STDIO_PATH and os.path.isdir(local_file_path(uri))
+
+
+def list_jobs(source, destination, file_type=None):
+    """
+    Work out the files to obfuscate and where each one is written.
+
+    Args:
+        source (str): An S3 URI or prefix, a 'file://' URI of a file or
+            directory, or '-' for standard input.
+        destination (str): Where the output goes: a file, an S3 prefix or
+            directory for a collection, or '-' for standard output.
+        file_type (str): The type of every file, overriding their extensions.
+
+    Returns:
+        list: The jobs, as dicts with the keys 'source', 'destination',
+              'size' (in bytes, or None if unknown) and 'skip_reason'
+              (why an unsupported file is skipped, or None).
+
+    Raises:
+        ValueError: If a collection is written to a single file or to
+                    standard output.
+    """
+    if not _is_collection(source):
+        if destination.endswith("/") or (
+            is_local_path(destination) and _is_collection(destination)
+        ):
+            name = source.rstrip("/").rsplit("/", 1)[-1]
+            destination = f"{destination.rstrip('/')}/{name}"
+        return [
+            {
+                "source": source,
+                "destination": destination,
+                "size": _file_size(source),
+                "skip_reason": None,
+            }
+        ]
+
+    if destination == STDIO_PATH:
+        logging.error("A collection cannot be written to standard output.")
+        raise ValueError(
+            "Invalid output: an S3 prefix or directory needs an output prefix or directory."
+        )
+
+    if source.startswith("s3://"):
+        from src.file_handling import list_s3_objects
+
+        files = list_s3_objects(source)
+    else:
+        root = local_file_path(source)
+        files = (
+            (
+                FILE_SCHEME + os.path.join(directory, name),
+                os.path.getsize(os.path.join(directory, name)),
+            )
+            for directory, _, names in sorted(os.walk(root))
+            for name in sorted(names)
+        )
+
+    jobs = []
+    prefix = source.rstrip("/") + "/"
+    for file_uri, size in files:
+        relative_path = file_uri[len(prefix) :]
+        skip_reason = None
+        if file_type is None and (
+            get_file_type(file_uri) not in SUPPORTED_FILE_TYPES
+        ):
+            skip_reason = "unsupported file type"
+        jobs.append(
+            {
+                "source": file_uri,
+                "destination": f"{destination.rstrip('/')}/{relative_path}",
+                "size": size,
+                "skip_reason": skip_reason,
+            }
+        )
+    return jobs
+
+
+def _file_size(uri):
+    """
+    Return the size of a single S3 object or local file, or None if it
+    cannot be known in advance.
+    """
+    if uri == STDIO_PATH:
+        return None
+    if is_local_path(uri):
+        return os.path.getsize(local_file_path(uri))
+
+    from src.file_handling import get_s3_client, split_s3_path
+
+    bucket_name, key = split_s3_path(uri)
+    return get_s3_client().head_object(Bucket=bucket_name, Key=key)[
+        "ContentLength"
+    ]
+
+
+def memory_settings(max_memory, workers):
+    """
+    Share a memory budget between parallel files, picking the ranged
+    download and multipart upload settings that keep a streamed file
+    within its share.
+
+    About half of each share holds the downloaded parts, which are also
+    re-split and masked in memory, and half the parts being uploaded.
+
+    Args:
+        max_memory (int): The memory in bytes for all the files at once.
+        workers (int): The number of files processed in parallel.
+
+    Returns:
+        tuple: The share of each file in bytes, and the main() input keys
+               that keep a streamed file within it.
+    """
+    mb = 1024 * 1024
+    budget = max(max_memory // workers, 1)
+    download_part_size = min(max(budget // 16, mb), 8 * mb)
+    upload_part_size = min(max(budget // 10, MIN_UPLOAD_PART_SIZE), 8 * mb)
+    return budget, {
+        "download_part_size_mb": download_part_size / mb,
+        "download_concurrency": min(
+            max(budget // 2 // (download_part_size * 3), 1), 8
+        ),
+        "part_size_mb": upload_part_size / mb,
+        "upload_concurrency": min(
+            max(budget // 2 // upload_part_size - 1, 1), 4
+        ),
+    }
+
+
+def estimate_memory(job, file_type, budget):
+    """
+    Estimate the memory a job needs, for admitting no more jobs at once
+    than the memory budget allows.
+
+    CSV, JSON Lines and uncompressed Parquet files are streamed within the
+    budget of one file. JSON files, and other compressed files that are not
+    streamed, are masked whole, so they need a multiple of their size.
+
+    Args:
+        job (dict): The job, from list_jobs.
+        file_type (str): The type of the file.
+        budget (int): The memory share of one file, from memory_settings.
+
+    Returns:
+        int: The estimated memory in bytes.
+    """
+    compressed = (
+        job["source"].lower().rsplit(".", 1)[-1] in COMPRESSION_EXTENSIONS
+    )
+    streamed = (
+        file_type == "csv"
+        or file_type in NDJSON_FILE_TYPES
+        or (file_type == "parquet" and not compressed)
+    )
+    if streamed or job["size"] is None:
+        return budget
+    return max(budget, job["size"] * WHOLE_FILE_MEMORY_FACTOR)
+
+
+def _init_worker(log_level):
+    """
+    Set the log level in a worker process, as importing the obfuscator
+    configures logging at INFO.
+    """
+    logging.getLogger().setLevel(log_level)
+
+
+def run_job(input_json):
+    """
+    Obfuscate one file with main, timing it and catching its errors, for
+    running on a worker process.
+
+    Args:
+        input_json (str): The input JSON for main, with a destination.
+
+    Returns:
+        dict: The 'seconds' the file took, the 'bytes_out' written and the
+              'error' message, or None on success.
+    """
+    from src.main import main_with_metrics
+
+    start = time.perf_counter()
+    try:
+        _, metrics = main_with_metrics(input_json)
+    except Exception as e:
+        return {
+            "seconds": time.perf_counter() - start,
+            "bytes_out": None,
+            "error": str(e) or type(e).__name__,
+        }
+    return {
+        "seconds": time.perf_counter() - start,
+        "bytes_out": sum(
+            stage_metrics["bytes_out"] or 0
+            for stage_metrics in metrics
+            if stage_metrics["stage"] == "obfuscate_and_upload"
+        ),
+        "error": None,
+    }
+
+
+def obfuscate_jobs(
+    jobs,
+    settings,
+    workers=1,
+    max_memory=DEFAULT_MAX_MEMORY,
+    progress=None,
+):
+    """
+    Obfuscate every job, running up to workers files at once on worker
+    processes.
+
+    A job only starts while the memory its file is estimated to need (see
+    estimate_memory) fits in what the running jobs leave of max_memory, so
+    a large JSON file may run alone. A job that needs more than the whole
+    budget still runs once nothing else is. A single file is split between
+    the workers instead (see the 'workers' key of main).
+
+    Args:
+        jobs (list): The jobs, from list_jobs.
+        settings (dict): The main() input keys shared by every job, such as
+            'pii_fields' and 'masking'.
+        workers (int): The most files processed at once.
+        max_memory (int): The memory in bytes for all the files at once.
+        progress (Callable[[dict, int, int], None]): Called with each
+            finished job's summary, the number of jobs finished and the
+            number of jobs.
+
+    Returns:
+        list: The summary of each job, in the order they finished, with the
+              keys of the job and 'status', 'seconds', 'bytes_out' and 'error'.
+    """
+    runnable = [job for job in jobs if job["skip_reason"] is None]
+    summaries = [
+        {
+            **job,
+            "status": "skipped",
+            "seconds": 0.0,
+            "bytes_out": None,
+            "error": job["skip_reason"],
+        }
+        for job in jobs
+        if job["skip_reason"] is not None
+    ]
+    if progress is not None:
+        for finished, summary in enumerate(summaries, 1):
+            progress(summary, finished, len(jobs))
+    parallel = min(workers, len(runnable)) or 1
+    budget, stream_settings = memory_settings(max_memory, parallel)
+    if len(runnable) == 1 and workers > 1:
+        stream_settings["workers"] = workers
+
+    pending = deque(runnable)
+    in_flight = {}
+    reserved = 0
+    log_level = logging.getLogger().level
+    pool = (
+        ProcessPoolExecutor(
+            max_workers=parallel,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(log_level,),
+        )
+        if parallel > 1
+        else ThreadPoolExecutor(max_workers=1)
+    )
+    with pool:
+        while pending or in_flight:
+            # Start jobs while their memory fits, or when nothing is running
+            while pending and len(in_flight) < parallel:
+                job = pending[0]
+                file_type = settings.get("file_type") or get_file_type(
+                    job["source"]
+                )
+                memory = estimate_memory(job, file_type, budget)
+                if in_flight and reserved + memory > max_memory:
+                    break
+                pending.popleft()
+                input_json = json.dumps(
+                    {
+                        **settings,
+                        **stream_settings,
+                        "file_to_obfuscate": job["source"],
+                        "destination": job["destination"],
+                    }
+                )
+                in_flight[pool.submit(run_job, input_json)] = (job, memory)
+                reserved += memory
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, memory = in_flight.pop(future)
+                reserved -= memory
+                result = future.result()
+                summaries.append(
+                    {
+                        **job,
+                        **result,
+                        "status": "failed" if result["error"] else "ok",
+                    }
+                )
+                if progress is not None:
+                    progress(summaries[-1], len(summaries), len(jobs))
+    return summaries
+
+
+def _mb(size):
+    return (size or 0) / 1e6
+
+
+def _progress_printer(stream):
+    """
+    Build a progress callback that prints a line for each finished file
+    with the overall throughput so far.
+    """
+    start = time.perf_counter()
+    totals = {"bytes": 0}
+
+    def progress(summary, finished, total):
+        totals["bytes"] += summary["size"] or 0
+        elapsed = time.perf_counter() - start
+        print(
+            f"[{finished}/{total}] {summary['status']:7} {summary['source']} "
+            f"({summary['seconds']:.2f}s) | {_mb(totals['bytes']):.1f} MB "
+            f"at {_mb(totals['bytes']) / max(elapsed, 1e-9):.1f} MB/s",
+            file=stream,
+            flush=True,
+        )
+
+    return progress
+
+
+def format_summary(summaries, seconds):
+    """
+    Format a per-file table of the results, with a line of totals.
+
+    Args:
+        summaries (list): The summaries, from obfuscate_jobs.
+        seconds (float): The wall time of the whole run.
+
+    Returns:
+        str: The table.
+    """
+    rows = [("STATUS", "SECONDS", "IN MB", "OUT MB", "MB/S", "FILE")]
+    for summary in sorted(summaries, key=lambda summary: summary["source"]):
+        rows.append(
+            (
+                summary["status"],
+                f"{summary['seconds']:.2f}",
+                f"{_mb(summary['size']):.1f}",
+                f"{_mb(summary['bytes_out']):.1f}",
+                f"{_mb(summary['size']) / summary['seconds']:.1f}"
+                if summary["seconds"] and summary["size"]
+                else "-",
+                summary["source"]
+                + (f": {summary['error']}" if summary["error"] else ""),
+            )
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(5)]
+    lines = [
+        "  ".join(value.ljust(width) for value, width in zip(row, widths))
+        + "  "
+        + row[5]
+        for row in rows
+    ]
+
+    statuses = [summary["status"] for summary in summaries]
+    total_mb = _mb(sum(summary["size"] or 0 for summary in summaries))
+    lines.append(
+        f"{statuses.count('ok')} obfuscated, {statuses.count('failed')} "
+        f"failed, {statuses.count('skipped')} skipped: {total_mb:.1f} MB in "
+        f"{seconds:.2f}s ({total_mb / max(seconds, 1e-9):.1f} MB/s)"
+    )
+    return "\n".join(lines)
+
+
+def propose_jobs(jobs, file_type=None):
+    """
+    Print the columns detected as PII in each file, one JSON object per
+    line of standard output, e.g. to review them before listing them with
+    --pii-fields.
+
+    Args:
+        jobs (list): The files, as returned by list_jobs.
+        file_type (str): The type of every file, overriding the extensions.
+
+    Returns:
+        int: The exit status: 0 if every file was sampled, 1 otherwise.
+    """
+    from src.main import propose_pii_fields
+
+    status = 0
+    for job in jobs:
+        if job["skip_reason"]:
+            continue
+        input_data = {"file_to_obfuscate": job["source"]}
+        if file_type:
+            input_data["file_type"] = file_type
+        try:
+            detected = propose_pii_fields(json.dumps(input_data))
+        except (ValueError, OSError) as e:
+            print(f"{job['source']}: {e}", file=sys.stderr)
+            status = 1
+            continue
+        print(json.dumps({"file": job["source"], "pii_fields": detected}))
+    return status
+
+
+def build_parser():
+    """
+    Build the argument parser of the command-line tool.
+    """
+    parser = argparse.ArgumentParser(
+        prog="gdpr-obfuscate",
+        description=__doc__.split("\n\n")[0].strip(),
+    )
+    parser.add_argument(
+        "input",
+        help="An S3 URI or prefix, a local file or directory, or '-' for standard input",
+    )
+    parser.add_argument(
+        "output",
+        nargs="?",
+        default=STDIO_PATH,
+        help="Where to write the output, mirroring the input's layout for a prefix or directory. Defaults to standard output",
+    )
+    parser.add_argument(
+        "-f",
+        "--pii-fields",
+        nargs="+",
+        help="The fields to obfuscate",
+    )
+    parser.add_argument(
+        "--detect-pii",
+        action="store_true",
+        help="Also obfuscate the columns detected as PII in a sample of each file's rows",
+    )
+    parser.add_argument(
+        "--propose-pii",
+        action="store_true",
+        help="Only print the columns detected as PII in each file, as JSON lines, without obfuscating it",
+    )
+    parser.add_argument(
+        "--masking",
+        type=json.loads,
+        help='A JSON object of masking strategies, e.g. \'{"email_address": "email"}\'',
+    )
+    parser.add_argument(
+        "--file-type",
+        choices=SUPPORTED_FILE_TYPES,
+        help="The type of every input file, overriding the extensions; required for standard input",
+    )
+    parser.add_argument("--csv-engine", choices=CSV_ENGINES)
+    parser.add_argument("--compression-level", type=int)
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="The most files processed at once, or the processes a single file is split between (default: the number of CPUs)",
+    )
+    parser.add_argument(
+        "-m",
+        "--max-memory",
+        type=parse_size,
+        default=DEFAULT_MAX_MEMORY,
+        help="The memory to use for all the files at once, e.g. 512M or 4G (default: 2G)",
+    )
+    parser.add_argument(
+        "--summary-json", help="Also write the per-file summary to this file"
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="Do not show progress"
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="Show the obfuscator's logs",
+    )
+    return parser
+
+
+def cli(argv=None):
+    """
+    Run the command-line tool.
+
+    Args:
+        argv (list): The arguments, defaulting to those the process was run with.
+
+    Returns:
+        int: The exit status: 0 if every file was obfuscated, 1 if any
+             failed and 2 if the arguments are invalid.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if not (args.pii_fields or args.detect_pii or args.propose_pii):
+        parser.error(
+            "--pii-fields is required without --detect-pii or --propose-pii"
+        )
+    logging.getLogger().setLevel(
+        logging.INFO if args.verbose else logging.WARNING
+    )
+
+    source, destination = _to_uri(args.input), _to_uri(args.output)
+    if source == STDIO_PATH and not args.file_type:
+        parser.error("--file-type is required when reading standard input")
+    try:
+        jobs = list_jobs(source, destination, args.file_type)
+    except (ValueError, OSError) as e:
+        parser.error(str(e))
+    if args.propose_pii:
+        return propose_jobs(jobs, args.file_type)
+
+    settings = {
+        "pii_fields": args.pii_fields,
+        "detect_pii": args.detect_pii or None,
+        "masking": args.masking,
+        "file_type": args.file_type,
+        "csv_engine": args.csv_engine,
+        "compression_level": args.compression_level,
+    }
+    settings = {
+        key: value for key, value in settings.items() if value is not None
+    }
+    # Progress and the summary go to standard error, as the output may not
+    progress_stream = sys.stderr
+    start = time.perf_counter()
+    summaries = obfuscate_jobs(
+        jobs,
+        settings,
+        workers=args.workers,
+        max_memory=args.max_memory,
+        progress=None if args.quiet else _progress_printer(progress_stream),
+    )
+    seconds = time.perf_counter() - start
+
+    print(format_summary(summaries, seconds), file=progress_stream)
+    if args.summary_json:
+        with open(args.summary_json, "w") as summary_file:
+            json.dump(
+                {"seconds": seconds, "files": summaries},
+                summary_file,
+                indent=2,
+            )
+    return int(any(summary["status"] == "failed" for summary in summaries))
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,195 @@
+import bz2
+import gzip
+import io
+import logging
+import zlib
+
+logging.basicConfig(level=logging.INFO)
+
+# File extensions of compressed objects and the codec each one uses
+COMPRESSION_EXTENSIONS = {"gz": "gzip", "zst": "zstd", "bz2": "bz2"}
+
+# The lowest, highest and default compression level of each codec
+COMPRESSION_LEVELS = {
+    "gzip": (0, 9, 6),
+    "zstd": (1, 22, 3),
+    "bz2": (1, 9, 9),
+}
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# 'BZh' and a block size from 1 to 9, then the magic of the first block,
+# or of the end of the stream for an empty file
+BZ2_MAGIC = b"BZh"
+BZ2_BLOCK_MAGICS = (
+    b"\x31\x41\x59\x26\x53\x59",
+    b"\x17\x72\x45\x38\x50\x90",
+)
+MAGIC_LENGTH = 10
+
+
+class _PrefixedStream(io.RawIOBase):
+    """
+    A readable raw stream that replays bytes already read from a stream
+    before reading the rest of it.
+    """
+
+    def __init__(self, prefix, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._prefix:
+            size = min(len(buffer), len(self._prefix))
+            buffer[:size] = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            return size
+        data = self._stream.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+def detect_compression(prefix):
+    """
+    Work out the compression codec of some content from its first bytes.
+
+    Args:
+        prefix (bytes): At least the first MAGIC_LENGTH bytes of the content.
+
+    Returns:
+        str | None: 'gzip', 'zstd' or 'bz2', or None if the content is not compressed.
+    """
+    if prefix.startswith(GZIP_MAGIC):
+        return "gzip"
+    if prefix.startswith(ZSTD_MAGIC):
+        return "zstd"
+    if (
+        prefix.startswith(BZ2_MAGIC)
+        and prefix[3:4].isdigit()
+        and prefix[3:4] != b"0"
+        and prefix[4:10] in BZ2_BLOCK_MAGICS
+    ):
+        return "bz2"
+    return None
+
+
+def _import_zstandard():
+    """
+    Import the zstandard package, which is only needed for zstd objects.
+    """
+    try:
+        import zstandard
+    except ImportError as e:
+        logging.error("The zstandard package is not installed.")
+        raise ValueError(
+            "Zstandard compressed files require the 'zstandard' package."
+        ) from e
+    return zstandard
+
+
+def open_decompressed_stream(stream):
+    """
+    Detect from its first bytes whether a binary stream is compressed with
+    gzip, zstd or bz2, and return a buffered stream of its decompressed
+    content. The content is decompressed as it is read.
+
+    Args:
+        stream (file-like): A binary stream, e.g. an S3 StreamingBody.
+
+    Returns:
+        tuple: The decompressed, line-iterable stream and the compression
+               found ('gzip', 'zstd', 'bz2', or None if the stream is not
+               compressed).
+    """
+    prefix = b""
+    while len(prefix) < MAGIC_LENGTH:
+        data = stream.read(MAGIC_LENGTH - len(prefix))
+        if not data:
+            break
+        prefix += data
+
+    buffered = io.BufferedReader(_PrefixedStream(prefix, stream))
+    compression = detect_compression(prefix)
+    match compression:
+        case "gzip":
+            return gzip.GzipFile(fileobj=buffered, mode="rb"), compression
+        case "bz2":
+            return bz2.BZ2File(buffered, mode="rb"), compression
+        case "zstd":
+            zstandard = _import_zstandard()
+            reader = zstandard.ZstdDecompressor().stream_reader(
+                buffered, read_across_frames=True
+            )
+            return io.BufferedReader(reader), compression
+        case _:
+            return buffered, None
+
+
+def decompress_bytes(file_content):
+    """
+    Decompress file content if it is compressed with gzip, zstd or bz2.
+
+    Args:
+        file_content (bytes): The possibly compressed file content.
+
+    Returns:
+        tuple: The decompressed content and the compression found, or None.
+    """
+    compression = detect_compression(file_content[:MAGIC_LENGTH])
+    if compression is None:
+        return file_content, None
+    stream, _ = open_decompressed_stream(io.BytesIO(file_content))
+    return stream.read(), compression
+
+
+def _compressor(compression, level):
+    """
+    Create an incremental compressor with compress and flush methods.
+    """
+    lowest, highest, default = COMPRESSION_LEVELS[compression]
+    level = default if level is None else level
+    if not lowest <= level <= highest:
+        logging.error(f"Invalid {compression} compression level: {level}")
+        raise ValueError(
+            f"Invalid compression level {level} for {compression}: it must be between {lowest} and {highest}."
+        )
+
+    match compression:
+        case "gzip":
+            # wbits=31 writes a gzip header and trailer around the deflate stream
+            return zlib.compressobj(level, wbits=31)
+        case "bz2":
+            return bz2.BZ2Compressor(level)
+        case "zstd":
+            zstandard = _import_zstandard()
+            return zstandard.ZstdCompressor(level=level).compressobj()
+
+
+def compress_chunks(chunks, compression, level=None):
+    """
+    Compress a stream of byte chunks incrementally.
+
+    Args:
+        chunks (Iterable[bytes]): The uncompressed chunks.
+        compression (str): 'gzip', 'zstd' or 'bz2', or None to pass the chunks through.
+        level (int): The compression level, or None for the codec's default.
+
+    Yields:
+        bytes: The compressed chunks.
+
+    Raises:
+        ValueError: If the level is out of range for the codec.
+    """
+    if compression is None:
+        yield from chunks
+        return
+
+    compressor = _compressor(compression, level)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -1,29 +1,100 @@
-import boto3
+import os
+import threading
 import logging
 from src.credentials_handler import get_aws_credentials
 
 logging.basicConfig(level=logging.INFO)
 
+_client = None
+_client_lock = threading.Lock()
+_client_settings = {}
+
+
+def _client_config():
+    """
+    Build the botocore client configuration from the configured settings,
+    falling back to environment variables and then to the defaults.
+    """
+    settings = {
+        "max_pool_connections": int(
+            os.getenv("S3_MAX_POOL_CONNECTIONS", "32")
+        ),
+        "retry_mode": os.getenv("S3_RETRY_MODE", "standard"),
+        "max_attempts": int(os.getenv("S3_MAX_ATTEMPTS", "5")),
+        "tcp_keepalive": os.getenv("S3_TCP_KEEPALIVE", "true").lower()
+        == "true",
+    }
+    settings.update(_client_settings)
+
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=settings["max_pool_connections"],
+        retries={
+            "mode": settings["retry_mode"],
+            "max_attempts": settings["max_attempts"],
+        },
+        tcp_keepalive=settings["tcp_keepalive"],
+    )
+
+
+def configure_s3_client(
+    max_pool_connections=None,
+    retry_mode=None,
+    max_attempts=None,
+    tcp_keepalive=None,
+):
+    """
+    Set the connection settings of the shared S3 client. The cached client
+    is dropped, so the next call to s3_client builds one with these settings.
+    Settings left as None fall back to the S3_MAX_POOL_CONNECTIONS,
+    S3_RETRY_MODE, S3_MAX_ATTEMPTS and S3_TCP_KEEPALIVE environment variables.
+
+    Args:
+        max_pool_connections (int): The most connections kept in the pool.
+        retry_mode (str): The botocore retry mode ('legacy', 'standard' or 'adaptive').
+        max_attempts (int): The most attempts made for each request.
+        tcp_keepalive (bool): Whether to enable TCP keep-alive on connections.
+    """
+    global _client, _client_settings
+
+    settings = {
+        "max_pool_connections": max_pool_connections,
+        "retry_mode": retry_mode,
+        "max_attempts": max_attempts,
+        "tcp_keepalive": tcp_keepalive,
+    }
+    with _client_lock:
+        _client_settings = {
+            key: value for key, value in settings.items() if value is not None
+        }
+        _client = None
+
 
 def s3_client():
     """
-    Create an authenticated S3 client using AWS credentials.
-    This function retrieves a session with AWS credentials and uses it to create an S3 client.
+    Return the shared, authenticated S3 client, creating it on first use.
+    The client is created once and reused by every caller and thread, so
+    warm invocations and batch workers reuse its pooled connections.
     """
-    session = get_aws_credentials()
-
-    if session:
-        logging.info(
-            "AWS session successfully retrieved. Initializing S3 client."
-        )
-        return boto3.client(
-            "s3",
-            aws_access_key_id=session.get_credentials().access_key,
-            aws_secret_access_key=session.get_credentials().secret_key,
-            region_name=session.region_name,
-        )
-    else:
-        logging.error(
-            "Failed to retrieve AWS session. S3 client cannot be initialized."
-        )
-        return None
+    global _client
+
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is None:
+            session = get_aws_credentials()
+
+            if not session:
+                logging.error(
+                    "Failed to retrieve AWS session. S3 client cannot be initialized."
+                )
+                return None
+
+            logging.info(
+                "AWS session successfully retrieved. Initializing S3 client."
+            )
+            _client = session.client("s3", config=_client_config())
+
+        return _client
@@ -1,4 +1,3 @@
-import boto3
 import os
 import logging
 from dotenv import load_dotenv
@@ -10,6 +9,8 @@ def get_aws_credentials():
     from either AWS configuration files or environment variables, return the session.
     If not, return None indicating failure to retrieve valid credentials.
     """
+    import boto3  # Deferred so importing the obfuscator stays fast
+
     load_dotenv()  # Load .env file if available
 
     session = boto3.Session()  # Attempt to create a session
@@ -0,0 +1,353 @@
+import csv
+import io
+import json
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_SAMPLE_ROWS = 1000
+# The most bytes of a CSV or JSON Lines file read to sample its rows
+DEFAULT_SAMPLE_BYTES = 1024 * 1024
+# The share of a column's sampled values that must match for it to be PII
+DEFAULT_MATCH_THRESHOLD = 0.8
+# The values each detector is tried on before the rest of the sample
+EARLY_EXIT_ROWS = 32
+
+# Reserved prefixes that are never allocated to UK National Insurance numbers
+NI_INVALID_PREFIXES = {"BG", "GB", "KN", "NK", "NT", "TN", "ZZ"}
+
+
+def _is_phone_number(value):
+    """
+    Check that a phone-like value has the number of digits of a national or
+    international number and is written like one, rather than an ID.
+    """
+    digits = sum(character.isdigit() for character in value)
+    return 10 <= digits <= 15 and (
+        value.startswith(("+", "0", "(")) or not value.isdigit()
+    )
+
+
+def _is_iban(value):
+    """
+    Check an IBAN's ISO 13616 mod-97 check digits.
+    """
+    rearranged = value[4:] + value[:4]
+    return int("".join(str(int(c, 36)) for c in rearranged)) % 97 == 1
+
+
+def _is_ni_number(value):
+    """
+    Check that a National Insurance number does not use a reserved prefix.
+    """
+    return value[:2] not in NI_INVALID_PREFIXES
+
+
+# Each detector is a regular expression in RE2 syntax, which pyarrow
+# matches over a whole sample at once, and an optional validator for the
+# values that match. IBANs, NI numbers and postcodes are matched with their
+# spaces removed and in upper case.
+DETECTORS = {
+    "email": (
+        r"^[A-Za-z0-9._%+'-]+@[A-Za-z0-9-]+(\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}$",
+        None,
+    ),
+    "phone": (r"^\+?[0-9(][0-9 ().-]{8,20}[0-9]$", _is_phone_number),
+    "iban": (r"^[A-Z]{2}[0-9]{2}[A-Z0-9]{11,30}$", _is_iban),
+    "uk_ni_number": (
+        r"^[A-CEGHJ-PR-TW-Z][A-CEGHJ-NPR-TW-Z][0-9]{6}[A-D]$",
+        _is_ni_number,
+    ),
+    "uk_postcode": (r"^[A-Z]{1,2}[0-9][A-Z0-9]?[0-9][A-Z]{2}$", None),
+}
+_COMPACTED_DETECTORS = {"iban", "uk_ni_number", "uk_postcode"}
+
+
+def _match_ratio(values, detector):
+    """
+    Return the share of values a detector matches, checking the pattern
+    over every value at once and the validator over the matches only.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    pattern, validator = DETECTORS[detector]
+    array = pa.array(values, type=pa.string())
+    if detector in _COMPACTED_DETECTORS:
+        array = pc.utf8_upper(pc.replace_substring(array, " ", ""))
+    matches = pc.match_substring_regex(array, pattern)
+    matched = pc.filter(array, matches).to_pylist()
+    if validator is not None:
+        matched = [value for value in matched if validator(value)]
+    return len(matched) / len(values)
+
+
+def detect_pii_columns(samples, threshold=DEFAULT_MATCH_THRESHOLD):
+    """
+    Detect which columns hold PII from a sample of their values.
+
+    A column is detected as a kind of PII when at least threshold of its
+    non-empty sampled values match that kind's pattern and validator. Each
+    detector is first tried on the first EARLY_EXIT_ROWS values, and only
+    checked against the rest of the sample if enough of those match, so
+    columns that clearly hold something else are ruled out early.
+
+    Args:
+        samples (dict): The sampled string values of each column, with
+            None for missing values.
+        threshold (float): The share of values that must match.
+
+    Returns:
+        dict: The kind of PII detected in each PII column (one of the keys
+              of DETECTORS), in the order of the columns.
+    """
+    detected = {}
+    for column, values in samples.items():
+        values = [value.strip() for value in values if value]
+        values = [value for value in values if value]
+        if not values:
+            continue
+        for detector in DETECTORS:
+            head = values[:EARLY_EXIT_ROWS]
+            if _match_ratio(head, detector) < threshold:
+                continue
+            if len(values) == len(head) or (
+                _match_ratio(values, detector) >= threshold
+            ):
+                detected[column] = detector
+                break
+    return detected
+
+
+def _sample_csv(text, complete, max_rows):
+    """
+    Sample the columns of CSV text, as strings as they appear in the file.
+    """
+    rows = list(csv.reader(io.StringIO(text)))
+    if not complete and len(rows) > 1:
+        # The last record may have been cut off
+        rows.pop()
+    if not rows:
+        return {}
+    header, records = rows[0], rows[1 : max_rows + 1]
+    return {
+        column: [record[i] if i < len(record) else None for record in records]
+        for i, column in enumerate(header)
+    }
+
+
+def _sample_records(records):
+    """
+    Sample the columns of parsed JSON records, keeping only string values
+    and numbers, which may be written as phone numbers.
+    """
+    samples = {}
+    for record in records:
+        if not isinstance(record, dict):
+            continue
+        for column, value in record.items():
+            if isinstance(value, (str, int)) and not isinstance(value, bool):
+                samples.setdefault(column, []).append(str(value))
+    return samples
+
+
+def _sample_ndjson(text, complete, max_rows):
+    """
+    Sample the columns of JSON Lines text, skipping lines that do not parse.
+    """
+    lines = text.splitlines()
+    if not complete and lines:
+        lines.pop()
+    records = []
+    for line in lines:
+        if len(records) >= max_rows:
+            break
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return _sample_records(records)
+
+
+def _sample_parquet(source, max_rows):
+    """
+    Sample the string columns of a Parquet file from its first rows, which
+    reads the footer and those columns of the first row group only.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(source)
+    columns = [
+        field.name
+        for field in parquet_file.schema_arrow
+        if pa.types.is_string(field.type)
+        or pa.types.is_large_string(field.type)
+        or (
+            pa.types.is_dictionary(field.type)
+            and pa.types.is_string(field.type.value_type)
+        )
+    ]
+    samples = dict.fromkeys(parquet_file.schema_arrow.names)
+    if columns and parquet_file.metadata.num_row_groups:
+        batch = next(
+            parquet_file.iter_batches(batch_size=max_rows, columns=columns),
+            None,
+        )
+        if batch is not None:
+            for column in columns:
+                samples[column] = batch.column(column).cast(
+                    pa.string()
+                ).to_pylist()
+    return {column: values or [] for column, values in samples.items()}
+
+
+def _read_sample(stream, sample_bytes):
+    """
+    Read up to sample_bytes of decompressed content from a stream, cut at
+    the last whole line.
+
+    Returns the text and whether it holds the whole file.
+    """
+    from src.compression import open_decompressed_stream
+
+    decompressed, _ = open_decompressed_stream(stream)
+    content = decompressed.read(sample_bytes + 1)
+    complete = len(content) <= sample_bytes
+    if not complete:
+        content = content[: content.rfind(b"\n", 0, sample_bytes) + 1]
+    return content.decode("utf-8", errors="replace"), complete
+
+
+def sample_file(
+    file_path,
+    file_type,
+    max_rows=DEFAULT_SAMPLE_ROWS,
+    sample_bytes=DEFAULT_SAMPLE_BYTES,
+):
+    """
+    Read a bounded sample of the values in each column of an S3 or local
+    file.
+
+    Only the start of a CSV or JSON Lines file is read, up to sample_bytes
+    after decompression, and only the footer and the first rows of the
+    string columns of an uncompressed Parquet file, so the cost does not
+    grow with the size of the file. A JSON document, or a compressed
+    Parquet file, has to be read whole.
+
+    Args:
+        file_path (str): The S3 URI or 'file://' URI of the file.
+        file_type (str): The type of the file.
+        max_rows (int): The most rows sampled.
+        sample_bytes (int): The most bytes of a CSV or JSON Lines file read.
+
+    Returns:
+        dict: The sampled values of each column as strings, with None for
+              missing values, in the order of the columns.
+
+    Raises:
+        ValueError: If the file is standard input, which cannot be read
+                    twice, or its type is not supported.
+    """
+    from src.local_files import (
+        STDIO_PATH,
+        is_local_path,
+        local_file_path,
+        open_local_content,
+        open_local_stream,
+    )
+
+    if file_path == STDIO_PATH:
+        logging.error("PII detection cannot sample standard input.")
+        raise ValueError(
+            "PII columns cannot be detected in standard input; list 'pii_fields' instead."
+        )
+    local = is_local_path(file_path)
+
+    if file_type == "csv" or file_type in ("jsonl", "ndjson"):
+        if local:
+            stream = open_local_stream(file_path)
+        else:
+            from src.file_handling import open_s3_file_stream
+
+            stream = open_s3_file_stream(file_path, sample_bytes, 1)
+        with stream:
+            text, complete = _read_sample(stream, sample_bytes)
+        if file_type == "csv":
+            return _sample_csv(text, complete, max_rows)
+        return _sample_ndjson(text, complete, max_rows)
+
+    if file_type == "parquet":
+        if local:
+            import pyarrow as pa
+
+            source = pa.memory_map(local_file_path(file_path))
+            tail = source.read_at(4, max(source.size() - 4, 0))
+        else:
+            from src.file_handling import S3RangeFile
+
+            source = S3RangeFile(file_path)
+            tail = source.tail
+        with source:
+            if tail.endswith(b"PAR1"):
+                return _sample_parquet(source, max_rows)
+
+    if file_type not in ("parquet", "json"):
+        logging.error(f"Unsupported file type: {file_type}")
+        raise ValueError(f"Unsupported file type: {file_type}.")
+
+    from src.compression import decompress_bytes
+
+    if local:
+        with open_local_content(file_path) as content:
+            content, _ = decompress_bytes(content)
+            content = bytes(content)
+    else:
+        from src.file_handling import download_s3_file_bytes
+
+        content, _ = decompress_bytes(download_s3_file_bytes(file_path))
+    if file_type == "parquet":
+        import pyarrow as pa
+
+        return _sample_parquet(pa.BufferReader(content), max_rows)
+    try:
+        records = json.loads(content)
+    except json.JSONDecodeError as e:
+        logging.error(f"Failed to parse JSON: {e}")
+        raise ValueError(f"Invalid JSON file: {e}") from e
+    if isinstance(records, dict):
+        # The layout pd.read_json reads as one row per list item
+        records = next(
+            (value for value in records.values() if isinstance(value, list)),
+            [records],
+        )
+    return _sample_records(records[:max_rows])
+
+
+def detect_file_pii(
+    file_path,
+    file_type,
+    max_rows=DEFAULT_SAMPLE_ROWS,
+    threshold=DEFAULT_MATCH_THRESHOLD,
+):
+    """
+    Detect the PII columns of an S3 or local file from a bounded sample of
+    its rows (see sample_file).
+
+    Every file is detected from its own sample, even when an earlier file
+    had the same columns, so a column that was empty or unrecognised in
+    one file's sample is still checked in the next.
+
+    Args:
+        file_path (str): The S3 URI or 'file://' URI of the file.
+        file_type (str): The type of the file.
+        max_rows (int): The most rows sampled.
+        threshold (float): The share of a column's values that must match.
+
+    Returns:
+        dict: The kind of PII detected in each PII column.
+    """
+    samples = sample_file(file_path, file_type, max_rows)
+    detected = detect_pii_columns(samples, threshold)
+    logging.info(f"Detected PII columns in {file_path}: {detected}")
+    return detected
@@ -1,13 +1,411 @@
-import boto3
 import json
-import pandas as pd
 import io
+import itertools
 import logging
-from botocore.exceptions import ClientError
+from collections import deque
+from typing import TYPE_CHECKING
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from botocore.exceptions import ClientError, NoCredentialsError
+from src.compression import decompress_bytes
+from src.connection import s3_client
+from src.utils import get_file_type
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 logging.basicConfig(level=logging.INFO)
 
-s3 = boto3.client('s3')
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_UPLOAD_CONCURRENCY = 4
+DEFAULT_DOWNLOAD_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_DOWNLOAD_CONCURRENCY = 8
+# Bytes read from the end of an object when it is opened for ranged reads,
+# matching the footer size pyarrow reads first from a Parquet file
+DEFAULT_TAIL_SIZE = 64 * 1024
+
+
+def get_s3_client():
+    """
+    Return the shared S3 client used for every S3 operation.
+
+    Returns:
+        botocore.client.S3: The shared, authenticated S3 client.
+
+    Raises:
+        NoCredentialsError: If no AWS credentials could be retrieved.
+    """
+    client = s3_client()
+    if client is None:
+        raise NoCredentialsError()
+    return client
+
+
+def split_s3_path(s3_path):
+    """
+    Split an S3 URI into its bucket name and object key.
+
+    Args:
+        s3_path (str): An S3 URI such as 's3://bucket/path/to/file.csv'.
+
+    Returns:
+        tuple: A tuple containing the bucket name and the object key.
+    """
+    return s3_path[5:].split("/", 1)
+
+
+def list_s3_files(s3_prefix):
+    """
+    List the S3 URIs of every object under a bucket prefix.
+
+    Args:
+        s3_prefix (str): An S3 URI prefix such as 's3://bucket/exports/'.
+
+    Yields:
+        str: The S3 URI of each object under the prefix.
+
+    Raises:
+        ClientError: If there is an error listing the objects in S3.
+    """
+    for s3_path, _ in list_s3_objects(s3_prefix):
+        yield s3_path
+
+
+def list_s3_objects(s3_prefix):
+    """
+    List the S3 URI and size of every object under a bucket prefix.
+
+    Args:
+        s3_prefix (str): An S3 URI prefix such as 's3://bucket/exports/'.
+
+    Yields:
+        tuple: The S3 URI and the size in bytes of each object under the prefix.
+
+    Raises:
+        ClientError: If there is an error listing the objects in S3.
+    """
+    bucket_name, prefix = (s3_prefix[5:].split("/", 1) + [""])[:2]
+    try:
+        paginator = get_s3_client().get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            for s3_object in page.get("Contents", []):
+                if not s3_object["Key"].endswith("/"):
+                    yield (
+                        f"s3://{bucket_name}/{s3_object['Key']}",
+                        s3_object["Size"],
+                    )
+    except ClientError as e:
+        logging.error(f"Failed to list objects in S3: {e}")
+        raise
+
+
+def _get_s3_range(bucket_name, key, byte_range, etag=None):
+    """
+    Fetch a byte range of an S3 object, failing if its ETag has changed.
+    """
+    request = {
+        "Bucket": bucket_name,
+        "Key": key,
+        "Range": f"bytes={byte_range}",
+    }
+    if etag:
+        request["IfMatch"] = etag
+    return get_s3_client().get_object(**request)
+
+
+def iter_s3_file_parts(
+    file_to_obfuscate,
+    part_size=DEFAULT_DOWNLOAD_PART_SIZE,
+    max_concurrency=DEFAULT_DOWNLOAD_CONCURRENCY,
+    etag=None,
+):
+    """
+    Download a file from S3 with concurrent ranged GETs, yielding its
+    content in consecutive parts.
+
+    The first part also reveals the size of the object, after which up to
+    max_concurrency further parts are fetched in parallel. Parts are
+    yielded in order and no more than max_concurrency are fetched ahead of
+    the consumer, so memory is bounded by the part size rather than the
+    size of the object. Every part is requested with the ETag of the first,
+    so an object replaced mid-download fails instead of being mixed up.
+
+    Args:
+        file_to_obfuscate (str): The S3 URI of the file to download.
+        part_size (int): The size in bytes of each ranged GET.
+        max_concurrency (int): The most ranged GETs in flight at once.
+        etag (str): Optionally, the ETag the object must still have, e.g. from
+            an earlier HeadObject request. Defaults to the ETag of the first part.
+
+    Yields:
+        bytes: Consecutive parts of the content of the S3 object.
+
+    Raises:
+        ClientError: If there is an error fetching the file from S3.
+    """
+    bucket_name, key = split_s3_path(file_to_obfuscate)
+    try:
+        response = _get_s3_range(
+            bucket_name, key, f"0-{part_size - 1}", etag
+        )
+    except ClientError as e:
+        # An empty object has no byte ranges to request
+        if e.response["Error"]["Code"] == "InvalidRange":
+            return
+        logging.error(f"Failed to download from S3: {e}")
+        raise
+
+    size = int(response["ContentRange"].rsplit("/", 1)[1])
+    etag = response["ETag"]
+    yield response["Body"].read()
+
+    def fetch(start):
+        end = min(start + part_size, size) - 1
+        return _get_s3_range(bucket_name, key, f"{start}-{end}", etag)[
+            "Body"
+        ].read()
+
+    starts = iter(range(part_size, size, part_size))
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        pending = deque(
+            pool.submit(fetch, start)
+            for start in itertools.islice(starts, max_concurrency)
+        )
+        try:
+            while pending:
+                part = pending.popleft().result()
+                start = next(starts, None)
+                if start is not None:
+                    pending.append(pool.submit(fetch, start))
+                yield part
+        except ClientError as e:
+            logging.error(f"Failed to download from S3: {e}")
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class _PartsStream(io.RawIOBase):
+    """
+    A readable raw stream over an iterator of byte parts.
+    """
+
+    def __init__(self, parts):
+        self._parts = parts
+        self._part = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._part:
+            self._part = next(self._parts, None)
+            if self._part is None:
+                self._part = b""
+                return 0
+        size = min(len(buffer), len(self._part))
+        buffer[:size] = self._part[:size]
+        self._part = self._part[size:]
+        return size
+
+    def close(self):
+        if hasattr(self._parts, "close"):
+            self._parts.close()
+        super().close()
+
+
+def open_parts_stream(parts):
+    """
+    Wrap consecutive byte parts, such as those from iter_s3_file_parts, in
+    a buffered, line-iterable binary stream. Closing the stream closes the
+    underlying iterator.
+
+    Args:
+        parts (Iterable[bytes]): The content of the stream, in order.
+
+    Returns:
+        io.BufferedReader: A readable binary stream of the parts.
+    """
+    return io.BufferedReader(_PartsStream(iter(parts)))
+
+
+def open_s3_file_stream(
+    file_to_obfuscate,
+    part_size=DEFAULT_DOWNLOAD_PART_SIZE,
+    max_concurrency=DEFAULT_DOWNLOAD_CONCURRENCY,
+):
+    """
+    Open a file in S3 as a stream without reading its body into memory.
+
+    The returned stream is file-like, so readers such as pd.read_csv can
+    pull from it in chunks instead of holding the whole object in memory.
+    The content is fetched with concurrent ranged GETs ahead of the reader.
+
+    Args:
+        file_to_obfuscate (str): The S3 URI of the file to stream.
+        part_size (int): The size in bytes of each ranged GET.
+        max_concurrency (int): The most ranged GETs in flight at once.
+
+    Returns:
+        io.BufferedReader: A readable binary stream of the S3 object.
+
+    Raises:
+        ClientError: If there is an error fetching the file from S3.
+    """
+    bucket_name, key = split_s3_path(file_to_obfuscate)
+    logging.info(f"Streaming file {key} from bucket {bucket_name}.")
+    parts = iter_s3_file_parts(file_to_obfuscate, part_size, max_concurrency)
+    # Fetch the first part now, so a missing object fails on opening
+    first_part = next(parts, b"")
+    return open_parts_stream(itertools.chain([first_part], parts))
+
+
+def download_s3_file_bytes(
+    file_to_obfuscate,
+    part_size=DEFAULT_DOWNLOAD_PART_SIZE,
+    max_concurrency=DEFAULT_DOWNLOAD_CONCURRENCY,
+    etag=None,
+):
+    """
+    Download a file from S3 and return its raw content. Objects larger
+    than part_size are fetched with concurrent ranged GETs.
+
+    Args:
+        file_to_obfuscate (str): The S3 URI of the file to download.
+        part_size (int): The size in bytes of each ranged GET.
+        max_concurrency (int): The most ranged GETs in flight at once.
+        etag (str): Optionally, the ETag the object must still have.
+
+    Returns:
+        bytes: The content of the S3 object.
+
+    Raises:
+        ClientError: If there is an error fetching the file from S3.
+    """
+    bucket_name, key = split_s3_path(file_to_obfuscate)
+    logging.info(f"Downloading file {key} from bucket {bucket_name}.")
+    return b"".join(
+        iter_s3_file_parts(
+            file_to_obfuscate, part_size, max_concurrency, etag
+        )
+    )
+
+
+class S3RangeFile(io.RawIOBase):
+    """
+    A seekable, read-only file over an S3 object that reads with ranged
+    GETs, for readers such as pyarrow that only need parts of a file.
+
+    The tail of the object is fetched on opening, which also gives its size
+    and usually holds the whole Parquet footer. Byte ranges known in
+    advance can be fetched concurrently with prefetch; other reads are
+    fetched as they are made.
+    """
+
+    def __init__(
+        self,
+        file_to_obfuscate,
+        tail_size=DEFAULT_TAIL_SIZE,
+        max_concurrency=DEFAULT_DOWNLOAD_CONCURRENCY,
+    ):
+        self._bucket_name, self._key = split_s3_path(file_to_obfuscate)
+        self._max_concurrency = max_concurrency
+        self._position = 0
+        self._cache = {}
+        try:
+            response = _get_s3_range(
+                self._bucket_name, self._key, f"-{tail_size}"
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "InvalidRange":
+                logging.error(f"Failed to download from S3: {e}")
+                raise
+            self.size, self._etag, self._tail = 0, None, b""
+        else:
+            self.size = int(response["ContentRange"].rsplit("/", 1)[1])
+            self._etag = response["ETag"]
+            self._tail = response["Body"].read()
+
+    @property
+    def tail(self):
+        """
+        The last bytes of the object, fetched on opening.
+        """
+        return self._tail
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(offset, 0)
+        return self._position
+
+    def _cached(self, start, size):
+        """
+        Return a byte range from the tail or the prefetched ranges, if held.
+        """
+        blocks = [(self.size - len(self._tail), self._tail)]
+        blocks += self._cache.items()
+        for block_start, block in blocks:
+            offset = start - block_start
+            if 0 <= offset and offset + size <= len(block):
+                return block[offset : offset + size]
+        return None
+
+    def _fetch(self, start, size):
+        return _get_s3_range(
+            self._bucket_name,
+            self._key,
+            f"{start}-{start + size - 1}",
+            self._etag,
+        )["Body"].read()
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.size - self._position)
+        if size <= 0:
+            return 0
+        data = self._cached(self._position, size)
+        if data is None:
+            data = self._fetch(self._position, size)
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def prefetch(self, byte_ranges):
+        """
+        Fetch byte ranges concurrently and hold them for the reads that
+        follow, replacing any ranges prefetched before.
+
+        Args:
+            byte_ranges (Iterable[tuple]): The (start, size) of each range.
+        """
+        self._cache = {}
+        byte_ranges = [
+            (start, size)
+            for start, size in byte_ranges
+            if size > 0 and self._cached(start, size) is None
+        ]
+        if not byte_ranges:
+            return
+        with ThreadPoolExecutor(
+            max_workers=min(self._max_concurrency, len(byte_ranges))
+        ) as pool:
+            blocks = pool.map(lambda r: self._fetch(*r), byte_ranges)
+            self._cache = {
+                start: block
+                for (start, _), block in zip(byte_ranges, blocks)
+            }
+
 
 def download_s3_file_and_convert_to_pandas_dataframe(file_to_obfuscate):
     """
@@ -30,24 +428,39 @@ def download_s3_file_and_convert_to_pandas_dataframe(file_to_obfuscate):
             logging.error("Failed to parse the JSON string.")
             raise ValueError("Invalid file path: Expected a JSON string of S3 URI starting with 's3://'.") from e
         
-    try:
-        bucket_name, key = file_to_obfuscate[5:].split("/", 1)
-        logging.info(f"Downloading file {key} from bucket {bucket_name}.")
-        response = s3.get_object(Bucket=bucket_name, Key=key)
-        file_content = response['Body'].read()
-    except ClientError as e:
-        logging.error(f"Failed to download from S3: {e}")
-        raise
+    file_content, _ = decompress_bytes(
+        download_s3_file_bytes(file_to_obfuscate)
+    )
+    return bytes_to_dataframe(file_content, get_file_type(file_to_obfuscate))
+
 
-    _, file_type = file_to_obfuscate.rsplit(".", 1)
-    file_type = file_type.lower()
+def bytes_to_dataframe(file_content, file_type, csv_options=None):
+    """
+    Load raw file content into a pandas DataFrame based on the file's type.
+
+    Args:
+        file_content (bytes | mmap.mmap): The content of the file.
+        file_type (str): Type of the file ('csv', 'parquet', 'json').
+        csv_options (dict): Extra pd.read_csv arguments for CSV files, e.g.
+            from utils.csv_read_options.
+
+    Returns:
+        pd.DataFrame: The file content loaded into a Pandas DataFrame.
+
+    Raises:
+        ValueError: If the file type is unsupported.
+    """
+    import pandas as pd
 
     try:
         match file_type:
             case "csv":
-                return pd.read_csv(io.StringIO(file_content.decode('utf-8')))
+                return pd.read_csv(
+                    io.StringIO(str(file_content, 'utf-8')),
+                    **(csv_options or {}),
+                )
             case "json":
-                return pd.read_json(io.StringIO(file_content.decode('utf-8')))
+                return pd.read_json(io.StringIO(str(file_content, 'utf-8')))
             case "parquet":
                 return pd.read_parquet(io.BytesIO(file_content))
             case _:
@@ -56,7 +469,7 @@ def download_s3_file_and_convert_to_pandas_dataframe(file_to_obfuscate):
         logging.error(f"File type error: {e}")
         raise
 
-def dataframe_to_bytes(df: pd.DataFrame, file_type):
+def dataframe_to_bytes(df: "pd.DataFrame", file_type):
     """
     Convert a DataFrame to bytes, suitable for saving to a file for S3.
 
@@ -88,3 +501,147 @@ def dataframe_to_bytes(df: pd.DataFrame, file_type):
 
     buffer.seek(0)
     return buffer.getvalue()
+
+
+def dataframe_to_chunks(df: "pd.DataFrame", file_type, chunksize=100_000):
+    """
+    Convert a DataFrame to bytes in slices of rows, without building the
+    whole output in a single buffer. Joining the chunks gives the same bytes
+    as dataframe_to_bytes.
+
+    Args:
+        df (pd.DataFrame): DataFrame to convert.
+        file_type (str): Type of file to convert to ('csv', 'json').
+        chunksize (int): The number of rows to convert per chunk.
+
+    Yields:
+        bytes: Consecutive chunks of the converted DataFrame.
+
+    Raises:
+        ValueError: If the specified file type is unsupported.
+    """
+    if file_type not in ("csv", "json"):
+        logging.error(f"Conversion error: Unsupported file type: {file_type}.")
+        raise ValueError(f"Unsupported file type for chunked conversion: {file_type}.")
+
+    if file_type == "json":
+        yield b"["
+
+    for start in range(0, max(len(df), 1), chunksize):
+        rows = df.iloc[start:start + chunksize]
+        if file_type == "csv":
+            yield rows.to_csv(index=False, header=start == 0).encode('utf-8')
+        elif len(rows):
+            records = rows.to_json(orient="records")[1:-1]
+            yield (records if start == 0 else "," + records).encode('utf-8')
+
+    if file_type == "json":
+        yield b"]"
+
+
+def upload_stream_to_s3(
+    chunks,
+    destination,
+    part_size=DEFAULT_PART_SIZE,
+    max_concurrency=DEFAULT_UPLOAD_CONCURRENCY,
+):
+    """
+    Upload a stream of byte chunks to S3 using a multipart upload.
+
+    Chunks are gathered into parts of part_size bytes, which are uploaded in
+    parallel. At most max_concurrency parts are in flight at once, so memory
+    is bounded by the part size rather than the size of the output. Output
+    smaller than a single part is uploaded with a plain put_object.
+
+    Args:
+        chunks (Iterable[bytes]): The content to upload, in order.
+        destination (str): The S3 URI to upload to.
+        part_size (int): The size in bytes of each uploaded part.
+        max_concurrency (int): The most parts uploaded at once.
+
+    Returns:
+        str: The S3 URI the content was uploaded to.
+
+    Raises:
+        ClientError: If there is an error uploading to S3. Any started
+                     multipart upload is aborted.
+    """
+    s3 = get_s3_client()
+    bucket_name, key = split_s3_path(destination)
+    chunks = iter(chunks)
+    buffer = bytearray()
+
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= part_size:
+            break
+    else:
+        try:
+            logging.info(f"Uploading file {key} to bucket {bucket_name}.")
+            s3.put_object(Bucket=bucket_name, Key=key, Body=bytes(buffer))
+            return destination
+        except ClientError as e:
+            logging.error(f"Failed to upload to S3: {e}")
+            raise
+
+    logging.info(f"Starting multipart upload of {key} to bucket {bucket_name}.")
+    upload_id = s3.create_multipart_upload(Bucket=bucket_name, Key=key)[
+        "UploadId"
+    ]
+
+    def upload_part(part_number, body):
+        response = s3.upload_part(
+            Bucket=bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    try:
+        parts = []
+        in_flight = set()
+        part_number = 0
+        with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+
+            def submit(body):
+                nonlocal part_number
+                part_number += 1
+                if len(in_flight) >= max_concurrency:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        in_flight.remove(future)
+                        parts.append(future.result())
+                in_flight.add(pool.submit(upload_part, part_number, body))
+
+            while True:
+                while len(buffer) >= part_size:
+                    submit(bytes(buffer[:part_size]))
+                    del buffer[:part_size]
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                buffer += chunk
+
+            if buffer:
+                submit(bytes(buffer))
+            for future in in_flight:
+                parts.append(future.result())
+
+        s3.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={
+                "Parts": sorted(parts, key=lambda part: part["PartNumber"])
+            },
+        )
+        logging.info(f"Completed multipart upload of {key} in {part_number} parts.")
+        return destination
+    except BaseException as e:
+        logging.error(f"Multipart upload failed, aborting: {e}")
+        s3.abort_multipart_upload(
+            Bucket=bucket_name, Key=key, UploadId=upload_id
+        )
+        raise
@@ -0,0 +1,238 @@
+import json
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+logging.basicConfig(level=logging.INFO)
+
+# Every stage record has these keys, with None for what a stage cannot know.
+# The process_ fields cover the whole process, including any other stages
+# running at the same time, rather than the stage alone.
+METRIC_FIELDS = [
+    "stage",
+    "wall_seconds",
+    "process_cpu_seconds",
+    "bytes_in",
+    "bytes_out",
+    "rows",
+    "process_peak_rss_mb",
+    "peak_rss_growth_mb",
+    "peak_traced_mb",
+]
+
+_hooks = []
+_hooks_lock = threading.Lock()
+# The traced peaks of the nested stages running on each thread
+_traced_peaks = threading.local()
+
+
+def add_metrics_hook(hook):
+    """
+    Register a function to call with the metrics of every stage.
+
+    The hook receives a dict with the keys in METRIC_FIELDS when each stage
+    finishes. It is called on the thread that ran the stage, so it must be
+    thread-safe if stages run concurrently, as they do in obfuscate_batch.
+    Nothing is measured while no hook is registered.
+
+    Args:
+        hook (Callable[[dict], None]): The function to call.
+    """
+    global _hooks
+
+    with _hooks_lock:
+        # The list is replaced, never changed, so it can be read unlocked
+        _hooks = [*_hooks, hook]
+
+
+def remove_metrics_hook(hook):
+    """
+    Unregister a hook added with add_metrics_hook.
+
+    Args:
+        hook (Callable[[dict], None]): The function to stop calling.
+    """
+    global _hooks
+
+    with _hooks_lock:
+        # Bound methods are equal, but not identical, each time they are read
+        _hooks = [added for added in _hooks if added != hook]
+
+
+def _peak_rss_mb():
+    """
+    Return the peak resident set size of the process so far, in MB.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS bytes
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+@contextmanager
+def stage(name, **fields):
+    """
+    Measure a stage of the pipeline and pass its metrics to the registered
+    hooks when it finishes.
+
+    The stage's 'bytes_in', 'bytes_out' and 'rows' can be passed as keyword
+    arguments, or set on the yielded dict once they are known. Wall time
+    and the CPU time of the whole process are measured around the block.
+    The process's peak RSS is recorded when the stage ends, along with how
+    much the stage raised it; while tracemalloc is tracing, the peak of the
+    allocations traced during the stage is recorded too. Stages running at
+    the same time on other threads count towards each other's CPU time and
+    RSS, but not their traced peaks. Metrics are not recorded for a stage
+    that raises.
+
+    With no hooks registered the yielded dict is simply discarded, so the
+    overhead is that of entering a context manager.
+
+    Args:
+        name (str): The name of the stage, e.g. 'download'.
+        **fields: Initial values for 'bytes_in', 'bytes_out' and 'rows'.
+
+    Yields:
+        dict: The stage's metrics, for the block to fill in.
+    """
+    hooks = _hooks
+    if not hooks:
+        yield fields
+        return
+
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        # A nested stage resets the peak, so it hands its peak back up
+        peaks = _traced_peaks.__dict__.setdefault("stack", [])
+        peaks.append(0)
+        tracemalloc.reset_peak()
+    rss_start = _peak_rss_mb()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield fields
+    finally:
+        if tracing:
+            peak_traced = max(tracemalloc.get_traced_memory()[1], peaks.pop())
+            if peaks:
+                peaks[-1] = max(peaks[-1], peak_traced)
+
+    rss_end = _peak_rss_mb()
+    metrics = dict.fromkeys(METRIC_FIELDS)
+    metrics.update(
+        fields,
+        stage=name,
+        wall_seconds=time.perf_counter() - wall_start,
+        process_cpu_seconds=time.process_time() - cpu_start,
+        process_peak_rss_mb=rss_end,
+        peak_rss_growth_mb=(
+            rss_end - rss_start if rss_end is not None else None
+        ),
+        peak_traced_mb=peak_traced / 1e6 if tracing else None,
+    )
+    for hook in hooks:
+        try:
+            hook(metrics)
+        except Exception as e:
+            # A broken metrics sink must not fail the obfuscation
+            logging.error(f"Metrics hook failed: {e}")
+
+
+def count_bytes(chunks, metrics, field="bytes_out"):
+    """
+    Pass a stream of byte chunks through, adding their total length to a
+    stage's metrics.
+
+    Args:
+        chunks (Iterable[bytes]): The chunks.
+        metrics (dict): The dict yielded by stage.
+        field (str): The metric to add to.
+
+    Yields:
+        bytes: The same chunks.
+    """
+    metrics[field] = metrics.get(field) or 0
+    for chunk in chunks:
+        metrics[field] += len(chunk)
+        yield chunk
+
+
+@contextmanager
+def collect_metrics():
+    """
+    Collect the metrics of every stage run inside the block, e.g. to return
+    them alongside the output of main.
+
+    Stages run on any thread while the block is active are collected.
+
+    Yields:
+        list: The metrics of each stage, in the order they finished.
+    """
+    collected = []
+    add_metrics_hook(collected.append)
+    try:
+        yield collected
+    finally:
+        remove_metrics_hook(collected.append)
+
+
+def emf_metrics_hook(namespace="GDPRObfuscator", stream=None):
+    """
+    Build a hook that writes each stage's metrics as a CloudWatch Embedded
+    Metric Format (EMF) record, one JSON object per line. In AWS Lambda,
+    records written to standard error become CloudWatch metrics. Standard
+    output is left alone, as it may be carrying the obfuscated file.
+
+    Args:
+        namespace (str): The CloudWatch namespace of the metrics.
+        stream (file-like): Where to write the records. Defaults to sys.stderr.
+
+    Returns:
+        Callable[[dict], None]: The hook, for add_metrics_hook.
+    """
+    units = {
+        "wall_seconds": "Seconds",
+        "process_cpu_seconds": "Seconds",
+        "bytes_in": "Bytes",
+        "bytes_out": "Bytes",
+        "rows": "Count",
+        "process_peak_rss_mb": "Megabytes",
+        "peak_rss_growth_mb": "Megabytes",
+        "peak_traced_mb": "Megabytes",
+    }
+
+    def hook(metrics):
+        values = {
+            name: value
+            for name, value in metrics.items()
+            if name in units and value is not None
+        }
+        record = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": namespace,
+                        "Dimensions": [["stage"]],
+                        "Metrics": [
+                            {"Name": name, "Unit": units[name]}
+                            for name in values
+                        ],
+                    }
+                ],
+            },
+            "stage": metrics["stage"],
+            **values,
+        }
+        print(json.dumps(record), file=stream or sys.stderr, flush=True)
+
+    return hook
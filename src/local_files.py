@@ -0,0 +1,238 @@
+import io
+import logging
+import mmap
+import os
+import secrets
+import sys
+from contextlib import contextmanager
+
+logging.basicConfig(level=logging.INFO)
+
+FILE_SCHEME = "file://"
+# The path that reads the input from standard input, or writes the output
+# to standard output
+STDIO_PATH = "-"
+DEFAULT_READ_SIZE = 8 * 1024 * 1024
+
+
+def is_local_path(path):
+    """
+    Check whether a path names a local file or standard input/output rather
+    than an S3 object.
+
+    Args:
+        path (str): A 'file://' URI, '-' or an S3 URI.
+
+    Returns:
+        bool: True for a 'file://' URI or '-'.
+    """
+    return path == STDIO_PATH or path.startswith(FILE_SCHEME)
+
+
+def local_file_path(file_uri):
+    """
+    Return the filesystem path of a 'file://' URI, e.g. '/data/export.csv'
+    for 'file:///data/export.csv'. A URI without a leading slash, such as
+    'file://export.csv', is relative to the working directory.
+
+    Args:
+        file_uri (str): A 'file://' URI.
+
+    Returns:
+        str: The path of the file.
+    """
+    path = file_uri[len(FILE_SCHEME) :]
+    if path.startswith("localhost/"):
+        path = path[len("localhost") :]
+    return path
+
+
+@contextmanager
+def open_local_content(path):
+    """
+    Open the content of a local file as a read-only memory map, so it can
+    be masked without being copied into Python's heap first. An empty file,
+    which cannot be mapped, gives empty bytes, and standard input, which
+    cannot be mapped either, is read whole.
+
+    Any buffer exported from the map, such as a memoryview or a numpy
+    array over it, must be released before the block ends.
+
+    Args:
+        path (str): A 'file://' URI, or '-' for standard input.
+
+    Yields:
+        mmap.mmap | bytes: The content of the file.
+
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    if path == STDIO_PATH:
+        yield sys.stdin.buffer.read()
+        return
+
+    try:
+        with open(local_file_path(path), "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                content = None
+            else:
+                content = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except OSError as e:
+        logging.error(f"Failed to read {path}: {e}")
+        raise
+
+    if content is None:
+        yield b""
+        return
+    try:
+        yield content
+    finally:
+        try:
+            content.close()
+        except BufferError:
+            # The traceback of a failed reader can still hold a view of the
+            # map, which is then unmapped once the view is released
+            pass
+
+
+def open_local_stream(path):
+    """
+    Open a local file, or standard input, as a binary stream for the
+    streaming engines.
+
+    Args:
+        path (str): A 'file://' URI, or '-' for standard input.
+
+    Returns:
+        file-like: The open stream. Closing it leaves standard input open.
+
+    Raises:
+        OSError: If the file cannot be opened.
+    """
+    if path == STDIO_PATH:
+        return open(sys.stdin.buffer.fileno(), "rb", closefd=False)
+    try:
+        return open(local_file_path(path), "rb")
+    except OSError as e:
+        logging.error(f"Failed to read {path}: {e}")
+        raise
+
+
+def iter_local_file_parts(path, part_size=DEFAULT_READ_SIZE):
+    """
+    Read a local file, or standard input, in consecutive parts of at most
+    part_size bytes, like iter_s3_file_parts does for S3 objects.
+
+    Args:
+        path (str): A 'file://' URI, or '-' for standard input.
+        part_size (int): The size in bytes of each read.
+
+    Yields:
+        bytes: Consecutive parts of the content of the file.
+
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    with open_local_stream(path) as stream:
+        while part := stream.read(part_size):
+            yield part
+
+
+def write_local_file(chunks, destination):
+    """
+    Write a stream of byte chunks to a local file, or to standard output.
+
+    A file is written under a temporary name next to it and renamed once
+    every chunk has been written, so a failed run never leaves a partial
+    file at the destination, as an aborted multipart upload does not on S3.
+
+    Args:
+        chunks (Iterable[bytes]): The content to write.
+        destination (str): A 'file://' URI, or '-' for standard output.
+
+    Returns:
+        str: The destination.
+
+    Raises:
+        OSError: If the file cannot be written.
+    """
+    if destination == STDIO_PATH:
+        for chunk in chunks:
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+        return destination
+
+    path = local_file_path(destination)
+    directory = os.path.dirname(path) or "."
+    try:
+        # Like an S3 key, a destination needs no existing directory
+        os.makedirs(directory, exist_ok=True)
+        temporary_path = os.path.join(
+            directory,
+            f".{os.path.basename(path)}.{secrets.token_hex(8)}",
+        )
+        # Created like open() would, so the file gets the umask's mode
+        # rather than the private mode of tempfile's files
+        file = open(
+            os.open(
+                temporary_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666
+            ),
+            "wb",
+        )
+    except OSError as e:
+        logging.error(f"Failed to write {destination}: {e}")
+        raise
+    try:
+        with file:
+            for chunk in chunks:
+                file.write(chunk)
+            try:
+                # Overwriting a file keeps its mode, as open() would
+                os.chmod(file.fileno(), os.stat(path).st_mode & 0o7777)
+            except FileNotFoundError:
+                pass
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+    return destination
+
+
+class MemoryFile(io.RawIOBase):
+    """
+    A seekable, read-only file over a buffer such as a memory map, for the
+    streaming engines to read content in place instead of from a copy, as
+    io.BytesIO would make of anything but bytes.
+    """
+
+    def __init__(self, content):
+        self._view = memoryview(content)
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(offset, 0)
+        return self._position
+
+    def readinto(self, buffer):
+        data = self._view[self._position : self._position + len(buffer)]
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        # Release the buffer, so a memory map can be closed after the file
+        self._view.release()
+        super().close()
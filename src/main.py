@@ -1,24 +1,442 @@
+import io
 import logging
 import json
+from contextlib import contextmanager
+from functools import partial
+from src.compression import (
+    MAGIC_LENGTH,
+    compress_chunks,
+    decompress_bytes,
+    detect_compression,
+)
 from src.file_handling import (
-    download_s3_file_and_convert_to_pandas_dataframe,
+    DEFAULT_DOWNLOAD_CONCURRENCY,
+    DEFAULT_DOWNLOAD_PART_SIZE,
+    DEFAULT_PART_SIZE,
+    DEFAULT_UPLOAD_CONCURRENCY,
+    S3RangeFile,
+    bytes_to_dataframe,
     dataframe_to_bytes,
+    dataframe_to_chunks,
+    download_s3_file_bytes,
+    iter_s3_file_parts,
+    open_s3_file_stream,
+    upload_stream_to_s3,
+)
+from src.instrumentation import collect_metrics, count_bytes, stage
+from src.local_files import (
+    STDIO_PATH,
+    MemoryFile,
+    is_local_path,
+    iter_local_file_parts,
+    local_file_path,
+    open_local_content,
+    open_local_stream,
+    write_local_file,
+)
+from src.partitioning import PARTITIONED_FILE_TYPES, obfuscate_partitioned
+from src.stdlib_engine import obfuscate_small_file, DEFAULT_FAST_PATH_MAX_BYTES
+from src.streaming import (
+    obfuscate_csv_parts,
+    obfuscate_csv_stream,
+    obfuscate_ndjson_parts,
+    obfuscate_ndjson_stream,
+    infer_csv_dtypes,
+    CSV_DTYPE_SAMPLE_BYTES,
+    DEFAULT_CHUNKSIZE,
+)
+from src.utils import (
+    NDJSON_FILE_TYPES,
+    apply_csv_dtypes,
+    csv_read_options,
+    get_file_type,
+    read_json_input,
+    read_optional_input,
+    obfuscate_pii_fields,
 )
-from src.utils import read_json_input, obfuscate_pii_fields
 
 logging.basicConfig(level=logging.INFO)
 
 
+def obfuscate_file_content(
+    file_content,
+    file_type,
+    pii_fields,
+    fast_path_max_bytes=DEFAULT_FAST_PATH_MAX_BYTES,
+    masking=None,
+    compression_level=None,
+    csv_engine="pandas",
+):
+    """
+    Obfuscate PII fields in raw file content and return it in the same format.
+
+    Parquet files are obfuscated row group by row group with pyarrow and
+    JSON Lines files are obfuscated record by record. CSV and
+    JSON files no larger than fast_path_max_bytes, and CSV files no larger
+    than streaming.CSV_DTYPE_SAMPLE_BYTES, are obfuscated with the
+    standard library engine where it can reproduce the pandas output exactly;
+    everything else is loaded into a pandas DataFrame and converted back.
+    Fields with a masking strategy other than 'mask', and CSV files read
+    with the 'strings' engine, always skip the standard library engine.
+    With the 'splice' engine, CSV files are masked in place without being
+    parsed (see src.splice_engine).
+
+    Gzip, zstd and bz2 compressed content is detected from its first bytes
+    and the output is compressed with the same codec. Compressed CSV and
+    JSON Lines files are decompressed and compressed incrementally as they
+    are masked.
+
+    The content can be a memory map of a local file (see
+    local_files.open_local_content), which the Parquet, JSON Lines, splice
+    and streaming engines read in place rather than copying.
+
+    Args:
+        file_content (bytes | mmap.mmap): The content of the file to obfuscate.
+        file_type (str): Type of the file ('csv', 'parquet', 'json', 'jsonl', 'ndjson').
+        pii_fields (list): A list of fields to obfuscate.
+        fast_path_max_bytes (int): The largest file, in bytes, to try without pandas.
+        masking (dict): Optional masking strategy for each field, if not the default 'mask'.
+        compression_level (int): The level to compress the output at, or None for the codec's default.
+        csv_engine (str): 'pandas' to infer column types, 'strings' to read every column as text, or 'splice' to copy everything but the PII cells unchanged (see utils.csv_read_options).
+
+    Returns:
+        bytes: The obfuscated file content in its original format.
+
+    Raises:
+        ValueError: If the file type is unsupported, the file is empty or
+                    specified columns are missing.
+    """
+    compression = detect_compression(file_content[:MAGIC_LENGTH])
+    if file_type in NDJSON_FILE_TYPES or (file_type == "csv" and compression):
+        obfuscate_stream = (
+            partial(obfuscate_csv_stream, csv_engine=csv_engine)
+            if file_type == "csv"
+            else obfuscate_ndjson_stream
+        )
+        with stage(
+            f"{file_type}_stream", bytes_in=len(file_content)
+        ) as metrics, io.BufferedReader(MemoryFile(file_content)) as stream:
+            result_bytes = b"".join(
+                obfuscate_stream(
+                    stream,
+                    pii_fields,
+                    masking=masking,
+                    compression_level=compression_level,
+                )
+            )
+            metrics["bytes_out"] = len(result_bytes)
+        return result_bytes
+
+    if compression:
+        # Parquet and JSON files need the whole document to be decompressed
+        with stage("decompress", bytes_in=len(file_content)) as metrics:
+            file_content, _ = decompress_bytes(file_content)
+            metrics["bytes_out"] = len(file_content)
+        return b"".join(
+            compress_chunks(
+                [
+                    obfuscate_file_content(
+                        file_content,
+                        file_type,
+                        pii_fields,
+                        fast_path_max_bytes,
+                        masking,
+                        csv_engine=csv_engine,
+                    )
+                ],
+                compression,
+                compression_level,
+            )
+        )
+
+    if file_type == "parquet":
+        # pyarrow is only imported once a Parquet file is processed
+        from src.parquet_engine import obfuscate_parquet_bytes
+
+        with stage(
+            "parquet_row_groups", bytes_in=len(file_content)
+        ) as metrics:
+            result_bytes = obfuscate_parquet_bytes(
+                file_content, pii_fields, masking
+            )
+            metrics["bytes_out"] = len(result_bytes)
+        return result_bytes
+
+    if file_type == "csv" and csv_engine == "splice":
+        from src.splice_engine import obfuscate_csv_splice
+
+        with stage("splice", bytes_in=len(file_content)) as metrics:
+            result_bytes = b"".join(
+                obfuscate_csv_splice(file_content, pii_fields, masking)
+            )
+            metrics["bytes_out"] = len(result_bytes)
+        return result_bytes
+
+    # The standard library engine infers types the way the pandas engine
+    # does, from the whole file, so a CSV file must fit in the head the
+    # pandas engine infers them from
+    if (
+        not masking
+        and (file_type != "csv" or csv_engine == "pandas")
+        and len(file_content) <= fast_path_max_bytes
+        and (file_type != "csv" or len(file_content) <= CSV_DTYPE_SAMPLE_BYTES)
+    ):
+        with stage("fast_path", bytes_in=len(file_content)) as metrics:
+            # A memory map is copied, as the file is small
+            result_bytes = obfuscate_small_file(
+                bytes(file_content), file_type, pii_fields
+            )
+            metrics["bytes_out"] = len(result_bytes or b"")
+        if result_bytes is not None:
+            return result_bytes
+
+    with stage("parse", bytes_in=len(file_content)) as metrics:
+        df = bytes_to_dataframe(
+            file_content, file_type, csv_read_options(pii_fields, csv_engine)
+        )
+        if file_type == "csv" and csv_engine == "pandas":
+            df = apply_csv_dtypes(df, infer_csv_dtypes(file_content))
+        metrics["rows"] = len(df)
+    with stage("mask", rows=len(df)):
+        obfuscated_df = obfuscate_pii_fields(df, pii_fields, masking)
+    with stage("serialise", rows=len(df)) as metrics:
+        result_bytes = dataframe_to_bytes(obfuscated_df, file_type)
+        metrics["bytes_out"] = len(result_bytes)
+    return result_bytes
+
+
+def obfuscate_file_chunks(
+    file_path,
+    file_type,
+    pii_fields,
+    masking=None,
+    compression_level=None,
+    download_part_size=DEFAULT_DOWNLOAD_PART_SIZE,
+    download_concurrency=DEFAULT_DOWNLOAD_CONCURRENCY,
+    csv_engine="pandas",
+):
+    """
+    Obfuscate PII fields in an S3 or local file and yield the output in
+    chunks.
+
+    CSV and JSON Lines files are downloaded with concurrent ranged GETs,
+    re-split on record boundaries and masked block by block in parallel.
+    Parquet files are read footer first, fetching only the column chunks
+    each row group needs, and written back one row group at a time. JSON
+    files are converted back in slices of rows.
+    None of the formats build the complete output in a single buffer.
+    Compressed files are written back with the same codec, compressing
+    each chunk as it is produced. Local files are read in parts of
+    download_part_size, or through a pyarrow memory map for Parquet.
+
+    Args:
+        file_path (str): The S3 URI or 'file://' URI of the file to obfuscate, or '-' for standard input.
+        file_type (str): Type of the file ('csv', 'parquet', 'json', 'jsonl', 'ndjson').
+        pii_fields (list): A list of fields to obfuscate.
+        masking (dict): Optional masking strategy for each field, if not the default 'mask'.
+        compression_level (int): The level to compress the output at, or None for the codec's default.
+        download_part_size (int): The size in bytes of each ranged GET.
+        download_concurrency (int): The most ranged GETs in flight at once.
+        csv_engine (str): 'pandas' to infer column types, 'strings' to read every column as text, or 'splice' to copy everything but the PII cells unchanged (see utils.csv_read_options).
+
+    Yields:
+        bytes: Consecutive chunks of the obfuscated file content.
+    """
+    if file_type == "csv" or file_type in NDJSON_FILE_TYPES:
+        obfuscate_parts = (
+            partial(obfuscate_csv_parts, csv_engine=csv_engine)
+            if file_type == "csv"
+            else obfuscate_ndjson_parts
+        )
+        parts = (
+            iter_local_file_parts(file_path, download_part_size)
+            if is_local_path(file_path)
+            else iter_s3_file_parts(
+                file_path, download_part_size, download_concurrency
+            )
+        )
+        try:
+            yield from obfuscate_parts(
+                parts,
+                pii_fields,
+                masking=masking,
+                compression_level=compression_level,
+            )
+        finally:
+            parts.close()
+        return
+
+    if file_type == "parquet" and file_path != STDIO_PATH:
+        from src.parquet_engine import obfuscate_parquet_row_groups
+
+        if is_local_path(file_path):
+            import pyarrow as pa
+
+            source = pa.memory_map(local_file_path(file_path))
+            tail = source.read_at(4, max(source.size() - 4, 0))
+        else:
+            source = S3RangeFile(
+                file_path, max_concurrency=download_concurrency
+            )
+            tail = source.tail
+        if tail.endswith(b"PAR1"):
+            # An uncompressed Parquet file can be read by range
+            with source:
+                yield from obfuscate_parquet_row_groups(
+                    source, pii_fields, masking
+                )
+            return
+        source.close()
+
+    with _open_content(
+        file_path, download_part_size, download_concurrency
+    ) as content:
+        file_content, compression = decompress_bytes(content)
+        if file_type == "parquet":
+            from src.parquet_engine import obfuscate_parquet_row_groups
+
+            chunks = obfuscate_parquet_row_groups(
+                io.BytesIO(file_content), pii_fields, masking
+            )
+        else:
+            df = bytes_to_dataframe(file_content, file_type)
+            obfuscated_df = obfuscate_pii_fields(df, pii_fields, masking)
+            chunks = dataframe_to_chunks(obfuscated_df, file_type)
+        yield from compress_chunks(chunks, compression, compression_level)
+
+
+@contextmanager
+def _open_content(
+    file_path,
+    download_part_size=DEFAULT_DOWNLOAD_PART_SIZE,
+    download_concurrency=DEFAULT_DOWNLOAD_CONCURRENCY,
+):
+    """
+    Download an S3 file, or memory-map a local one, for the duration of the
+    block.
+    """
+    if is_local_path(file_path):
+        logging.info(f"Reading local file: {file_path}.")
+        with open_local_content(file_path) as file_content:
+            yield file_content
+        return
+
+    logging.info(f"Downloading file from S3 path: {file_path}.")
+    with stage("download") as metrics:
+        file_content = download_s3_file_bytes(
+            file_path, download_part_size, download_concurrency
+        )
+        metrics["bytes_out"] = len(file_content)
+    yield file_content
+
+
+def _partitioned_chunks(file_path, file_type, pii_fields, options):
+    """
+    Obfuscate a file on worker processes as main does, keeping a local
+    file mapped until every chunk has been yielded.
+    """
+    with _open_content(file_path, **_download_settings(options)) as content:
+        yield from obfuscate_partitioned(
+            content,
+            file_type,
+            pii_fields,
+            options["masking"],
+            options["compression_level"],
+            options["workers"],
+            csv_engine=options["csv_engine"] or "pandas",
+        )
+
+
+def _download_settings(options):
+    """
+    Work out the ranged download settings from the optional input settings.
+    """
+    return {
+        "download_part_size": int(
+            (options["download_part_size_mb"] or 0) * 1024 * 1024
+            or DEFAULT_DOWNLOAD_PART_SIZE
+        ),
+        "download_concurrency": options["download_concurrency"]
+        or DEFAULT_DOWNLOAD_CONCURRENCY,
+    }
+
+
+def _resolve_pii_fields(file_path, file_type, pii_fields, options):
+    """
+    Add the PII columns detected in a file to the listed PII fields when
+    'detect_pii' is set.
+
+    Raises:
+        ValueError: If no PII fields are listed or detected.
+    """
+    if not options["detect_pii"]:
+        return pii_fields
+
+    from src.detection import detect_file_pii
+
+    detected = detect_file_pii(file_path, file_type)
+    pii_fields = list(pii_fields) + [
+        field for field in detected if field not in pii_fields
+    ]
+    if not pii_fields:
+        logging.error(f"No PII fields listed or detected in {file_path}.")
+        raise ValueError(
+            "Invalid input: no 'pii_fields' were listed or detected in the file."
+        )
+    return pii_fields
+
+
+def _uses_partitions(file_type, options):
+    """
+    Work out whether a file is split between worker processes, which needs
+    more than one worker and a format that can be partitioned.
+    """
+    return (
+        options["workers"] or 1
+    ) > 1 and file_type in PARTITIONED_FILE_TYPES
+
+
 def main(input_json):
     """
     Main function to process an input JSON, download the specified file,
     obfuscate PII fields, and return the obfuscated file as byte stream object.
 
+    If the input JSON includes a 'destination' S3 URI, the obfuscated file
+    is streamed straight to it with a multipart upload instead of being
+    returned, so the complete output is never held in memory. The optional
+    'part_size_mb' and 'upload_concurrency' keys tune the upload, and
+    'fast_path_max_bytes' sets the largest CSV or JSON file obfuscated
+    without pandas. The optional 'masking' key picks a masking strategy
+    (such as 'hash' or 'email') for individual PII fields,
+    'compression_level' sets the level compressed files are written back
+    at, and 'download_part_size_mb' and 'download_concurrency' tune the
+    concurrent ranged downloads. With 'workers' above 1, a CSV, JSON Lines
+    or Parquet file is downloaded whole, split into partitions and masked
+    on that many processes. Setting 'csv_engine' to 'strings' reads every
+    CSV column as text, so the values of columns that are not masked are
+    written back unchanged, and 'splice' copies every byte outside the PII
+    cells to the output without parsing the file into a DataFrame.
+
+    With 'detect_pii' set to true, the columns that a sample of the file's
+    rows shows to hold emails, phone numbers, IBANs, UK National Insurance
+    numbers or UK postcodes are obfuscated too, and 'pii_fields' can be
+    left out (see src.detection and propose_pii_fields).
+
+    The file and the destination can also be 'file://' URIs, which are read
+    through a memory map and written without S3, or '-' for standard input
+    and output. Standard input needs the 'file_type' key, as it has no
+    extension to tell the type from.
+
+    The wall time, CPU time, bytes, rows and memory of each stage are passed
+    to any hooks registered with src.instrumentation.add_metrics_hook; see
+    also main_with_metrics.
+
     Args:
         input_json (str): A JSON string specifying the S3 file path and PII fields to obfuscate.
 
     Returns:
-        bytes: The obfuscated file content in its original format.
+        bytes | str: The obfuscated file content in its original format, or
+                     the destination URI when a destination is provided.
 
     Raises:
         Exception: If any error occurs during the process.
@@ -29,25 +447,87 @@ def main(input_json):
         # Parse the input JSON
         logging.info("Parsing input JSON.")
         file_path, pii_fields = read_json_input(input_json)
-
-        # Download the file and convert to a DataFrame
-        logging.info(
-            f"Downloading and converting file from S3 path: {file_path}."
-        )
-        df = download_s3_file_and_convert_to_pandas_dataframe(file_path)
-
-        # Obfuscate specified fields
-        logging.info(f"Obfuscating PII fields: {pii_fields}.")
-        obfuscated_df = obfuscate_pii_fields(df, pii_fields)
-
-        # Convert the obfuscated DataFrame back to bytes
-        file_type = file_path.split(".")[
-            -1
-        ].lower()  # Assumes the format is the file extension
-        logging.info(
-            f"Converting obfuscated DataFrame to bytes for file type: {file_type}."
+        options = read_optional_input(input_json)
+        # Assumes the format is the file extension unless it is given
+        file_type = options["file_type"] or get_file_type(file_path)
+        pii_fields = _resolve_pii_fields(
+            file_path, file_type, pii_fields, options
         )
-        result_bytes = dataframe_to_bytes(obfuscated_df, file_type)
+        download_settings = _download_settings(options)
+        csv_engine = options["csv_engine"] or "pandas"
+
+        if options["destination"]:
+            # Stream the obfuscated output straight to the destination
+            logging.info(
+                f"Obfuscating PII fields: {pii_fields} and writing to {options['destination']}."
+            )
+            if _uses_partitions(file_type, options):
+                chunks = _partitioned_chunks(
+                    file_path, file_type, pii_fields, options
+                )
+            else:
+                chunks = obfuscate_file_chunks(
+                    file_path,
+                    file_type,
+                    pii_fields,
+                    options["masking"],
+                    options["compression_level"],
+                    **download_settings,
+                    csv_engine=csv_engine,
+                )
+            # Downloading, masking and uploading overlap, so they are one stage
+            with stage("obfuscate_and_upload") as metrics:
+                if is_local_path(options["destination"]):
+                    destination = write_local_file(
+                        count_bytes(chunks, metrics), options["destination"]
+                    )
+                else:
+                    destination = upload_stream_to_s3(
+                        count_bytes(chunks, metrics),
+                        options["destination"],
+                        part_size=int(
+                            (options["part_size_mb"] or 0) * 1024 * 1024
+                            or DEFAULT_PART_SIZE
+                        ),
+                        max_concurrency=options["upload_concurrency"]
+                        or DEFAULT_UPLOAD_CONCURRENCY,
+                    )
+            logging.info("Obfuscation process completed successfully.")
+            return destination
+
+        # Obfuscate specified fields and convert back to bytes
+        if _uses_partitions(file_type, options):
+            logging.info(
+                f"Splitting the file between {options['workers']} worker processes."
+            )
+            with stage("partitioned_mask") as metrics:
+                result_bytes = b"".join(
+                    _partitioned_chunks(
+                        file_path, file_type, pii_fields, options
+                    )
+                )
+                metrics["bytes_out"] = len(result_bytes)
+            logging.info("Obfuscation process completed successfully.")
+            return result_bytes
+
+        fast_path_max_bytes = options["fast_path_max_bytes"]
+        with _open_content(file_path, **download_settings) as file_content:
+            logging.info(
+                f"Obfuscating PII fields: {pii_fields} for file type: {file_type}."
+            )
+            result_bytes = obfuscate_file_content(
+                file_content,
+                file_type,
+                pii_fields,
+                fast_path_max_bytes=(
+                    DEFAULT_FAST_PATH_MAX_BYTES
+                    if fast_path_max_bytes is None
+                    else fast_path_max_bytes
+                ),
+                masking=options["masking"],
+                compression_level=options["compression_level"],
+                csv_engine=csv_engine,
+            )
 
         logging.info("Obfuscation process completed successfully.")
         return result_bytes
@@ -59,6 +539,137 @@ def main(input_json):
         )
         raise
 
+
+def main_with_metrics(input_json):
+    """
+    Run main and return its result together with the metrics of each stage.
+
+    Stages run by other threads at the same time, such as other calls to
+    main, are collected too, so concurrent callers should register their
+    own hook with src.instrumentation.add_metrics_hook instead.
+
+    Args:
+        input_json (str): A JSON string specifying the S3 file path and PII fields to obfuscate.
+
+    Returns:
+        tuple: The result of main, and a list with the metrics of each
+               stage (see src.instrumentation.METRIC_FIELDS) in the order
+               they finished.
+    """
+    with collect_metrics() as metrics:
+        result = main(input_json)
+    return result, metrics
+
+
+def propose_pii_fields(input_json):
+    """
+    Detect the PII columns of a file without obfuscating it, e.g. to review
+    them before listing them as 'pii_fields'.
+
+    A bounded sample of the file's rows is checked for emails, phone
+    numbers, IBANs, UK National Insurance numbers and UK postcodes, so the
+    cost does not grow with the size of the file (see
+    src.detection.sample_file). 'pii_fields' may be left out of the input.
+
+    Args:
+        input_json (str): A JSON string with the same keys as main accepts.
+
+    Returns:
+        dict: The kind of PII detected in each PII column, e.g.
+              {"email_address": "email"}.
+
+    Raises:
+        ValueError: If the input is invalid or the file cannot be sampled.
+    """
+    from src.detection import detect_file_pii
+
+    try:
+        input_data = json.loads(input_json)
+    except (TypeError, json.JSONDecodeError):
+        input_data = None
+    if isinstance(input_data, dict):
+        input_json = json.dumps({**input_data, "detect_pii": True})
+    file_path, _ = read_json_input(input_json)
+    options = read_optional_input(input_json)
+    return detect_file_pii(
+        file_path, options["file_type"] or get_file_type(file_path)
+    )
+
+
+def main_stream(input_json, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Streaming variant of main that yields the obfuscated file in chunks.
+
+    The S3 object, local file or standard input is read incrementally and
+    PII fields are obfuscated one chunk of rows at a time, so peak memory is
+    bounded by the chunk size rather than the file size. Only CSV and JSON
+    Lines files are supported in this mode.
+
+    Args:
+        input_json (str): A JSON string specifying the S3 file path and PII fields to obfuscate.
+        chunksize (int): The number of rows to obfuscate per chunk.
+
+    Yields:
+        bytes: Consecutive chunks of the obfuscated file content.
+
+    Raises:
+        ValueError: If the file type is not supported in streaming mode.
+        Exception: If any other error occurs during the process.
+    """
+    try:
+        logging.info("Starting the streaming obfuscation process.")
+        file_path, pii_fields = read_json_input(input_json)
+        options = read_optional_input(input_json)
+
+        file_type = options["file_type"] or get_file_type(file_path)
+        pii_fields = _resolve_pii_fields(
+            file_path, file_type, pii_fields, options
+        )
+        if file_type == "csv":
+            obfuscate_stream = partial(
+                obfuscate_csv_stream,
+                csv_engine=options["csv_engine"] or "pandas",
+            )
+        elif file_type in NDJSON_FILE_TYPES:
+            obfuscate_stream = obfuscate_ndjson_stream
+        else:
+            raise ValueError(
+                f"Unsupported file type for streaming: {file_type}. Supported file types are csv, jsonl and ndjson."
+            )
+
+        if is_local_path(file_path):
+            stream = open_local_stream(file_path)
+        else:
+            download_settings = _download_settings(options)
+            stream = open_s3_file_stream(
+                file_path,
+                download_settings["download_part_size"],
+                download_settings["download_concurrency"],
+            )
+        try:
+            logging.info(
+                f"Obfuscating PII fields: {pii_fields} in chunks of {chunksize} rows."
+            )
+            yield from obfuscate_stream(
+                stream,
+                pii_fields,
+                chunksize,
+                options["masking"],
+                options["compression_level"],
+            )
+        finally:
+            stream.close()
+
+        logging.info("Streaming obfuscation process completed successfully.")
+
+    except Exception as e:
+        logging.error(
+            f"An error occurred during the streaming obfuscation process: {e}",
+            exc_info=True,
+        )
+        raise
+
+
 if __name__ == "__main__":
     # Hardcoded example test input for debugging
     json_string = json.dumps({
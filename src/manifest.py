@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+from src.file_handling import get_s3_client, split_s3_path
+
+logging.basicConfig(level=logging.INFO)
+
+# Bumped whenever a change to the obfuscator changes its output, so
+# manifests written by earlier versions are no longer current
+OUTPUT_VERSION = 1
+
+
+def config_hash(pii_fields, masking=None, **settings):
+    """
+    Fingerprint the settings that decide what an obfuscated file contains.
+
+    The masking strategies are resolved first, so leaving a field out of
+    masking and setting it to 'mask' give the same fingerprint, as do the
+    PII fields in any order.
+
+    Args:
+        pii_fields (list): A list of fields to obfuscate.
+        masking (dict): Optional masking strategy for each field, if not the default 'mask'.
+        **settings: Any other settings that change the output, such as
+            'compression_level'. Settings that are None are left out.
+
+    Returns:
+        str: A hex digest that changes whenever the output would.
+
+    Raises:
+        ValueError: If the masking strategies are invalid.
+    """
+    from src.masking import resolve_masking
+
+    config = {
+        "version": OUTPUT_VERSION,
+        "pii_fields": sorted(set(pii_fields)),
+        "masking": resolve_masking(pii_fields, masking),
+        "settings": {
+            name: value
+            for name, value in settings.items()
+            if value is not None
+        },
+    }
+    return hashlib.sha256(
+        json.dumps(config, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def head_s3_etag(s3_path):
+    """
+    Read the ETag of an S3 object with a HeadObject request, without
+    downloading it.
+
+    Args:
+        s3_path (str): The S3 URI of the object.
+
+    Returns:
+        str: The object's ETag.
+
+    Raises:
+        ClientError: If the object cannot be read.
+    """
+    bucket_name, key = split_s3_path(s3_path)
+    try:
+        return get_s3_client().head_object(Bucket=bucket_name, Key=key)[
+            "ETag"
+        ]
+    except ClientError as e:
+        logging.error(f"Failed to read the metadata of {s3_path}: {e}")
+        raise
+
+
+class Manifest:
+    """
+    A record, kept in a SQLite file, of the source objects that have been
+    obfuscated, so unchanged objects can be skipped when a job is re-run.
+
+    Each source URI is stored with the ETag it had, the fingerprint of
+    the settings it was obfuscated with (see config_hash) and where its
+    output was written. An object's output is current only while all three
+    still match, so changing the object, the PII fields, a masking strategy
+    or the destination makes it due again. An object should only be
+    recorded once its output has been written. The manifest is thread-safe
+    and can be used as a context manager.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS outputs ("
+                "source TEXT PRIMARY KEY, "
+                "etag TEXT NOT NULL, "
+                "config_hash TEXT NOT NULL, "
+                "destination TEXT, "
+                "updated_at TEXT NOT NULL)"
+            )
+
+    def is_current(self, source, etag, config_hash, destination):
+        """
+        Return whether a source object has already been obfuscated in its
+        current version with the given settings and written to the given
+        destination.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT etag, config_hash, destination FROM outputs "
+                "WHERE source = ?",
+                (source,),
+            ).fetchone()
+        return row == (etag, config_hash, destination)
+
+    def record(self, source, etag, config_hash, destination):
+        """
+        Record that a version of a source object has been obfuscated and
+        its output written to a destination.
+        """
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO outputs "
+                "(source, etag, config_hash, destination, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    source,
+                    etag,
+                    config_hash,
+                    destination,
+                    datetime.now(timezone.utc).isoformat(),
+                ),
+            )
+
+    def close(self):
+        """
+        Close the SQLite connection.
+        """
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
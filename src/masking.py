@@ -0,0 +1,582 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+import pyarrow as pa
+import pyarrow.compute as pc
+from dotenv import load_dotenv
+from src.utils import MASK_VALUE, MISSING_VALUE
+
+logging.basicConfig(level=logging.INFO)
+
+HASH_KEY_ENV_VAR = "GDPR_OBFUSCATOR_HASH_KEY"
+HASH_ALGORITHMS = ["blake2b", "hmac-sha256"]
+DEFAULT_HASH_LENGTH = 32
+# The longest key keyed BLAKE2b accepts
+BLAKE2B_MAX_KEY_BYTES = hashlib.blake2b.MAX_KEY_SIZE
+TOKEN_CACHE_SIZE_ENV_VAR = "GDPR_OBFUSCATOR_TOKEN_CACHE_SIZE"
+DEFAULT_TOKEN_CACHE_SIZE = 100_000
+
+# The kinds of PII the 'redact' strategy finds inside free text, as
+# unanchored RE2 patterns. Unlike src.detection.DETECTORS, which check
+# whole values, these have no checksum validators, so they err towards
+# redacting number sequences that only look like phone numbers or IBANs.
+REDACTION_PATTERNS = {
+    "email": r"\b[A-Za-z0-9._%+'-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}\b",
+    "phone": r"(?:\+[0-9]{1,3}[ .-]?|\b0)[0-9](?:[ .()-]{0,2}[0-9]){8,12}\b",
+    "iban": r"\b[A-Z]{2}[0-9]{2}(?: ?[A-Z0-9]{4}){2,7}(?: ?[A-Z0-9]{1,3})?\b",
+    "uk_ni_number": r"\b[A-CEGHJ-PR-TW-Z][A-CEGHJ-NPR-TW-Z] ?[0-9]{2} ?[0-9]{2} ?[0-9]{2} ?[A-D]\b",
+    "uk_postcode": r"\b[A-Z]{1,2}[0-9][A-Z0-9]? ?[0-9][A-Z]{2}\b",
+}
+
+# The options each strategy accepts, with their defaults (None if required)
+STRATEGIES = {
+    "mask": {},
+    "hash": {"algorithm": "blake2b", "length": DEFAULT_HASH_LENGTH},
+    "email": {},
+    "keep_last": {"keep": 4},
+    "truncate": {"length": None},
+    "redact": {"patterns": list(REDACTION_PATTERNS), "terms": []},
+}
+
+
+def resolve_masking(pii_fields, masking=None):
+    """
+    Work out the masking strategy and options for every PII field.
+
+    Each entry of masking maps a PII field to either a strategy name or a
+    dict with a 'strategy' key plus that strategy's options, for example
+    {"email_address": "email", "phone": {"strategy": "keep_last", "keep": 4}}.
+    Fields without an entry use the 'mask' strategy.
+
+    Args:
+        pii_fields (list): A list of fields to obfuscate.
+        masking (dict): The masking strategy for each field, if not 'mask'.
+
+    Returns:
+        dict: The strategy options for each PII field, including a 'strategy' key.
+
+    Raises:
+        ValueError: If a strategy, option or field name is invalid.
+    """
+    masking = masking or {}
+    if not isinstance(masking, dict):
+        logging.error("'masking' is not a JSON object.")
+        raise ValueError(
+            "Invalid input: 'masking' must map PII fields to strategies."
+        )
+
+    unknown_fields = [field for field in masking if field not in pii_fields]
+    if unknown_fields:
+        logging.error(f"Masking for non-PII fields: {unknown_fields}")
+        raise ValueError(
+            f"Invalid input: 'masking' refers to fields not in 'pii_fields': {', '.join(unknown_fields)}"
+        )
+
+    resolved = {}
+    for field in pii_fields:
+        settings = masking.get(field, "mask")
+        if isinstance(settings, str):
+            settings = {"strategy": settings}
+        if not isinstance(settings, dict):
+            raise ValueError(
+                f"Invalid input: masking for '{field}' must be a strategy name or object."
+            )
+
+        strategy = settings.get("strategy", "mask")
+        if strategy not in STRATEGIES:
+            logging.error(f"Unknown masking strategy: {strategy}")
+            raise ValueError(
+                f"Unknown masking strategy '{strategy}' for '{field}'. Supported strategies are {', '.join(STRATEGIES)}."
+            )
+
+        options = {**STRATEGIES[strategy], **settings, "strategy": strategy}
+        unknown_options = set(options) - set(STRATEGIES[strategy]) - {
+            "strategy"
+        }
+        if unknown_options:
+            raise ValueError(
+                f"Invalid input: unknown options for '{strategy}' masking: {', '.join(sorted(unknown_options))}"
+            )
+        if strategy == "redact":
+            _check_redaction_options(field, options)
+            resolved[field] = options
+            continue
+        for name, value in options.items():
+            if name not in ("strategy", "algorithm") and (
+                not isinstance(value, int)
+                or isinstance(value, bool)
+                or value < 1
+            ):
+                raise ValueError(
+                    f"Invalid input: '{name}' for '{field}' must be a positive integer."
+                )
+        if strategy == "hash" and options["algorithm"] not in HASH_ALGORITHMS:
+            raise ValueError(
+                f"Unknown hash algorithm '{options['algorithm']}'. Supported algorithms are {', '.join(HASH_ALGORITHMS)}."
+            )
+
+        resolved[field] = options
+    return resolved
+
+
+def _check_redaction_options(field, options):
+    """
+    Check the patterns and terms of a field's 'redact' strategy.
+    """
+    patterns, terms = options["patterns"], options["terms"]
+    if not isinstance(patterns, list) or not isinstance(terms, list):
+        raise ValueError(
+            f"Invalid input: 'patterns' and 'terms' for '{field}' must be lists."
+        )
+    unknown_patterns = [
+        pattern for pattern in patterns if pattern not in REDACTION_PATTERNS
+    ]
+    if unknown_patterns:
+        logging.error(f"Unknown redaction patterns: {unknown_patterns}")
+        raise ValueError(
+            f"Unknown redaction patterns for '{field}': {', '.join(map(str, unknown_patterns))}. Supported patterns are {', '.join(REDACTION_PATTERNS)}."
+        )
+    if not all(isinstance(term, str) and term.strip() for term in terms):
+        raise ValueError(
+            f"Invalid input: 'terms' for '{field}' must be non-empty strings."
+        )
+    if not patterns and not terms:
+        raise ValueError(
+            f"Invalid input: 'redact' masking for '{field}' needs 'patterns' or 'terms'."
+        )
+
+
+_redaction_regexes = {}
+
+
+def redaction_regex(patterns, terms=()):
+    """
+    Combine the patterns and dictionary terms of a 'redact' strategy into a
+    single RE2 regular expression, so every kind of PII is found in one
+    pass over each value.
+
+    Terms are matched case-insensitively as whole words, longest first, so
+    'Acme Corp' is redacted whole rather than as 'Acme'. RE2's word
+    boundaries only know ASCII letters, so a term that starts or ends with
+    another letter, such as 'Émile' or 'Zoë', has no boundary on that side
+    and is also redacted inside longer words rather than never matched.
+    RE2 compiles the alternation into one automaton, so adding terms does
+    not add passes over the text.
+
+    Args:
+        patterns (list): Names of REDACTION_PATTERNS to match.
+        terms (list): Literal terms to match, such as customer names.
+
+    Returns:
+        str: The combined regular expression.
+    """
+    key = (tuple(patterns), tuple(terms))
+    regex = _redaction_regexes.get(key)
+    if regex is None:
+        alternatives = [f"(?:{REDACTION_PATTERNS[name]})" for name in patterns]
+        escaped_terms = []
+        for term in sorted(set(terms), key=len, reverse=True):
+            escaped = re.escape(term)
+            if re.match(r"\w", term, re.ASCII):
+                escaped = r"\b" + escaped
+            if re.search(r"\w$", term, re.ASCII):
+                escaped += r"\b"
+            escaped_terms.append(escaped)
+        if escaped_terms:
+            alternatives.append(f"(?i:{'|'.join(escaped_terms)})")
+        regex = _redaction_regexes[key] = "|".join(alternatives)
+    return regex
+
+
+def redact_text(values, patterns, terms=()):
+    """
+    Replace every match of the patterns and terms inside each string with
+    the mask value, keeping the rest of the text.
+
+    Args:
+        values (pa.Array): The strings to redact.
+        patterns (list): Names of REDACTION_PATTERNS to match.
+        terms (list): Literal terms to match.
+
+    Returns:
+        pa.Array: The redacted strings.
+    """
+    return pc.replace_substring_regex(
+        values, redaction_regex(patterns, terms), MASK_VALUE
+    )
+
+
+def get_hash_key():
+    """
+    Read the secret key for keyed hashing from the environment (or a .env
+    file), so the same value always maps to the same token.
+
+    Returns:
+        bytes: The hashing key.
+
+    Raises:
+        ValueError: If the key is not set.
+    """
+    load_dotenv()
+    key = os.getenv(HASH_KEY_ENV_VAR)
+    if not key:
+        logging.error(f"{HASH_KEY_ENV_VAR} is not set.")
+        raise ValueError(
+            f"Hashing requires the {HASH_KEY_ENV_VAR} environment variable to be set."
+        )
+    return key.encode("utf-8")
+
+
+class TokenCache:
+    """
+    A bounded, thread-safe least-recently-used cache of hash digests.
+
+    Digests are cached in full under the hashing algorithm and key, so one
+    cache serves every column, token length and file of a run. Each process
+    has its own cache.
+    """
+
+    def __init__(self, max_size=DEFAULT_TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._digests = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, namespace, values):
+        """
+        Look up the cached digest of each value, or None where there is none.
+        """
+        digests = []
+        with self._lock:
+            if not self.max_size:
+                self.misses += len(values)
+                return [None] * len(values)
+
+            for value in values:
+                digest = self._digests.get((namespace, value))
+                if digest is not None:
+                    self._digests.move_to_end((namespace, value))
+                digests.append(digest)
+            found = sum(digest is not None for digest in digests)
+            self.hits += found
+            self.misses += len(values) - found
+        return digests
+
+    def put_many(self, namespace, values, digests):
+        """
+        Cache the digest of each value, evicting the least recently used.
+        """
+        if not self.max_size:
+            return
+
+        with self._lock:
+            for value, digest in zip(values, digests):
+                self._digests[(namespace, value)] = digest
+            while len(self._digests) > self.max_size:
+                self._digests.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Empty the cache and reset its statistics.
+        """
+        with self._lock:
+            self._digests.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        Return the cache's size and hit-rate statistics.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._digests),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def configure_token_cache(max_size=None):
+    """
+    Replace the shared token cache with an empty one of the given size.
+    A max_size of None falls back to the GDPR_OBFUSCATOR_TOKEN_CACHE_SIZE
+    environment variable, and a max_size of 0 turns caching off.
+
+    Args:
+        max_size (int): The most digests to keep in the cache.
+    """
+    global _token_cache
+
+    with _token_cache_lock:
+        _token_cache = _new_token_cache(max_size)
+
+
+def _new_token_cache(max_size=None):
+    """
+    Build an empty token cache, sized from the environment if not given.
+    """
+    if max_size is None:
+        max_size = int(
+            os.getenv(TOKEN_CACHE_SIZE_ENV_VAR, DEFAULT_TOKEN_CACHE_SIZE)
+        )
+    return TokenCache(max_size)
+
+
+def get_token_cache():
+    """
+    Return the token cache shared by every column and file hashed in this
+    process, creating it on first use.
+    """
+    global _token_cache
+
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                _token_cache = _new_token_cache()
+    return _token_cache
+
+
+def token_cache_stats():
+    """
+    Return the size and hit-rate statistics of the shared token cache.
+
+    Returns:
+        dict: The 'size', 'max_size', 'hits', 'misses', 'evictions' and
+              'hit_rate' of the cache.
+    """
+    return get_token_cache().stats()
+
+
+def hash_values(values, algorithm="blake2b", length=DEFAULT_HASH_LENGTH):
+    """
+    Replace each value with a keyed hash token, hex encoded and cut to length.
+
+    Digests are memoized in the shared token cache, so a value seen in an
+    earlier column or file is not hashed again.
+
+    Args:
+        values (Iterable[str]): The distinct values to hash.
+        algorithm (str): 'blake2b' (keyed BLAKE2b) or 'hmac-sha256'.
+        length (int): The number of hex characters to keep from each digest.
+
+    Returns:
+        list: The token for each value, in order.
+
+    Raises:
+        ValueError: If the key is not set, or is too long for BLAKE2b.
+    """
+    key = get_hash_key()
+    if algorithm == "blake2b" and len(key) > BLAKE2B_MAX_KEY_BYTES:
+        logging.error(f"{HASH_KEY_ENV_VAR} is too long for BLAKE2b.")
+        raise ValueError(
+            f"BLAKE2b hashing needs a {HASH_KEY_ENV_VAR} of at most {BLAKE2B_MAX_KEY_BYTES} bytes; use a shorter key or 'hmac-sha256'."
+        )
+    values = list(values)
+    namespace = (algorithm, key)
+    cache = get_token_cache()
+    digests = cache.get_many(namespace, values)
+
+    missing = [i for i, digest in enumerate(digests) if digest is None]
+    if missing:
+        if algorithm == "blake2b":
+            # Keying once and copying the state avoids re-keying for every value
+            keyed = hashlib.blake2b(key=key, digest_size=64)
+        else:
+            keyed = hmac.new(key, digestmod=hashlib.sha256)
+
+        for i in missing:
+            digest = keyed.copy()
+            digest.update(values[i].encode("utf-8"))
+            digests[i] = digest.hexdigest()
+        cache.put_many(
+            namespace,
+            [values[i] for i in missing],
+            [digests[i] for i in missing],
+        )
+
+    return [digest[:length] for digest in digests]
+
+
+def transform_values(values, options):
+    """
+    Apply a masking strategy to an array of distinct string values. Apart
+    from hashing, every strategy runs as a vectorized pyarrow kernel.
+
+    Args:
+        values (pa.Array): The distinct non-null values to mask, as strings.
+        options (dict): The strategy options from resolve_masking.
+
+    Returns:
+        pa.Array: The masked value for each input value.
+    """
+    match options["strategy"]:
+        case "mask":
+            return pa.repeat(MASK_VALUE, len(values))
+        case "hash":
+            return pa.array(
+                hash_values(
+                    values.to_pylist(),
+                    options["algorithm"],
+                    options["length"],
+                ),
+                type=pa.string(),
+            )
+        case "email":
+            return pc.if_else(
+                pc.match_substring(values, "@"),
+                pc.replace_substring_regex(values, r"^.*@", MASK_VALUE + "@"),
+                MASK_VALUE,
+            )
+        case "keep_last":
+            keep = options["keep"]
+            lengths = pc.utf8_length(values)
+            return pc.if_else(
+                pc.greater(lengths, keep),
+                pc.binary_join_element_wise(
+                    pc.binary_repeat(
+                        "*", pc.max_element_wise(pc.subtract(lengths, keep), 0)
+                    ),
+                    pc.utf8_slice_codeunits(values, start=-keep),
+                    "",
+                ),
+                MASK_VALUE,
+            )
+        case "truncate":
+            return pc.utf8_slice_codeunits(values, 0, options["length"])
+        case "redact":
+            return redact_text(values, options["patterns"], options["terms"])
+
+
+def _as_strings(values):
+    """
+    Cast distinct values to strings for the string-based strategies.
+    """
+    if pa.types.is_string(values.type):
+        return values
+    try:
+        return pc.cast(values, pa.string())
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return pa.array([str(value) for value in values.to_pylist()])
+
+
+def mask_dictionary(indices, dictionary, options):
+    """
+    Mask a dictionary-encoded column by transforming only its distinct values.
+
+    Null indices become the missing value marker. The result is
+    dictionary-encoded again, so each distinct masked value is stored once.
+
+    Args:
+        indices (pa.Array): The dictionary index of each row, null where missing.
+        dictionary (pa.Array): The distinct values of the column.
+        options (dict): The strategy options from resolve_masking.
+
+    Returns:
+        pa.DictionaryArray: The masked column.
+    """
+    masked_values = pa.concat_arrays(
+        [
+            transform_values(_as_strings(dictionary), options),
+            pa.array([MISSING_VALUE]),
+        ]
+    )
+    encoded = masked_values.dictionary_encode()
+    row_indices = pc.fill_null(indices, len(dictionary))
+    return pa.DictionaryArray.from_arrays(
+        pc.take(encoded.indices, row_indices), encoded.dictionary
+    )
+
+
+def mask_series(series, options):
+    """
+    Mask a pandas Series with a masking strategy, transforming each distinct
+    value once.
+
+    Args:
+        series (pd.Series): The column to mask.
+        options (dict): The strategy options from resolve_masking.
+
+    Returns:
+        pd.Categorical: The masked column.
+    """
+    import pandas as pd
+
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    try:
+        dictionary = pa.array(uniques)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        dictionary = pa.array([str(value) for value in uniques])
+    indices = pa.array(codes, mask=codes < 0)
+    masked = mask_dictionary(indices, dictionary, options)
+    return pd.Categorical.from_codes(
+        masked.indices.to_numpy(zero_copy_only=False),
+        categories=masked.dictionary.to_pylist(),
+    )
+
+
+def mask_arrow_column_with_strategy(column, options):
+    """
+    Mask an Arrow column with a masking strategy, transforming each distinct
+    value once. Floating point NaNs are treated as missing values.
+
+    Args:
+        column (pa.ChunkedArray): The column to mask.
+        options (dict): The strategy options from resolve_masking.
+
+    Returns:
+        pa.DictionaryArray: The masked column.
+    """
+    column = column.combine_chunks()
+    if pa.types.is_floating(column.type):
+        column = pc.if_else(
+            pc.is_nan(column), pa.scalar(None, column.type), column
+        )
+    encoded = (
+        column
+        if pa.types.is_dictionary(column.type)
+        else column.dictionary_encode()
+    )
+    return mask_dictionary(encoded.indices, encoded.dictionary, options)
+
+
+def mask_values(values, options):
+    """
+    Mask a list of Python values, such as those parsed from JSON, with a
+    masking strategy, transforming each distinct value once. Nested objects
+    and arrays are masked as their JSON text.
+
+    Args:
+        values (list): The values to mask, with None for missing values.
+        options (dict): The strategy options from resolve_masking.
+
+    Returns:
+        list: The masked value for each input value.
+    """
+    if any(isinstance(value, (dict, list)) for value in values):
+        values = [
+            json.dumps(value) if isinstance(value, (dict, list)) else value
+            for value in values
+        ]
+    try:
+        column = pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        column = pa.array(
+            [None if value is None else str(value) for value in values]
+        )
+    return mask_arrow_column_with_strategy(
+        pa.chunked_array([column]), options
+    ).to_pylist()
@@ -0,0 +1,341 @@
+import json
+import logging
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from src.masking import mask_arrow_column_with_strategy, resolve_masking
+from src.utils import MASK_VALUE, MISSING_VALUE, validate_pii_fields
+
+logging.basicConfig(level=logging.INFO)
+
+
+class _ChunkSink:
+    """
+    Minimal writable file object that collects what the Parquet writer
+    emits so it can be handed on after every row group.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+MASK_DICTIONARY = pa.array([MASK_VALUE, MISSING_VALUE])
+MASKED_TYPE = pa.dictionary(pa.int8(), pa.string())
+STRATEGY_MASKED_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+
+def mask_arrow_column(column):
+    """
+    Obfuscate an Arrow column, replacing nulls (and NaNs) with the missing
+    value marker and every other value with asterisks.
+
+    The result is dictionary-encoded with the two masked values, so it costs
+    one int8 index per row.
+
+    Args:
+        column (pa.ChunkedArray): The column to obfuscate.
+
+    Returns:
+        pa.ChunkedArray: A dictionary-encoded column of masked values.
+    """
+    indices = pc.cast(pc.is_null(column, nan_is_null=True), pa.int8())
+    return pa.chunked_array(
+        [
+            pa.DictionaryArray.from_arrays(chunk, MASK_DICTIONARY)
+            for chunk in indices.chunks
+        ],
+        type=MASKED_TYPE,
+    )
+
+
+def _constant_masked_column(index, num_rows):
+    """
+    Build a dictionary-encoded column repeating one of the masked values.
+    """
+    return pa.DictionaryArray.from_arrays(
+        pa.repeat(pa.scalar(index, pa.int8()), num_rows), MASK_DICTIONARY
+    )
+
+
+def _obfuscated_schema(schema, strategies):
+    """
+    Build the output schema: PII fields become dictionary-encoded strings,
+    everything else, including the schema metadata, is kept as in the source.
+    """
+    for field_name, options in strategies.items():
+        index = schema.get_field_index(field_name)
+        field_type = (
+            MASKED_TYPE
+            if options["strategy"] == "mask"
+            else STRATEGY_MASKED_TYPE
+        )
+        schema = schema.set(index, schema.field(index).with_type(field_type))
+
+    metadata = dict(schema.metadata or {})
+    if b"pandas" in metadata:
+        pandas_metadata = json.loads(metadata[b"pandas"])
+        for column in pandas_metadata.get("columns", []):
+            if column.get("name") in strategies:
+                field_type = schema.field(column["name"]).type
+                column.update(
+                    pandas_type="categorical",
+                    numpy_type=str(field_type.index_type),
+                    metadata={
+                        "num_categories": (
+                            2 if field_type == MASKED_TYPE else None
+                        ),
+                        "ordered": False,
+                    },
+                )
+        metadata[b"pandas"] = json.dumps(pandas_metadata).encode("utf-8")
+
+    return schema.with_metadata(metadata)
+
+
+def _source_compression(parquet_metadata):
+    """
+    Read the compression codec of each column chunk in the first row group
+    so the output can be written with the same codecs.
+    """
+    if parquet_metadata.num_row_groups == 0:
+        return "snappy"
+
+    row_group = parquet_metadata.row_group(0)
+    return {
+        row_group.column(i).path_in_schema: row_group.column(i).compression
+        for i in range(row_group.num_columns)
+    }
+
+
+def _leaf_column_indices(parquet_metadata, pii_fields):
+    """
+    Map each flat (non-nested) PII field to its column chunk index, so its
+    statistics can be looked up in every row group.
+    """
+    parquet_schema = parquet_metadata.schema
+    return {
+        parquet_schema.column(i).path: i
+        for i in range(len(parquet_schema))
+        if parquet_schema.column(i).path in pii_fields
+        and parquet_schema.column(i).max_repetition_level == 0
+    }
+
+
+def _column_chunk_ranges(row_group, field_names):
+    """
+    Find the byte range of each column chunk of the given fields in a row
+    group, so sources that can fetch ranges ahead of time can do so.
+    """
+    byte_ranges = []
+    for i in range(row_group.num_columns):
+        column = row_group.column(i)
+        if column.path_in_schema.split(".")[0] not in field_names:
+            continue
+        start = column.data_page_offset
+        if column.has_dictionary_page and 0 < column.dictionary_page_offset:
+            start = min(start, column.dictionary_page_offset)
+        byte_ranges.append((start, column.total_compressed_size))
+    return byte_ranges
+
+
+def _mask_from_statistics(column_metadata, num_rows):
+    """
+    Build a masked column from the column chunk statistics alone, without
+    decoding any values. This is only possible when the statistics show the
+    chunk has either no nulls or only nulls.
+
+    Floating point columns are always decoded because NaNs, which count as
+    missing values, are not included in the Parquet null count.
+
+    Args:
+        column_metadata (pq.ColumnChunkMetaData): The column chunk to mask.
+        num_rows (int): The number of rows in the row group.
+
+    Returns:
+        pa.Array | None: The masked column, or None if the chunk must be decoded.
+    """
+    statistics = column_metadata.statistics
+    if (
+        statistics is None
+        or not statistics.has_null_count
+        or column_metadata.physical_type in ("FLOAT", "DOUBLE")
+    ):
+        return None
+
+    if statistics.null_count == 0:
+        return _constant_masked_column(0, num_rows)
+    if statistics.null_count == num_rows:
+        return _constant_masked_column(1, num_rows)
+    return None
+
+
+def _masking_plan(parquet_file, pii_fields, masking):
+    """
+    Validate the PII fields of a Parquet file and work out the output
+    schema, the strategy of each field and the column chunk of each field
+    that can be masked from its statistics.
+    """
+    source_schema = parquet_file.schema_arrow
+    validate_pii_fields(source_schema.names, pii_fields)
+    strategies = resolve_masking(pii_fields, masking)
+    schema = _obfuscated_schema(source_schema, strategies)
+
+    # Only the default mask can be built from statistics without decoding
+    leaf_columns = _leaf_column_indices(
+        parquet_file.metadata,
+        [
+            field_name
+            for field_name, options in strategies.items()
+            if options["strategy"] == "mask"
+        ],
+    )
+    return schema, strategies, leaf_columns
+
+
+def _obfuscate_row_group(parquet_file, i, plan, source=None):
+    """
+    Read and mask one row group, returning it as a table with the output
+    schema.
+    """
+    schema, strategies, leaf_columns = plan
+    row_group = parquet_file.metadata.row_group(i)
+    masked_columns = {}
+    for field_name, column_index in leaf_columns.items():
+        masked_column = _mask_from_statistics(
+            row_group.column(column_index), row_group.num_rows
+        )
+        if masked_column is not None:
+            masked_columns[field_name] = masked_column
+
+    # Only decode the columns that cannot be masked from statistics
+    columns_to_read = [
+        name for name in schema.names if name not in masked_columns
+    ]
+    if hasattr(source, "prefetch"):
+        # Fetch only the needed column chunks, concurrently
+        source.prefetch(_column_chunk_ranges(row_group, columns_to_read))
+    table = parquet_file.read_row_group(i, columns=columns_to_read)
+    columns = []
+    for field_name in schema.names:
+        if field_name in masked_columns:
+            columns.append(masked_columns[field_name])
+        elif field_name not in strategies:
+            columns.append(table.column(field_name))
+        elif strategies[field_name]["strategy"] == "mask":
+            columns.append(mask_arrow_column(table.column(field_name)))
+        else:
+            columns.append(
+                mask_arrow_column_with_strategy(
+                    table.column(field_name), strategies[field_name]
+                )
+            )
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def _check_has_rows(parquet_metadata):
+    """
+    Raise an error for a Parquet file without rows.
+    """
+    if parquet_metadata.num_rows == 0:
+        logging.error("Provided Parquet file is empty.")
+        raise ValueError(
+            "Input DataFrame is empty. Cannot proceed with processing."
+        )
+
+
+def write_parquet_tables(tables, schema, compression):
+    """
+    Write masked row groups to a Parquet file, one output row group per
+    table, yielding the bytes written after each one.
+
+    Args:
+        tables (Iterable[pa.Table]): The row groups, in order.
+        schema (pa.Schema): The output schema.
+        compression (str | dict): The codec, or the codec of each column.
+
+    Yields:
+        bytes: The Parquet file, emitted after each row group.
+    """
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression=compression) as writer:
+        for table in tables:
+            writer.write_table(table, row_group_size=max(table.num_rows, 1))
+            yield sink.drain()
+
+    yield sink.drain()
+
+
+def obfuscate_parquet_row_groups(source, pii_fields, masking=None):
+    """
+    Obfuscate a Parquet file one row group at a time using pyarrow.
+
+    Only the PII columns are replaced, at the Arrow level. All other
+    columns are still decoded into Arrow arrays and encoded again by the
+    writer, though never converted to pandas, so they make up most of the
+    work on a wide table. PII column chunks whose statistics show no nulls
+    (or only nulls) are masked without being decoded at all. The output keeps the source row-group layout,
+    compression codecs and schema metadata.
+
+    When the source has a prefetch method, such as file_handling.S3RangeFile,
+    the byte ranges of the column chunks needed for each row group are
+    passed to it before the row group is read, so only those are fetched.
+
+    Args:
+        source (str | file-like | pa.NativeFile): The Parquet file to read.
+        pii_fields (list): A list of columns that contain personally identifiable information.
+        masking (dict): Optional masking strategy for each field, if not the default 'mask'.
+
+    Yields:
+        bytes: The obfuscated Parquet file, emitted after each row group.
+
+    Raises:
+        ValueError: If the file has no rows or if specified columns are missing.
+    """
+    parquet_file = pq.ParquetFile(source)
+    metadata = parquet_file.metadata
+    _check_has_rows(metadata)
+    plan = _masking_plan(parquet_file, pii_fields, masking)
+
+    yield from write_parquet_tables(
+        (
+            _obfuscate_row_group(parquet_file, i, plan, source)
+            for i in range(parquet_file.num_row_groups)
+        ),
+        plan[0],
+        _source_compression(metadata),
+    )
+
+
+def obfuscate_parquet_bytes(file_content, pii_fields, masking=None):
+    """
+    Obfuscate an in-memory Parquet file with the row-group engine.
+
+    Args:
+        file_content (bytes): The content of the Parquet file.
+        pii_fields (list): A list of columns that contain personally identifiable information.
+        masking (dict): Optional masking strategy for each field, if not the default 'mask'.
+
+    Returns:
+        bytes: The obfuscated Parquet file.
+    """
+    return b"".join(
+        obfuscate_parquet_row_groups(
+            pa.BufferReader(file_content), pii_fields, masking
+        )
+    )
@@ -0,0 +1,392 @@
+import gc
+import logging
+import math
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from multiprocessing import shared_memory
+from src.compression import compress_chunks, decompress_bytes
+from src.streaming import (
+    _obfuscate_csv_block,
+    _obfuscate_ndjson_block,
+    _record_boundary,
+    _resolve_strategies,
+    infer_csv_dtypes,
+    read_csv_header,
+)
+from src.utils import NDJSON_FILE_TYPES, validate_pii_fields
+
+logging.basicConfig(level=logging.INFO)
+
+PARTITIONED_FILE_TYPES = ["csv", "parquet", "jsonl", "ndjson"]
+DEFAULT_MIN_PARTITION_SIZE = 4 * 1024 * 1024
+# More partitions than workers, so a slow partition does not hold up the rest
+PARTITIONS_PER_WORKER = 4
+
+
+@contextmanager
+def _shared_content(content):
+    """
+    Copy content into a shared memory block that worker processes can
+    attach to by name, and free the block afterwards.
+    """
+    shared = shared_memory.SharedMemory(
+        create=True, size=max(len(content), 1)
+    )
+    try:
+        shared.buf[: len(content)] = content
+        yield shared.name
+    finally:
+        shared.close()
+        shared.unlink()
+
+
+def _read_shared(name, start, end):
+    """
+    Copy a byte range out of a shared memory block.
+    """
+    shared = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(shared.buf[start:end])
+    finally:
+        shared.close()
+
+
+def _map_partitions(function, tasks, workers):
+    """
+    Run a function over the argument tuples of each partition on a process
+    pool, yielding the results in partition order. At most twice as many
+    partitions as workers are submitted ahead of the one being yielded, so
+    finished results waiting behind a slow partition do not pile up in
+    memory. A single partition is masked in this process, without starting
+    a pool.
+    """
+    if len(tasks) <= 1:
+        for task in tasks:
+            yield function(*task)
+        return
+
+    workers = min(workers, len(tasks))
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as pool:
+        pending = deque()
+        try:
+            for task in tasks:
+                pending.append(pool.submit(function, *task))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _partition_count(size, workers, min_partition_size):
+    """
+    Work out how many partitions to split content of a given size into.
+    """
+    return max(
+        1,
+        min(
+            workers * PARTITIONS_PER_WORKER,
+            math.ceil(size / max(min_partition_size, 1)),
+        ),
+    )
+
+
+def split_record_ranges(content, start, partitions, quoted=False):
+    """
+    Split content into byte ranges of about the same size that each hold
+    whole records, so every range can be parsed on its own.
+
+    Args:
+        content (bytes): The content to split.
+        start (int): The offset of the first record, e.g. after a CSV header.
+        partitions (int): The number of ranges to aim for.
+        quoted (bool): Whether newlines inside double quotes belong to the
+            record, as in CSV. Records are split on every newline otherwise.
+
+    Returns:
+        list: The (start, end) offsets of each non-empty range, in order.
+    """
+    step = max(math.ceil((len(content) - start) / partitions), 1)
+    ranges = []
+    while start < len(content):
+        end = _record_boundary(content[start : start + step], quoted)
+        if not end:
+            # The record is longer than a step: end the range after it
+            end = content.find(b"\n", start + step)
+            # Memory maps have no count, but their slices are bytes
+            while (
+                quoted and end >= 0 and content[start:end].count(b'"') % 2
+            ):
+                end = content.find(b"\n", end + 1)
+            end = len(content) - start if end < 0 else end + 1 - start
+        ranges.append((start, start + end))
+        start += end
+    return ranges
+
+
+def _mask_csv_partition(
+    name, header, start, end, pii_fields, masking, csv_engine, dtypes
+):
+    """
+    Mask the CSV records in a byte range of the shared content.
+    """
+    return _obfuscate_csv_block(
+        header,
+        _read_shared(name, start, end),
+        pii_fields,
+        masking,
+        csv_engine,
+        dtypes,
+    )
+
+
+def _mask_ndjson_partition(name, start, end, first_line_number, strategies):
+    """
+    Mask the NDJSON lines in a byte range of the shared content.
+    """
+    return _obfuscate_ndjson_block(
+        _read_shared(name, start, end), first_line_number, strategies
+    )
+
+
+def _mask_parquet_partition(name, size, row_groups, pii_fields, masking):
+    """
+    Mask some row groups of the shared Parquet file, returning each one as
+    an Arrow IPC stream.
+    """
+    shared = shared_memory.SharedMemory(name=name)
+    try:
+        return _mask_row_groups_to_ipc(
+            shared.buf, size, row_groups, pii_fields, masking
+        )
+    finally:
+        # The Parquet reader holds the buffer in reference cycles, which
+        # must be collected before the block can be closed
+        gc.collect()
+        shared.close()
+
+
+def _mask_row_groups_to_ipc(buffer, size, row_groups, pii_fields, masking):
+    """
+    Read the Parquet file straight from a buffer, without copying it, and
+    serialise each masked row group.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from src.parquet_engine import _masking_plan, _obfuscate_row_group
+
+    parquet_file = pq.ParquetFile(
+        pa.BufferReader(pa.py_buffer(buffer)[:size])
+    )
+    plan = _masking_plan(parquet_file, pii_fields, masking)
+    results = []
+    for i in row_groups:
+        table = _obfuscate_row_group(parquet_file, i, plan)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        results.append(sink.getvalue().to_pybytes())
+    return results
+
+
+def _obfuscate_csv_partitions(
+    content, pii_fields, masking, partitions, workers, csv_engine="pandas"
+):
+    """
+    Mask a CSV file split into byte ranges, yielding the output in order.
+    """
+    header, output_header = read_csv_header(
+        content, pii_fields, csv_engine
+    )
+    ranges = split_record_ranges(content, len(header), partitions, True)
+    dtypes = infer_csv_dtypes(content) if csv_engine == "pandas" else None
+
+    rows = 0
+    with _shared_content(content) as name:
+        tasks = [
+            (
+                name,
+                header,
+                start,
+                end,
+                pii_fields,
+                masking,
+                csv_engine,
+                dtypes,
+            )
+            for start, end in ranges
+        ]
+        yield output_header
+        for output, partition_rows in _map_partitions(
+            _mask_csv_partition, tasks, workers
+        ):
+            rows += partition_rows
+            if output:
+                yield output
+
+    if not rows:
+        logging.error("Provided CSV file contains no rows.")
+        raise ValueError(
+            "Input DataFrame is empty. Cannot proceed with processing."
+        )
+
+
+def _obfuscate_ndjson_partitions(
+    content, pii_fields, masking, partitions, workers
+):
+    """
+    Mask a JSON Lines file split into byte ranges, yielding the output in
+    order.
+    """
+    strategies = _resolve_strategies(pii_fields, masking)
+    ranges = split_record_ranges(content, 0, partitions)
+
+    found = set()
+    records = 0
+    with _shared_content(content) as name:
+        tasks = []
+        line_number = 1
+        for start, end in ranges:
+            tasks.append((name, start, end, line_number, strategies))
+            line_number += content.count(b"\n", start, end)
+
+        for output, partition_found, partition_records in _map_partitions(
+            _mask_ndjson_partition, tasks, workers
+        ):
+            found |= partition_found
+            records += partition_records
+            if output:
+                yield output
+
+    if not records:
+        logging.error("Provided NDJSON file contains no records.")
+        raise ValueError(
+            "Input DataFrame is empty. Cannot proceed with processing."
+        )
+    validate_pii_fields(found, pii_fields)
+
+
+def _obfuscate_parquet_partitions(
+    content, pii_fields, masking, partitions, workers
+):
+    """
+    Mask a Parquet file split into runs of row groups, yielding the output
+    in order with the source row-group layout.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from src.parquet_engine import (
+        _check_has_rows,
+        _masking_plan,
+        _source_compression,
+        write_parquet_tables,
+    )
+
+    parquet_file = pq.ParquetFile(pa.BufferReader(content))
+    metadata = parquet_file.metadata
+    _check_has_rows(metadata)
+    schema = _masking_plan(parquet_file, pii_fields, masking)[0]
+
+    # Contiguous runs of row groups keep the output in the source order
+    num_row_groups = metadata.num_row_groups
+    step = math.ceil(num_row_groups / min(partitions, num_row_groups))
+    runs = [
+        list(range(first, min(first + step, num_row_groups)))
+        for first in range(0, num_row_groups, step)
+    ]
+
+    with _shared_content(content) as name:
+        tasks = [
+            (name, len(content), row_groups, pii_fields, masking)
+            for row_groups in runs
+        ]
+        tables = (
+            pa.ipc.open_stream(data).read_all()
+            for results in _map_partitions(
+                _mask_parquet_partition, tasks, workers
+            )
+            for data in results
+        )
+        yield from write_parquet_tables(
+            tables, schema, _source_compression(metadata)
+        )
+
+
+def obfuscate_partitioned(
+    file_content,
+    file_type,
+    pii_fields,
+    masking=None,
+    compression_level=None,
+    workers=None,
+    min_partition_size=DEFAULT_MIN_PARTITION_SIZE,
+    csv_engine="pandas",
+):
+    """
+    Obfuscate a single file on several CPU cores by splitting it into
+    partitions and masking them in a process pool, yielding the output in
+    the original order.
+
+    CSV and JSON Lines files are split into byte ranges on record
+    boundaries, and Parquet files into runs of row groups. The content is
+    copied once into shared memory, and each worker process reads its
+    partition from there rather than receiving a pickled DataFrame. Masked
+    Parquet row groups are sent back as Arrow IPC streams. Compressed
+    content is decompressed first and the output is compressed again with
+    the same codec.
+
+    Content smaller than two partitions is masked in this process, and a
+    Parquet file can only be split between its row groups. Hash tokens are
+    cached separately in each worker process.
+
+    Args:
+        file_content (bytes): The content of the file to obfuscate.
+        file_type (str): Type of the file ('csv', 'parquet', 'jsonl', 'ndjson').
+        pii_fields (list): A list of fields to obfuscate.
+        masking (dict): Optional masking strategy for each field, if not the default 'mask'.
+        compression_level (int): The level to compress the output at, or None for the codec's default.
+        workers (int): The number of worker processes. Defaults to the number of CPUs.
+        min_partition_size (int): The smallest partition, in bytes, worth sending to a worker.
+        csv_engine (str): 'pandas' to infer column types, 'strings' to read every column as text, or 'splice' to copy everything but the PII cells unchanged (see utils.csv_read_options).
+
+    Yields:
+        bytes: Consecutive chunks of the obfuscated file content.
+
+    Raises:
+        ValueError: If the file type cannot be partitioned, the file is
+                    empty or specified columns are missing.
+    """
+    if file_type not in PARTITIONED_FILE_TYPES:
+        logging.error(f"Unsupported file type for partitioning: {file_type}")
+        raise ValueError(
+            f"Unsupported file type for partitioning: {file_type}. Supported file types are {', '.join(PARTITIONED_FILE_TYPES)}."
+        )
+
+    workers = workers or multiprocessing.cpu_count()
+    content, compression = decompress_bytes(file_content)
+    partitions = _partition_count(len(content), workers, min_partition_size)
+
+    if file_type == "csv":
+        obfuscate_partitions = partial(
+            _obfuscate_csv_partitions, csv_engine=csv_engine
+        )
+    elif file_type in NDJSON_FILE_TYPES:
+        obfuscate_partitions = _obfuscate_ndjson_partitions
+    else:
+        obfuscate_partitions = _obfuscate_parquet_partitions
+
+    yield from compress_chunks(
+        obfuscate_partitions(
+            content, pii_fields, masking, partitions, workers
+        ),
+        compression,
+        compression_level,
+    )
@@ -0,0 +1,477 @@
+import csv
+import logging
+from src.stdlib_engine import NA_VALUES
+from src.streaming import _resolve_strategies
+from src.utils import MASK_VALUE, MISSING_VALUE, validate_pii_fields
+
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_BLOCK_SIZE = 8 * 1024 * 1024
+
+_QUOTE = ord('"')
+_COMMA = ord(",")
+_NEWLINE = ord("\n")
+_CARRIAGE_RETURN = ord("\r")
+_NA_WIDTH = max(len(value.encode("utf-8")) for value in NA_VALUES)
+_MASK_BYTES = MASK_VALUE.encode("utf-8")
+_MISSING_BYTES = MISSING_VALUE.encode("utf-8")
+
+
+def _quoting_is_consistent(data, quotes):
+    """
+    Check that the quotes of a uint8 array of whole CSV records, at the
+    given positions, pair up the way RFC 4180 and pandas read them: each
+    quoted field opens at the start of a field and closes at its end, and
+    quotes inside it are doubled. A quote in the middle of an unquoted
+    field, such as 12" pizza, or a block that ends inside quotes, breaks
+    the pairing.
+    """
+    import numpy as np
+
+    if len(quotes) % 2:
+        return False
+    opening, closing = quotes[0::2], quotes[1::2]
+    field_start = np.isin(data[np.maximum(opening - 1, 0)], (_COMMA, _NEWLINE))
+    # A doubled quote closes and reopens the field in the parity count
+    reopened = np.zeros(len(opening), dtype=bool)
+    reopened[1:] = opening[1:] == closing[:-1] + 1
+    if not ((opening == 0) | field_start | reopened).all():
+        return False
+    last = len(data) - 1
+    field_end = np.isin(
+        data[np.minimum(closing + 1, last)],
+        (_COMMA, _NEWLINE, _CARRIAGE_RETURN),
+    )
+    doubled = np.zeros(len(closing), dtype=bool)
+    doubled[:-1] = closing[:-1] + 1 == opening[1:]
+    return bool(((closing == last) | field_end | doubled).all())
+
+
+def _separators(data):
+    """
+    Find the commas and newlines of a uint8 array of CSV records that are
+    not inside quoted fields. A character is inside quotes when an odd
+    number of quotes comes before it, which also holds for doubled quotes.
+
+    Returns:
+        tuple: The positions of the commas and of the newlines, or None if
+               the quoting is inconsistent, so quote parity cannot be
+               trusted to find the fields.
+    """
+    import numpy as np
+
+    commas = data == _COMMA
+    newlines = data == _NEWLINE
+    quotes = data == _QUOTE
+    if quotes.any():
+        if not _quoting_is_consistent(data, np.flatnonzero(quotes)):
+            return None
+        outside = ~np.logical_xor.accumulate(quotes)
+        commas &= outside
+        newlines &= outside
+    return np.flatnonzero(commas), np.flatnonzero(newlines)
+
+
+def _block_end(content, data, start, block_size):
+    """
+    Find where a block of whole records starting at an offset ends: after
+    the first newline at least block_size bytes on that is outside quotes,
+    or at the end of the content. Quotes are counted by parity, so with
+    inconsistent quoting the block may run to the end of the content,
+    where splice_records finds it cannot be spliced.
+    """
+    import numpy as np
+
+    end = content.find(b"\n", start + block_size - 1)
+    quotes = 0
+    while end >= 0:
+        quotes += np.count_nonzero(data[start:end] == _QUOTE)
+        if quotes % 2 == 0:
+            return end + 1
+        start = end
+        end = content.find(b"\n", end + 1)
+    return len(content)
+
+
+def find_header_end(content):
+    """
+    Find the end of the header record of some CSV content, after its
+    newline, skipping newlines inside quoted column names. As in pandas,
+    a quote only opens a quoted name at the start of a name.
+
+    Args:
+        content (bytes | mmap.mmap): CSV content starting with the header.
+
+    Returns:
+        int: The offset the first data record starts at.
+    """
+    quoted = closed = False
+    field_start = True
+    position = 0
+    while position < len(content):
+        # Slices of an mmap are bytes, so the header is read a line at a time
+        line_end = content.find(b"\n", position)
+        line = bytes(
+            content[position : len(content) if line_end < 0 else line_end]
+        )
+        for character in line:
+            if quoted:
+                quoted = character != _QUOTE
+                closed = not quoted
+                continue
+            # A doubled quote closes the field and opens it again
+            quoted = character == _QUOTE and (field_start or closed)
+            closed = False
+            field_start = character == _COMMA
+        if line_end < 0:
+            break
+        if not quoted:
+            return line_end + 1
+        position = line_end + 1
+        field_start = False
+    # Without a newline, the whole file is the header
+    return len(content)
+
+
+def pii_column_indices(header, pii_fields):
+    """
+    Find the position of each PII column in a CSV header record.
+
+    Args:
+        header (bytes): The header record, as it appears in the file.
+        pii_fields (list): A list of columns that contain personally identifiable information.
+
+    Returns:
+        dict: The PII field at each column index that holds one.
+
+    Raises:
+        ValueError: If the header is empty or specified columns are missing.
+    """
+    columns = next(
+        csv.reader([header.decode("utf-8-sig").rstrip("\r\n")]), []
+    )
+    if columns in ([], [""]):
+        logging.error("Provided CSV file has no header.")
+        raise ValueError("No columns to parse from file")
+    validate_pii_fields(columns, pii_fields)
+    return {
+        index: column
+        for index, column in enumerate(columns)
+        if column in pii_fields
+    }
+
+
+def _find_cells(data, pii_columns):
+    """
+    Find the PII cells of a uint8 array of whole CSV records.
+
+    Every record is located at once from the positions of the separators
+    outside quotes: the k-th field of a record starts just after the k-th
+    comma following the record's start, found by binary search. Blank
+    lines are not records, and short records may lack some cells.
+
+    Returns:
+        tuple | None: The start, end and column of each cell, in the order
+                      they appear, and the number of records, or None if
+                      the quoting is inconsistent.
+    """
+    import numpy as np
+
+    separators = _separators(data)
+    if separators is None:
+        return None
+    commas, newlines = separators
+    # A sentinel past every record stands in for missing commas
+    commas = np.append(commas, len(data) + 1)
+
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.append(newlines, len(data))
+    ends = ends - (
+        (ends > starts) & (data[np.maximum(ends - 1, 0)] == _CARRIAGE_RETURN)
+    )
+    records = ends > starts
+    starts, ends = starts[records], ends[records]
+
+    first_comma = np.searchsorted(commas, starts)
+    last_comma = len(commas) - 1
+    cell_starts, cell_ends, present = [], [], []
+    for column in pii_columns:
+        if column:
+            before = commas[np.minimum(first_comma + column - 1, last_comma)]
+            present.append(before < ends)
+            cell_starts.append(before + 1)
+        else:
+            present.append(np.ones(len(starts), dtype=bool))
+            cell_starts.append(starts)
+        after = commas[np.minimum(first_comma + column, last_comma)]
+        cell_ends.append(np.minimum(after, ends))
+
+    # Row-major order puts the cells in the order they appear
+    present = np.stack(present, axis=1).ravel()
+    columns = np.tile(np.array(pii_columns), len(starts))
+    return (
+        np.stack(cell_starts, axis=1).ravel()[present],
+        np.stack(cell_ends, axis=1).ravel()[present],
+        columns[present],
+        len(starts),
+    )
+
+
+def _missing_cells(data, starts, ends):
+    """
+    Work out which cells hold a value pandas reads as missing, comparing
+    every short cell with the missing value strings at once.
+    """
+    import numpy as np
+
+    last = len(data) - 1
+    quoted = (
+        (ends - starts >= 2)
+        & (data[np.minimum(starts, last)] == _QUOTE)
+        & (data[np.maximum(ends - 1, 0)] == _QUOTE)
+    )
+    starts = starts + quoted
+    lengths = ends - quoted - starts
+
+    missing = lengths == 0
+    short = np.flatnonzero((lengths > 0) & (lengths <= _NA_WIDTH))
+    if len(short):
+        offsets = np.arange(_NA_WIDTH)
+        positions = np.minimum(starts[short, None] + offsets, last)
+        # Padded with NULs, which fixed-width byte strings ignore
+        values = np.where(
+            offsets < lengths[short, None], data[positions], 0
+        ).astype(np.uint8)
+        missing[short] = np.isin(
+            values.view(f"S{_NA_WIDTH}").ravel(),
+            np.array(
+                [value.encode("utf-8") for value in NA_VALUES if value],
+                dtype=f"S{_NA_WIDTH}",
+            ),
+        )
+    return missing
+
+
+def _quote(value):
+    """
+    Encode a masked value as a CSV field, quoting it if it needs to be.
+    """
+    if any(character in value for character in ',"\r\n'):
+        value = '"' + value.replace('"', '""') + '"'
+    return value.encode("utf-8")
+
+
+def _cell_text(data, start, end):
+    """
+    Read the text of a CSV cell, removing its quotes.
+    """
+    raw = data[start:end].tobytes()
+    if len(raw) > 1 and raw[:1] == b'"' and raw[-1:] == b'"':
+        raw = raw[1:-1].replace(b'""', b'"')
+    return raw.decode("utf-8")
+
+
+def _replacements(data, starts, ends, columns, missing, indices, strategies):
+    """
+    Work out the bytes replacing each cell, returning them joined together
+    with the length of each cell's replacement.
+    """
+    import numpy as np
+
+    if all(options["strategy"] == "mask" for options in strategies.values()):
+        lengths = np.where(missing, len(_MISSING_BYTES), len(_MASK_BYTES))
+        offsets = np.cumsum(lengths) - lengths
+        values = np.empty(lengths.sum(), dtype=np.uint8)
+        # Every cell gets one of two constants, written in two strides
+        for replacement, cells in [
+            (_MISSING_BYTES, missing),
+            (_MASK_BYTES, ~missing),
+        ]:
+            values[
+                offsets[cells, None] + np.arange(len(replacement))
+            ] = np.frombuffer(replacement, np.uint8)
+        return values, lengths
+
+    from src.masking import mask_values
+
+    replacements = np.where(missing, _MISSING_BYTES, _MASK_BYTES).tolist()
+    for index, field in indices.items():
+        options = strategies[field]
+        cells = np.flatnonzero((columns == index) & ~missing)
+        if options["strategy"] == "mask" or not len(cells):
+            continue
+        # Each column is masked in one call, so distinct values are found once
+        masked = mask_values(
+            [_cell_text(data, starts[i], ends[i]) for i in cells], options
+        )
+        for i, value in zip(cells, masked):
+            replacements[i] = _quote(value)
+    return (
+        np.frombuffer(b"".join(replacements), np.uint8),
+        np.array([len(value) for value in replacements], dtype=np.int64),
+    )
+
+
+def splice_records(data, indices, strategies):
+    """
+    Mask the PII cells of whole CSV records by splicing, copying every other
+    byte to the output unchanged.
+
+    The records are scanned with vectorized numpy operations over a view
+    of the buffer, so no record or field becomes a Python object unless a
+    strategy other than 'mask' needs its text. The kept bytes and the
+    replacements are then written into the output array with two boolean
+    masks, one over the input and one over the output. Records keep their
+    quoting, line endings and any blank lines, and short records keep
+    their length.
+
+    Args:
+        data (bytes | memoryview | mmap.mmap | np.ndarray): Whole CSV records without a header.
+        indices (dict): The PII field at each PII column index, from pii_column_indices.
+        strategies (dict): The strategy options for each PII field, from masking.resolve_masking.
+
+    Returns:
+        tuple | None: The masked records as bytes, and the number of
+                      records, or None if a quote in the middle of an
+                      unquoted field, or records that end inside quotes,
+                      mean the fields cannot be found by quote parity.
+    """
+    import numpy as np
+
+    data = np.frombuffer(data, dtype=np.uint8)
+    if not len(data):
+        return b"", 0
+
+    cells = _find_cells(data, tuple(sorted(indices)))
+    if cells is None:
+        return None
+    starts, ends, columns, rows = cells
+    missing = _missing_cells(data, starts, ends)
+    values, lengths = _replacements(
+        data, starts, ends, columns, missing, indices, strategies
+    )
+
+    # Each replacement shifts the rest of the output by the change in length
+    growth = lengths - (ends - starts)
+    output_starts = starts + np.cumsum(growth) - growth
+    output = np.empty(len(data) + growth.sum(), dtype=np.uint8)
+    replaced = _cell_mask(len(output), output_starts, output_starts + lengths)
+    output[~replaced] = data[~_cell_mask(len(data), starts, ends)]
+    output[replaced] = values
+    return output.tobytes(), rows
+
+
+def _cell_mask(size, starts, ends):
+    """
+    Build a boolean mask of the bytes inside any of a set of ordered ranges
+    that never overlap, by repeating alternating flags for each run of
+    bytes outside and inside the ranges.
+    """
+    import numpy as np
+
+    runs = np.empty(len(starts) * 2 + 1, dtype=np.int64)
+    runs[0:-1:2] = starts - np.concatenate(([0], ends[:-1]))
+    runs[1::2] = ends - starts
+    runs[-1] = size - (ends[-1] if len(ends) else 0)
+    flags = np.zeros(len(runs), dtype=bool)
+    flags[1::2] = True
+    return np.repeat(flags, runs)
+
+
+def splice_csv_block(header, block, pii_fields, masking=None):
+    """
+    Mask a block of whole CSV records by splicing, returning them without a
+    header, for the block-parallel CSV paths in streaming and partitioning.
+
+    Args:
+        header (bytes): The header record of the file.
+        block (bytes): Whole CSV records that follow the header.
+        pii_fields (list): A list of columns that contain personally identifiable information.
+        masking (dict): Optional masking strategy for each field, if not the default 'mask'.
+
+    Returns:
+        tuple: The masked records as bytes, and the number of records.
+    """
+    result = splice_records(
+        block,
+        pii_column_indices(header, pii_fields),
+        _resolve_strategies(pii_fields, masking),
+    )
+    if result is None:
+        return _parse_inconsistent_block(header, block, pii_fields, masking)
+    return result
+
+
+def _parse_inconsistent_block(header, block, pii_fields, masking):
+    """
+    Mask a block whose quoting cannot be spliced with the strings engine,
+    which parses quotes as pandas does, rather than copy its PII through.
+    """
+    from src.streaming import _obfuscate_csv_block
+
+    logging.warning(
+        "Inconsistent quoting in CSV records; masking them with the strings engine."
+    )
+    return _obfuscate_csv_block(
+        bytes(header), bytes(block), pii_fields, masking, "strings"
+    )
+
+
+def obfuscate_csv_splice(
+    content, pii_fields, masking=None, block_size=DEFAULT_BLOCK_SIZE
+):
+    """
+    Obfuscate a CSV file by splicing masked PII cells into its bytes,
+    without parsing it into a DataFrame.
+
+    Every byte outside the PII cells, including the header, is copied to
+    the output unchanged, so values, quoting and line endings are exactly
+    as they were. The input is never copied as a whole: it can be an
+    mmap, and is masked block by block of whole records.
+
+    Args:
+        content (bytes | mmap.mmap): The uncompressed content of the CSV file.
+        pii_fields (list): A list of columns that contain personally identifiable information.
+        masking (dict): Optional masking strategy for each field, if not the default 'mask'.
+        block_size (int): The approximate number of bytes to mask at a time.
+
+    Yields:
+        bytes: Consecutive chunks of the obfuscated file content.
+
+    Raises:
+        ValueError: If the file is empty, has no records or specified
+                    columns are missing.
+    """
+    import numpy as np
+
+    header_end = find_header_end(content)
+    header = bytes(content[:header_end])
+    indices = pii_column_indices(header, pii_fields)
+    strategies = _resolve_strategies(pii_fields, masking)
+    yield header
+
+    data = np.frombuffer(content, dtype=np.uint8)
+    rows = 0
+    start = header_end
+    try:
+        while start < len(data):
+            end = _block_end(content, data, start, block_size)
+            result = splice_records(data[start:end], indices, strategies)
+            if result is None:
+                result = _parse_inconsistent_block(
+                    header, content[start:end], pii_fields, masking
+                )
+            output, block_rows = result
+            rows += block_rows
+            if output:
+                yield output
+            start = end
+    finally:
+        # An mmap cannot be closed while an array still views it
+        del data
+
+    if not rows:
+        logging.error("Provided CSV file contains no rows.")
+        raise ValueError(
+            "Input DataFrame is empty. Cannot proceed with processing."
+        )
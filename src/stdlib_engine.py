@@ -0,0 +1,276 @@
+import csv
+import io
+import json
+import logging
+import math
+import os
+import re
+from src.utils import MASK_VALUE, MISSING_VALUE
+
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_FAST_PATH_MAX_BYTES = 256 * 1024
+
+# Strings pandas reads as missing values by default (pandas' STR_NA_VALUES)
+NA_VALUES = {
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+}
+
+_CANONICAL_INT = re.compile(r"-?[1-9][0-9]{0,14}|0")
+
+
+def _is_numeric_like(value):
+    """
+    Return whether pandas could read a string as a number or boolean.
+    Errs on the side of True, which only ever sends a file to pandas.
+    """
+    value = value.strip()
+    if value.lower() in ("true", "false"):
+        return True
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _csv_column_writer(values):
+    """
+    Work out how pandas would write back a non-PII CSV column after reading
+    it, and return a function producing that text, or None if the column is
+    not one whose round trip can be reproduced exactly.
+    """
+    present = [value for value in values if value not in NA_VALUES]
+
+    if not present:
+        # An all-missing column becomes float NaN and is written as blanks
+        return lambda value: ""
+
+    if any(not _is_numeric_like(value) for value in present):
+        # Object column: strings are kept as they are, missing values blanked
+        return lambda value: "" if value in NA_VALUES else value
+
+    if all(_CANONICAL_INT.fullmatch(value) for value in present):
+        # Int64 column: written back exactly as read, missing values blanked
+        return lambda value: "" if value in NA_VALUES else value
+
+    return None
+
+
+def obfuscate_csv_bytes(file_content, pii_fields):
+    """
+    Obfuscate a small CSV file row by row with the csv module, producing the
+    same bytes as the pandas path would.
+
+    Files whose round trip through pandas cannot be reproduced exactly (for
+    example float or boolean columns, ragged rows or duplicate headers) are
+    not handled, and None is returned so the caller can fall back to pandas.
+
+    Args:
+        file_content (bytes): The content of the CSV file.
+        pii_fields (list): A list of columns that contain personally identifiable information.
+
+    Returns:
+        bytes | None: The obfuscated CSV file, or None if it must go through pandas.
+    """
+    try:
+        text = file_content.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    if text.startswith("\ufeff"):
+        return None
+
+    rows = [row for row in csv.reader(io.StringIO(text, newline="")) if row]
+    if len(rows) < 2:
+        return None
+
+    header, rows = rows[0], rows[1:]
+    if (
+        len(header) < 2
+        or len(set(header)) != len(header)
+        or "" in header
+        or any(field not in header for field in pii_fields)
+        or any(len(row) != len(header) for row in rows)
+    ):
+        return None
+
+    writers = []
+    for index, column in enumerate(header):
+        if column in pii_fields:
+            writers.append(
+                lambda value: MISSING_VALUE if value in NA_VALUES else MASK_VALUE
+            )
+            continue
+        writer = _csv_column_writer([row[index] for row in rows])
+        if writer is None:
+            return None
+        writers.append(writer)
+
+    buffer = io.StringIO()
+    csv_writer = csv.writer(buffer, lineterminator=os.linesep)
+    csv_writer.writerow(header)
+    for row in rows:
+        csv_writer.writerow(
+            [write(value) for write, value in zip(writers, row)]
+        )
+    return buffer.getvalue().encode("utf-8")
+
+
+def _is_date_column(name):
+    """
+    Return whether pandas' read_json would try to parse a column as dates.
+    """
+    name = name.lower()
+    return (
+        name.endswith(("_at", "_time"))
+        or name in ("modified", "date", "datetime")
+        or name.startswith("timestamp")
+    )
+
+
+def _dump_json_string(value):
+    """
+    Encode a string the way pandas' to_json does, escaping forward slashes.
+    """
+    return json.dumps(value).replace("/", "\\/")
+
+
+def _json_column_writer(values):
+    """
+    Work out how pandas would write back a non-PII JSON column after reading
+    it, and return a function producing that JSON text, or None if the
+    column is not one whose round trip can be reproduced exactly.
+    """
+    present = [value for value in values if value is not None]
+
+    if all(type(value) is str for value in present):
+        if present and any(_is_numeric_like(value) for value in present):
+            return None
+        if any("\x7f" in value for value in present):
+            return None
+        return lambda value: "null" if value is None else _dump_json_string(
+            value
+        )
+
+    if len(present) == len(values) and all(
+        type(value) is int and abs(value) < 2**63 for value in present
+    ):
+        return str
+
+    return None
+
+
+def obfuscate_json_bytes(file_content, pii_fields):
+    """
+    Obfuscate a small JSON file of records with the json module, producing
+    the same bytes as the pandas path would.
+
+    Only a list of flat records that all share the same keys is handled.
+    Anything else, or any column whose round trip through pandas cannot be
+    reproduced exactly (for example floats or date-like column names),
+    returns None so the caller can fall back to pandas.
+
+    Args:
+        file_content (bytes): The content of the JSON file.
+        pii_fields (list): A list of fields that contain personally identifiable information.
+
+    Returns:
+        bytes | None: The obfuscated JSON file, or None if it must go through pandas.
+    """
+    try:
+        records = json.loads(file_content.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return None
+
+    if not isinstance(records, list) or not records:
+        return None
+    if not all(isinstance(record, dict) for record in records):
+        return None
+
+    columns = list(records[0])
+    if any(list(record) != columns for record in records):
+        return None
+    if any(field not in columns for field in pii_fields):
+        return None
+    # read_json converts numeric column labels, and the encoder leaves DEL raw
+    if any(_is_numeric_like(column) or "\x7f" in column for column in columns):
+        return None
+
+    writers = []
+    for column in columns:
+        if column in pii_fields:
+            writers.append(
+                lambda value: _dump_json_string(
+                    MISSING_VALUE
+                    if value is None
+                    or (isinstance(value, float) and math.isnan(value))
+                    else MASK_VALUE
+                )
+            )
+            continue
+        if _is_date_column(column):
+            return None
+        writer = _json_column_writer([record[column] for record in records])
+        if writer is None:
+            return None
+        writers.append(writer)
+
+    keys = [_dump_json_string(column) for column in columns]
+    return (
+        "["
+        + ",".join(
+            "{"
+            + ",".join(
+                f"{key}:{write(value)}"
+                for key, write, value in zip(
+                    keys, writers, record.values()
+                )
+            )
+            + "}"
+            for record in records
+        )
+        + "]"
+    ).encode("utf-8")
+
+
+def obfuscate_small_file(file_content, file_type, pii_fields):
+    """
+    Obfuscate a small CSV or JSON file without pandas.
+
+    Args:
+        file_content (bytes): The content of the file to obfuscate.
+        file_type (str): Type of the file ('csv', 'json').
+        pii_fields (list): A list of fields to obfuscate.
+
+    Returns:
+        bytes | None: The obfuscated file, or None if it must go through pandas.
+    """
+    match file_type:
+        case "csv":
+            result = obfuscate_csv_bytes(file_content, pii_fields)
+        case "json":
+            result = obfuscate_json_bytes(file_content, pii_fields)
+        case _:
+            result = None
+
+    if result is None:
+        logging.info("File not suited to the standard library engine.")
+    return result
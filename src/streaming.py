@@ -0,0 +1,623 @@
+import io
+import itertools
+import json
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from src.compression import (
+    MAGIC_LENGTH,
+    compress_chunks,
+    detect_compression,
+    open_decompressed_stream,
+)
+from src.file_handling import open_parts_stream
+from src.utils import (
+    MASK_VALUE,
+    MISSING_VALUE,
+    apply_csv_dtypes,
+    csv_read_options,
+    obfuscate_pii_fields,
+    validate_pii_fields,
+)
+
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_CHUNKSIZE = 100_000
+DEFAULT_PARSE_WORKERS = 4
+# The size of the blocks the splice engine reads from a stream
+DEFAULT_SPLICE_BLOCK_SIZE = 8 * 1024 * 1024
+# The bytes at the start of a CSV file its column types are inferred from
+CSV_DTYPE_SAMPLE_BYTES = 1024 * 1024
+
+
+def obfuscate_csv_stream(
+    stream,
+    pii_fields,
+    chunksize=DEFAULT_CHUNKSIZE,
+    masking=None,
+    compression_level=None,
+    csv_engine="pandas",
+):
+    """
+    Obfuscate a CSV stream chunk by chunk, yielding the output as bytes.
+
+    Only one chunk of rows is held in memory at a time, so peak memory is
+    bounded by the chunk size rather than the size of the file. The splice
+    engine reads the stream in blocks of DEFAULT_SPLICE_BLOCK_SIZE bytes
+    rather than chunks of rows. A gzip,
+    zstd or bz2 compressed stream is decompressed as it is read and the
+    output is compressed again with the same codec.
+
+    Args:
+        stream (file-like): A binary stream of CSV data, e.g. an S3 StreamingBody.
+        pii_fields (list): A list of columns that contain personally identifiable information.
+        chunksize (int): The number of rows to read and obfuscate per chunk.
+        masking (dict): Optional masking strategy for each field, if not the default 'mask'.
+        compression_level (int): The level to compress the output at, or None for the codec's default.
+        csv_engine (str): 'pandas' to infer column types, 'strings' to read every column as text, or 'splice' to copy everything but the PII cells unchanged (see utils.csv_read_options).
+
+    Yields:
+        bytes: The obfuscated CSV content, with the header in the first chunk.
+
+    Raises:
+        ValueError: If the CSV has no rows or if specified columns are missing.
+    """
+    stream, compression = open_decompressed_stream(stream)
+    if csv_engine == "splice":
+        chunks = _obfuscate_csv_blocks(
+            split_record_blocks(
+                iter(partial(stream.read, DEFAULT_SPLICE_BLOCK_SIZE), b""),
+                quoted=True,
+            ),
+            pii_fields,
+            masking,
+            1,
+            csv_engine,
+        )
+    else:
+        chunks = _obfuscate_csv_chunks(
+            stream, pii_fields, chunksize, masking, csv_engine
+        )
+    yield from compress_chunks(chunks, compression, compression_level)
+
+
+def _obfuscate_csv_chunks(
+    stream, pii_fields, chunksize, masking, csv_engine
+):
+    """
+    Read, mask and serialise the rows of a decompressed CSV stream.
+    """
+    import pandas as pd
+
+    dtypes = None
+    if csv_engine == "pandas":
+        head = _read_head(stream, CSV_DTYPE_SAMPLE_BYTES + 1)
+        dtypes = infer_csv_dtypes(head)
+        rest = iter(partial(stream.read, DEFAULT_SPLICE_BLOCK_SIZE), b"")
+        stream = open_parts_stream(itertools.chain([head], rest))
+
+    header = True
+    for chunk in pd.read_csv(
+        stream,
+        chunksize=chunksize,
+        **csv_read_options(pii_fields, csv_engine),
+    ):
+        chunk = apply_csv_dtypes(chunk, dtypes)
+        obfuscated_chunk = obfuscate_pii_fields(chunk, pii_fields, masking)
+        yield obfuscated_chunk.to_csv(index=False, header=header).encode(
+            "utf-8"
+        )
+        header = False
+
+    if header:
+        logging.error("Provided CSV stream contains no rows.")
+        raise ValueError(
+            "Input DataFrame is empty. Cannot proceed with processing."
+        )
+
+
+def _read_head(stream, size):
+    """
+    Read up to size bytes from the start of a stream, fewer only if the
+    stream ends first.
+    """
+    head = b""
+    while len(head) < size:
+        data = stream.read(size - len(head))
+        if not data:
+            break
+        head += data
+    return head
+
+
+def infer_csv_dtypes(content):
+    """
+    Infer the type of each CSV column from the head of a file, for
+    utils.apply_csv_dtypes to convert every chunk of the file with.
+
+    Only the first CSV_DTYPE_SAMPLE_BYTES of the content are read, cut at
+    the last record boundary, so the same types are inferred however the
+    rest of the file is split. Columns pandas reads as integers, floats or
+    booleans are typed; the rest, and columns with no values in the head,
+    are kept as text.
+
+    Args:
+        content (bytes | mmap.mmap): The decompressed CSV content, starting
+            with the header. Content longer than CSV_DTYPE_SAMPLE_BYTES
+            need not be complete, but must be at least a byte longer.
+
+    Returns:
+        dict: The 'Int64', 'Float64' or 'boolean' type of each typed column.
+    """
+    import pandas as pd
+
+    head = content[:CSV_DTYPE_SAMPLE_BYTES]
+    if len(content) > CSV_DTYPE_SAMPLE_BYTES:
+        head = head[: _record_boundary(head, quoted=True)]
+    try:
+        df = pd.read_csv(io.BytesIO(head), dtype_backend="numpy_nullable")
+    except ValueError:
+        # A head that cannot be parsed on its own is read as text
+        return {}
+
+    dtypes = {}
+    for column, dtype in df.dtypes.items():
+        if str(dtype) in ("Int64", "Float64", "boolean") and (
+            df[column].notna().any()
+        ):
+            dtypes[column] = str(dtype)
+    return dtypes
+
+
+def _mask_records(records, strategies):
+    """
+    Mask the PII fields of a chunk of records in place, returning the
+    names of the fields found in them.
+    """
+    found = set()
+    for field, options in strategies.items():
+        present = [record for record in records if field in record]
+        if not present:
+            continue
+        found.add(field)
+
+        if options["strategy"] == "mask":
+            for record in present:
+                value = record[field]
+                record[field] = (
+                    MISSING_VALUE
+                    if value is None or value != value
+                    else MASK_VALUE
+                )
+        else:
+            from src.masking import mask_values
+
+            masked = mask_values(
+                [record[field] for record in present], options
+            )
+            for record, value in zip(present, masked):
+                record[field] = value
+    return found
+
+
+def obfuscate_ndjson_stream(
+    stream,
+    pii_fields,
+    chunksize=DEFAULT_CHUNKSIZE,
+    masking=None,
+    compression_level=None,
+):
+    """
+    Obfuscate a JSON Lines (NDJSON) stream record by record, yielding the
+    output as NDJSON bytes.
+
+    Lines are parsed and masked in chunks of records, so peak memory is
+    bounded by the chunk size rather than the size of the file. A gzip,
+    zstd or bz2 compressed stream is detected from its first bytes,
+    decompressed as it is read and the output is compressed again with the
+    same codec.
+
+    Records may leave out fields, so a PII field is only reported missing
+    once the whole stream has been read without finding it.
+
+    Args:
+        stream (file-like): A binary stream of NDJSON data, e.g. an S3 StreamingBody.
+        pii_fields (list): A list of fields that contain personally identifiable information.
+        chunksize (int): The number of records to read and obfuscate per chunk.
+        masking (dict): Optional masking strategy for each field, if not the default 'mask'.
+        compression_level (int): The level to compress the output at, or None for the codec's default.
+
+    Yields:
+        bytes: The obfuscated NDJSON content, one record per line.
+
+    Raises:
+        ValueError: If a line is not a JSON object, the stream has no
+                    records or specified fields are missing.
+    """
+    stream, compression = open_decompressed_stream(stream)
+    yield from compress_chunks(
+        _obfuscate_ndjson_lines(stream, pii_fields, chunksize, masking),
+        compression,
+        compression_level,
+    )
+
+
+def _resolve_strategies(pii_fields, masking):
+    """
+    Resolve the masking strategy of each PII field, only importing the
+    masking module when a strategy other than 'mask' is asked for.
+    """
+    if masking:
+        from src.masking import resolve_masking
+
+        return resolve_masking(pii_fields, masking)
+    return {field: {"strategy": "mask"} for field in pii_fields}
+
+
+def _parse_ndjson_line(line, line_number):
+    """
+    Parse one line of NDJSON into a record.
+    """
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as e:
+        logging.error(f"Invalid JSON on line {line_number}.")
+        raise ValueError(
+            f"Invalid JSON Lines input: line {line_number} is not valid JSON."
+        ) from e
+    if not isinstance(record, dict):
+        logging.error(f"Line {line_number} is not a JSON object.")
+        raise ValueError(
+            f"Invalid JSON Lines input: line {line_number} is not a JSON object."
+        )
+    return record
+
+
+def _obfuscate_ndjson_lines(stream, pii_fields, chunksize, masking):
+    """
+    Parse, mask and serialise the lines of a decompressed NDJSON stream.
+    """
+    strategies = _resolve_strategies(pii_fields, masking)
+
+    found = set()
+    records = []
+    has_records = False
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        records.append(_parse_ndjson_line(line, line_number))
+        if len(records) >= chunksize:
+            found |= _mask_records(records, strategies)
+            yield _dump_ndjson(records)
+            records = []
+            has_records = True
+
+    if records:
+        found |= _mask_records(records, strategies)
+        yield _dump_ndjson(records)
+        has_records = True
+
+    if not has_records:
+        logging.error("Provided NDJSON stream contains no records.")
+        raise ValueError(
+            "Input DataFrame is empty. Cannot proceed with processing."
+        )
+    validate_pii_fields(found, pii_fields)
+
+
+def _dump_ndjson(records):
+    """
+    Serialise records as NDJSON, one compact JSON object per line.
+    """
+    return "".join(
+        json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        for record in records
+    ).encode("utf-8")
+
+
+def _record_boundary(block, quoted):
+    """
+    Find the end of the last complete record in a block that starts on a
+    record boundary, or 0 if it holds no complete record. In quoted (CSV)
+    content, a newline inside a quoted field does not end a record.
+    """
+    end = block.rfind(b"\n")
+    while quoted and end >= 0 and block.count(b'"', 0, end) % 2:
+        end = block.rfind(b"\n", 0, end)
+    return end + 1
+
+
+def split_record_blocks(parts, quoted=False):
+    """
+    Re-split consecutive byte parts, such as ranged downloads, into blocks
+    that each end on a record boundary, so every block can be parsed on
+    its own.
+
+    Args:
+        parts (Iterable[bytes]): The content, in order.
+        quoted (bool): Whether newlines inside double quotes belong to the
+            record, as in CSV. Records are split on every newline otherwise.
+
+    Yields:
+        bytes: Consecutive blocks of whole records.
+    """
+    carry = b""
+    for part in parts:
+        block = carry + part
+        end = _record_boundary(block, quoted)
+        carry = block[end:]
+        if end:
+            yield block[:end]
+    if carry:
+        yield carry
+
+
+def _map_in_order(function, items, max_workers):
+    """
+    Apply a function to each item on a thread pool, yielding the results in
+    order, with at most twice max_workers items submitted ahead.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(pool.submit(function, *item))
+                if len(pending) >= max_workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _obfuscate_csv_block(
+    header, block, pii_fields, masking, csv_engine="pandas", dtypes=None
+):
+    """
+    Parse and mask a block of CSV records, returning them without a header.
+    The 'pandas' engine converts the columns to dtypes, from
+    infer_csv_dtypes.
+    """
+    if csv_engine == "splice":
+        from src.splice_engine import splice_csv_block
+
+        return splice_csv_block(header, block, pii_fields, masking)
+
+    import pandas as pd
+
+    df = pd.read_csv(
+        io.BytesIO(header + block), **csv_read_options(pii_fields, csv_engine)
+    )
+    if df.empty:
+        return b"", 0
+    df = apply_csv_dtypes(df, dtypes)
+    obfuscated_df = obfuscate_pii_fields(df, pii_fields, masking)
+    return (
+        obfuscated_df.to_csv(index=False, header=False).encode("utf-8"),
+        len(df),
+    )
+
+
+def read_csv_header(content, pii_fields, csv_engine="pandas"):
+    """
+    Split the header line off the start of some CSV content and check that
+    the PII fields are among its columns.
+
+    Args:
+        content (bytes | mmap.mmap): CSV content starting with the header line.
+        pii_fields (list): A list of columns that contain personally identifiable information.
+        csv_engine (str): The CSV engine the rest of the file is masked with.
+
+    Returns:
+        tuple: The header line as it appears in the content, and the header
+               as it is written to the masked output: as pandas writes it,
+               or unchanged for the splice engine.
+
+    Raises:
+        ValueError: If specified columns are missing.
+    """
+    header_end = content.find(b"\n")
+    # Memory maps have no count, but their slices are bytes
+    while header_end >= 0 and content[:header_end].count(b'"') % 2:
+        header_end = content.find(b"\n", header_end + 1)
+    # Without a newline, the whole file is the header
+    header = content[: header_end + 1 or len(content)]
+    if csv_engine == "splice":
+        from src.splice_engine import pii_column_indices
+
+        pii_column_indices(header, pii_fields)
+        return header, header
+
+    import pandas as pd
+
+    columns = pd.read_csv(io.BytesIO(header)).columns
+    validate_pii_fields(columns, pii_fields)
+    return header, pd.DataFrame(columns=columns).to_csv(index=False).encode(
+        "utf-8"
+    )
+
+
+def obfuscate_csv_parts(
+    parts,
+    pii_fields,
+    masking=None,
+    compression_level=None,
+    max_workers=DEFAULT_PARSE_WORKERS,
+    csv_engine="pandas",
+):
+    """
+    Obfuscate a CSV file that arrives in consecutive byte parts, such as
+    concurrent ranged downloads, yielding the output as bytes.
+
+    The parts are re-split on record boundaries, and the blocks are parsed
+    and masked in parallel on max_workers threads while later parts are
+    still downloading. Output is yielded in order. Compressed content
+    cannot be split, so it is streamed through obfuscate_csv_stream.
+
+    Args:
+        parts (Iterable[bytes]): The CSV content, in order.
+        pii_fields (list): A list of columns that contain personally identifiable information.
+        masking (dict): Optional masking strategy for each field, if not the default 'mask'.
+        compression_level (int): The level to compress the output at, or None for the codec's default.
+        max_workers (int): The number of threads parsing and masking blocks.
+        csv_engine (str): 'pandas' to infer column types, 'strings' to read every column as text, or 'splice' to copy everything but the PII cells unchanged (see utils.csv_read_options).
+
+    Yields:
+        bytes: The obfuscated CSV content, starting with the header.
+
+    Raises:
+        ValueError: If the CSV has no rows or if specified columns are missing.
+    """
+    parts = iter(parts)
+    first_part = next(parts, b"")
+    parts = itertools.chain([first_part], parts)
+    if detect_compression(first_part[:MAGIC_LENGTH]):
+        yield from obfuscate_csv_stream(
+            open_parts_stream(parts),
+            pii_fields,
+            masking=masking,
+            compression_level=compression_level,
+            csv_engine=csv_engine,
+        )
+        return
+
+    yield from _obfuscate_csv_blocks(
+        split_record_blocks(parts, quoted=True),
+        pii_fields,
+        masking,
+        max_workers,
+        csv_engine,
+    )
+
+
+def _obfuscate_csv_blocks(
+    blocks, pii_fields, masking, max_workers, csv_engine
+):
+    """
+    Mask uncompressed CSV content split into blocks of whole records on a
+    thread pool, yielding the header and then each block's output in order.
+    """
+    first_block = next(blocks, b"")
+    header, output_header = read_csv_header(
+        first_block, pii_fields, csv_engine
+    )
+    yield output_header
+    blocks = itertools.chain([first_block[len(header) :]], blocks)
+
+    dtypes = None
+    if csv_engine == "pandas":
+        # Hold back enough blocks to infer the column types from
+        head_blocks, size = [], 0
+        for block in blocks:
+            head_blocks.append(block)
+            size += len(block)
+            if len(header) + size > CSV_DTYPE_SAMPLE_BYTES:
+                break
+        dtypes = infer_csv_dtypes(header + b"".join(head_blocks))
+        blocks = itertools.chain(head_blocks, blocks)
+
+    rows = 0
+    for output, block_rows in _map_in_order(
+        _obfuscate_csv_block,
+        (
+            (header, block, pii_fields, masking, csv_engine, dtypes)
+            for block in blocks
+            if block
+        ),
+        max_workers,
+    ):
+        rows += block_rows
+        if output:
+            yield output
+
+    if not rows:
+        logging.error("Provided CSV stream contains no rows.")
+        raise ValueError(
+            "Input DataFrame is empty. Cannot proceed with processing."
+        )
+
+
+def _obfuscate_ndjson_block(block, first_line_number, strategies):
+    """
+    Parse and mask a block of NDJSON lines, returning the output, the PII
+    fields found and the number of records.
+    """
+    records = [
+        _parse_ndjson_line(line, line_number)
+        for line_number, line in enumerate(
+            block.split(b"\n"), first_line_number
+        )
+        if line.strip()
+    ]
+    found = _mask_records(records, strategies)
+    return _dump_ndjson(records), found, len(records)
+
+
+def obfuscate_ndjson_parts(
+    parts,
+    pii_fields,
+    masking=None,
+    compression_level=None,
+    max_workers=DEFAULT_PARSE_WORKERS,
+):
+    """
+    Obfuscate a JSON Lines (NDJSON) file that arrives in consecutive byte
+    parts, such as concurrent ranged downloads, yielding NDJSON bytes.
+
+    The parts are re-split on line boundaries, and the blocks are parsed
+    and masked in parallel on max_workers threads while later parts are
+    still downloading. Output is yielded in order. Compressed content
+    cannot be split, so it is streamed through obfuscate_ndjson_stream.
+
+    Args:
+        parts (Iterable[bytes]): The NDJSON content, in order.
+        pii_fields (list): A list of fields that contain personally identifiable information.
+        masking (dict): Optional masking strategy for each field, if not the default 'mask'.
+        compression_level (int): The level to compress the output at, or None for the codec's default.
+        max_workers (int): The number of threads parsing and masking blocks.
+
+    Yields:
+        bytes: The obfuscated NDJSON content, one record per line.
+
+    Raises:
+        ValueError: If a line is not a JSON object, the file has no
+                    records or specified fields are missing.
+    """
+    parts = iter(parts)
+    first_part = next(parts, b"")
+    parts = itertools.chain([first_part], parts)
+    if detect_compression(first_part[:MAGIC_LENGTH]):
+        yield from obfuscate_ndjson_stream(
+            open_parts_stream(parts),
+            pii_fields,
+            masking=masking,
+            compression_level=compression_level,
+        )
+        return
+
+    strategies = _resolve_strategies(pii_fields, masking)
+
+    def numbered_blocks():
+        line_number = 1
+        for block in split_record_blocks(parts):
+            yield block, line_number, strategies
+            line_number += block.count(b"\n")
+
+    found = set()
+    records = 0
+    for output, block_found, block_records in _map_in_order(
+        _obfuscate_ndjson_block, numbered_blocks(), max_workers
+    ):
+        found |= block_found
+        records += block_records
+        if output:
+            yield output
+
+    if not records:
+        logging.error("Provided NDJSON stream contains no records.")
+        raise ValueError(
+            "Input DataFrame is empty. Cannot proceed with processing."
+        )
+    validate_pii_fields(found, pii_fields)
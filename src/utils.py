@@ -1,15 +1,41 @@
 import json
-import pandas as pd
-import numpy as np
 import logging
+from typing import TYPE_CHECKING
+from src.compression import COMPRESSION_EXTENSIONS
+from src.local_files import FILE_SCHEME, STDIO_PATH
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 logging.basicConfig(level=logging.INFO)
 
+MASK_VALUE = "******"
+MISSING_VALUE = "MISSING VALUE"
+SUPPORTED_FILE_TYPES = ["csv", "parquet", "json", "jsonl", "ndjson"]
+NDJSON_FILE_TYPES = ["jsonl", "ndjson"]
+CSV_ENGINES = ["pandas", "strings", "splice"]
+# The strings pandas reads as booleans by default
+CSV_BOOLEAN_VALUES = {
+    "True": True,
+    "TRUE": True,
+    "true": True,
+    "False": False,
+    "FALSE": False,
+    "false": False,
+}
+MIN_PART_SIZE_MB = 5
+
 
 def read_json_input(json_string):
     """
     Parse a JSON string to extract 'file_to_obfuscate' and 'pii_fields'.
 
+    The file can be an S3 URI, a 'file://' URI or '-' for standard input.
+    Its type is worked out from its extension unless the optional
+    'file_type' key gives it, which standard input needs. 'pii_fields' may
+    be left out when the optional 'detect_pii' key is true, so that only
+    the detected PII columns are obfuscated.
+
     Args:
         json_string (str): A JSON string containing the keys 'file_to_obfuscate' and 'pii_fields'.
 
@@ -34,35 +60,343 @@ def read_json_input(json_string):
 
     file_to_obfuscate = input_data.get("file_to_obfuscate")
     pii_fields = input_data.get("pii_fields")
+    detect_pii = input_data.get("detect_pii") is True
 
-    if not file_to_obfuscate or not pii_fields:
+    if not file_to_obfuscate or not (pii_fields or detect_pii):
         logging.error("'file_to_obfuscate' or 'pii_fields' not provided.")
         raise ValueError(
             "Invalid input: 'file_to_obfuscate' and 'pii_fields' are required."
         )
 
-    if not file_to_obfuscate.startswith("s3://"):
-        logging.error("File path does not start with 's3://'.")
-        raise ValueError("Invalid S3 path in 'file_to_obfuscate'.")
+    if not _is_valid_path(file_to_obfuscate):
+        logging.error(
+            "File path does not start with 's3://' or 'file://' and is not '-'."
+        )
+        raise ValueError("Invalid S3 or local path in 'file_to_obfuscate'.")
+
+    file_type = input_data.get("file_type")
+    if file_type is None and file_to_obfuscate == STDIO_PATH:
+        logging.error("'file_type' not provided for standard input.")
+        raise ValueError(
+            "Invalid input: 'file_type' is required when reading from standard input."
+        )
+    check_file_type(file_type or get_file_type(file_to_obfuscate))
+
+    return file_to_obfuscate, pii_fields or []
+
+
+def _is_valid_path(path):
+    """
+    Check that a path is an S3 URI, a 'file://' URI or '-'.
+    """
+    return isinstance(path, str) and (
+        path.startswith(("s3://", FILE_SCHEME)) or path == STDIO_PATH
+    )
+
+
+def get_file_type(file_path):
+    """
+    Work out the type of a file from its extension. A compression suffix
+    ('.gz', '.zst' or '.bz2') is ignored, as compressed files are
+    decompressed transparently.
+
+    Args:
+        file_path (str): The path or URI of the file.
+
+    Returns:
+        str: The lower-case file type, e.g. 'csv' or 'jsonl'.
+    """
+    extensions = file_path.lower().rsplit(".", 2)
+    if len(extensions) == 3 and extensions[2] in COMPRESSION_EXTENSIONS:
+        return extensions[1]
+    return extensions[-1]
+
+
+def check_file_type(file_type):
+    """
+    Check that a file type is supported.
 
-    _, file_type = file_to_obfuscate.rsplit(".", 1)
-    file_type = file_type.lower()
-    if file_type not in ["csv", "parquet", "json"]:
+    Args:
+        file_type (str): The file type, as returned by get_file_type.
+
+    Raises:
+        ValueError: If the file type is not supported.
+    """
+    if file_type not in SUPPORTED_FILE_TYPES:
         logging.error(f"Unsupported file type: {file_type}")
         raise ValueError(
-            f"Unsupported file type: {file_type}. Supported types are csv, parquet, and json."
+            f"Unsupported file type: {file_type}. Supported types are {', '.join(SUPPORTED_FILE_TYPES)}."
         )
 
-    return file_to_obfuscate, pii_fields
 
+def read_optional_input(json_string):
+    """
+    Parse the optional settings from an input JSON string that has already
+    been validated by read_json_input.
+
+    Args:
+        json_string (str): A JSON string that may contain the optional keys
+            'destination', 'part_size_mb', 'upload_concurrency',
+            'fast_path_max_bytes', 'masking', 'compression_level',
+            'download_part_size_mb', 'download_concurrency', 'workers',
+            'csv_engine', 'file_type' and 'detect_pii'.
 
-def obfuscate_pii_fields(df: pd.DataFrame, pii_fields):
+    Returns:
+        dict: The optional settings, with None for any that are not provided.
+
+    Raises:
+        ValueError: If an optional setting is provided with an invalid value.
+    """
+    input_data = json.loads(json_string)
+    options = {
+        "destination": input_data.get("destination"),
+        "part_size_mb": input_data.get("part_size_mb"),
+        "upload_concurrency": input_data.get("upload_concurrency"),
+        "fast_path_max_bytes": input_data.get("fast_path_max_bytes"),
+        "masking": input_data.get("masking"),
+        "compression_level": input_data.get("compression_level"),
+        "download_part_size_mb": input_data.get("download_part_size_mb"),
+        "download_concurrency": input_data.get("download_concurrency"),
+        "workers": input_data.get("workers"),
+        "csv_engine": input_data.get("csv_engine"),
+        "file_type": input_data.get("file_type"),
+        "detect_pii": input_data.get("detect_pii"),
+    }
+
+    destination = options["destination"]
+    if destination is not None and not _is_valid_path(destination):
+        logging.error(
+            "Destination does not start with 's3://' or 'file://' and is not '-'."
+        )
+        raise ValueError("Invalid S3 or local path in 'destination'.")
+
+    part_size_mb = options["part_size_mb"]
+    if part_size_mb is not None and (
+        not isinstance(part_size_mb, (int, float))
+        or part_size_mb < MIN_PART_SIZE_MB
+    ):
+        logging.error(f"Invalid part size: {part_size_mb}")
+        raise ValueError(
+            f"Invalid input: 'part_size_mb' must be a number of at least {MIN_PART_SIZE_MB}."
+        )
+
+    upload_concurrency = options["upload_concurrency"]
+    if upload_concurrency is not None and (
+        not isinstance(upload_concurrency, int) or upload_concurrency < 1
+    ):
+        logging.error(f"Invalid upload concurrency: {upload_concurrency}")
+        raise ValueError(
+            "Invalid input: 'upload_concurrency' must be a positive integer."
+        )
+
+    fast_path_max_bytes = options["fast_path_max_bytes"]
+    if fast_path_max_bytes is not None and (
+        not isinstance(fast_path_max_bytes, int) or fast_path_max_bytes < 0
+    ):
+        logging.error(f"Invalid fast path size: {fast_path_max_bytes}")
+        raise ValueError(
+            "Invalid input: 'fast_path_max_bytes' must be a non-negative integer."
+        )
+
+    # The strategies themselves are checked by src.masking.resolve_masking
+    masking = options["masking"]
+    if masking is not None and not isinstance(masking, dict):
+        logging.error("'masking' is not a JSON object.")
+        raise ValueError(
+            "Invalid input: 'masking' must map PII fields to strategies."
+        )
+
+    # The range of levels depends on the codec, checked by src.compression
+    compression_level = options["compression_level"]
+    if compression_level is not None and (
+        not isinstance(compression_level, int)
+        or isinstance(compression_level, bool)
+    ):
+        logging.error(f"Invalid compression level: {compression_level}")
+        raise ValueError(
+            "Invalid input: 'compression_level' must be an integer."
+        )
+
+    download_part_size_mb = options["download_part_size_mb"]
+    if download_part_size_mb is not None and (
+        not isinstance(download_part_size_mb, (int, float))
+        or download_part_size_mb <= 0
+    ):
+        logging.error(f"Invalid download part size: {download_part_size_mb}")
+        raise ValueError(
+            "Invalid input: 'download_part_size_mb' must be a positive number."
+        )
+
+    download_concurrency = options["download_concurrency"]
+    if download_concurrency is not None and (
+        not isinstance(download_concurrency, int) or download_concurrency < 1
+    ):
+        logging.error(f"Invalid download concurrency: {download_concurrency}")
+        raise ValueError(
+            "Invalid input: 'download_concurrency' must be a positive integer."
+        )
+
+    workers = options["workers"]
+    if workers is not None and (
+        not isinstance(workers, int)
+        or isinstance(workers, bool)
+        or workers < 1
+    ):
+        logging.error(f"Invalid number of workers: {workers}")
+        raise ValueError(
+            "Invalid input: 'workers' must be a positive integer."
+        )
+
+    csv_engine = options["csv_engine"]
+    if csv_engine is not None and csv_engine not in CSV_ENGINES:
+        logging.error(f"Unknown CSV engine: {csv_engine}")
+        raise ValueError(
+            "Invalid input: 'csv_engine' must be one of "
+            f"{', '.join(CSV_ENGINES)}."
+        )
+
+    if options["file_type"] is not None:
+        check_file_type(options["file_type"])
+
+    if options["detect_pii"] is not None and not isinstance(
+        options["detect_pii"], bool
+    ):
+        logging.error(f"Invalid detect_pii flag: {options['detect_pii']}")
+        raise ValueError("Invalid input: 'detect_pii' must be true or false.")
+
+    return options
+
+
+def csv_read_options(pii_fields, csv_engine="pandas"):
+    """
+    Build the pd.read_csv arguments for a CSV engine.
+
+    The 'pandas' engine reads every column as text, missing values aside,
+    and converts the columns to the types inferred from the head of the
+    file afterwards (see streaming.infer_csv_dtypes and apply_csv_dtypes).
+    The types therefore do not depend on how the file is split into chunks,
+    blocks or partitions, so the output is the same whether a file is
+    masked whole, streamed or split between workers. Floats and booleans
+    may still be written back formatted differently. The
+    'strings' engine reads every column as the text in the file, skipping
+    type inference, so the values of untouched columns are written back
+    unchanged. Only the PII fields are checked for missing values, using
+    the strings pandas treats as missing by default. The 'splice' engine
+    does not use pandas at all (see src.splice_engine).
+
+    Args:
+        pii_fields (list): A list of columns that contain personally identifiable information.
+        csv_engine (str): One of CSV_ENGINES.
+
+    Returns:
+        dict: Keyword arguments for pd.read_csv.
+    """
+    if csv_engine != "strings":
+        return {"dtype": str}
+
+    from src.stdlib_engine import NA_VALUES
+
+    return {
+        "dtype": str,
+        "keep_default_na": False,
+        "na_values": {field: sorted(NA_VALUES) for field in pii_fields},
+    }
+
+
+def apply_csv_dtypes(df: "pd.DataFrame", dtypes):
+    """
+    Convert the columns of a DataFrame read as text to the types inferred
+    for them from the head of the file.
+
+    A column is converted whole when all of its values fit its type.
+    Otherwise only the values that fit are converted and the rest keep
+    their text, so every value is written back the same way whichever
+    rows it happened to be read with.
+
+    Args:
+        df (pd.DataFrame): CSV rows read with csv_read_options.
+        dtypes (dict): The 'Int64', 'Float64' or 'boolean' type of each
+            typed column, from streaming.infer_csv_dtypes.
+
+    Returns:
+        pd.DataFrame: The DataFrame with its typed columns converted.
+    """
+    if not dtypes:
+        return df
+
+    import pandas as pd
+
+    df = df.copy(deep=False)
+    for column, dtype in dtypes.items():
+        if column not in df.columns:
+            continue
+        values = df[column]
+        if dtype == "boolean":
+            flags = values.map(CSV_BOOLEAN_VALUES)
+            fits = flags.notna()
+            df[column] = (
+                flags.astype("boolean")
+                if (fits | values.isna()).all()
+                else values.mask(fits, flags)
+            )
+            continue
+
+        try:
+            numbers = pd.to_numeric(values, dtype_backend="numpy_nullable")
+            if (
+                dtype == "Int64"
+                and numbers.dtype.kind not in "iu"
+                and numbers.notna().any()
+            ):
+                raise ValueError("Not every value is an integer.")
+            df[column] = numbers.astype(dtype)
+            continue
+        except (ValueError, TypeError, OverflowError):
+            pass
+
+        if dtype == "Int64":
+            fits = values.str.fullmatch(r"\s*[+-]?[0-9]+\s*").fillna(False)
+            numbers = pd.to_numeric(values[fits]).astype(object)
+        else:
+            numbers = pd.to_numeric(values, errors="coerce").astype(object)
+            fits = numbers.notna()
+        df[column] = values.mask(fits, numbers)
+    return df
+
+
+def validate_pii_fields(columns, pii_fields):
+    """
+    Check that every PII field to obfuscate is present in the given columns.
+
+    Args:
+        columns (Iterable[str]): The column names available in the dataset.
+        pii_fields (list): A list of columns that contain personally identifiable information.
+
+    Raises:
+        ValueError: If any of the specified columns are missing.
+    """
+    columns = set(columns)
+    missing_columns = [col for col in pii_fields if col not in columns]
+    if missing_columns:
+        logging.error(f"Missing columns: {', '.join(missing_columns)}")
+        raise ValueError(
+            f"The following columns to obfuscate are missing in the DataFrame provided. Missing columns: {', '.join(missing_columns)}"
+        )
+
+
+def obfuscate_pii_fields(df: "pd.DataFrame", pii_fields, masking=None):
     """
     Obfuscate specified fields in a DataFrame by replacing values with asterisks.
 
+    Masked columns are built as categoricals with two categories, so each
+    one costs a single int8 code per row rather than a Python string, and
+    the input DataFrame is left unchanged. Fields given another strategy in
+    masking (see src.masking) are transformed once per distinct value.
+
     Args:
         df (pd.DataFrame): The DataFrame to obfuscate.
         pii_fields (list): A list of columns in the DataFrame that contain personally identifiable information.
+        masking (dict): Optional masking strategy for each field, if not the default 'mask'.
 
     Returns:
         pd.DataFrame: The obfuscated DataFrame.
@@ -76,18 +410,30 @@ def obfuscate_pii_fields(df: pd.DataFrame, pii_fields):
             "Input DataFrame is empty. Cannot proceed with processing."
         )
 
-    missing_columns = [col for col in pii_fields if col not in df.columns]
-    if missing_columns:
-        logging.error(f"Missing columns: {', '.join(missing_columns)}")
-        raise ValueError(
-            f"The following columns to obfuscate are missing in the DataFrame provided. Missing columns: {', '.join(missing_columns)}"
-        )
+    validate_pii_fields(df.columns, pii_fields)
+
+    import numpy as np
+    import pandas as pd
 
-    df = df.copy()
+    strategies = {}
+    if masking:
+        from src.masking import resolve_masking
+
+        strategies = resolve_masking(pii_fields, masking)
+
+    # Only the PII columns are replaced; the rest are shared with the input
+    df = df.copy(deep=False)
     try:
         for column in pii_fields:
-            df[column] = np.where(
-                df[column].isnull(), "MISSING VALUE", "******"
+            options = strategies.get(column, {"strategy": "mask"})
+            if options["strategy"] != "mask":
+                from src.masking import mask_series
+
+                df[column] = mask_series(df[column], options)
+                continue
+            df[column] = pd.Categorical.from_codes(
+                df[column].isnull().to_numpy(dtype=np.int8),
+                categories=[MASK_VALUE, MISSING_VALUE],
             )
         return df
     except Exception as e:
@@ -0,0 +1,190 @@
+import pytest
+import asyncio
+import json
+import threading
+import time
+import src.async_api
+from src.async_api import (
+    configure_async_concurrency,
+    download_s3_file_bytes_async,
+    obfuscate,
+    upload_bytes_to_s3_async,
+)
+from src.file_handling import get_s3_client
+from src.main import main
+
+
+@pytest.fixture
+def concurrency_limit():
+    """
+    Restore the default concurrent request limit after the test.
+    """
+    yield
+    configure_async_concurrency(
+        src.async_api.DEFAULT_MAX_CONCURRENT_REQUESTS
+    )
+
+
+class TestObfuscate:
+    """
+    Tests for the asynchronous `obfuscate` function.
+    """
+
+    def test_output_matches_main(self, mock_s3_setup):
+        """
+        Test that the asynchronous API returns the same output as main.
+        """
+        files = {
+            "csv_data.csv": ["name", "email_address"],
+            "json_data.json": ["data"],
+            "parquet_data.parquet": ["name", "email_address"],
+        }
+        for key, pii_fields in files.items():
+            input_json = json.dumps(
+                {
+                    "file_to_obfuscate": f"s3://mybucket/{key}",
+                    "pii_fields": pii_fields,
+                }
+            )
+            assert asyncio.run(obfuscate(input_json)) == main(input_json)
+
+    def test_uploads_to_destination(self, mock_s3_setup):
+        """
+        Test that the output is uploaded when a destination is given.
+        """
+        result = asyncio.run(
+            obfuscate(
+                json.dumps(
+                    {
+                        "file_to_obfuscate": "s3://mybucket/csv_data.csv",
+                        "pii_fields": ["name"],
+                        "destination": "s3://mybucket/out/csv_data.csv",
+                    }
+                )
+            )
+        )
+
+        body = mock_s3_setup.get_object(
+            Bucket="mybucket", Key="out/csv_data.csv"
+        )["Body"].read()
+        assert result == "s3://mybucket/out/csv_data.csv"
+        assert b"1234,******,Data Science" in body
+
+    def test_concurrent_calls_are_limited(
+        self, mock_s3_setup, monkeypatch, concurrency_limit
+    ):
+        """
+        Test that no more calls than the configured limit run at once,
+        while the rest wait and still complete.
+        """
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def slow_obfuscate(*args):
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+            return b"done"
+
+        monkeypatch.setattr(
+            src.async_api, "_obfuscate_content", slow_obfuscate
+        )
+        configure_async_concurrency(2)
+        input_json = json.dumps(
+            {
+                "file_to_obfuscate": "s3://mybucket/csv_data.csv",
+                "pii_fields": ["name"],
+            }
+        )
+
+        async def run_all():
+            return await asyncio.gather(
+                *(obfuscate(input_json) for _ in range(6))
+            )
+
+        assert asyncio.run(run_all()) == [b"done"] * 6
+        assert max(peak) == 2
+
+    def test_errors_with_invalid_limit(self):
+        """
+        Test that the concurrent request limit must be a positive integer.
+        """
+        with pytest.raises(ValueError, match="positive integer"):
+            configure_async_concurrency(0)
+
+
+class TestAsyncTransfers:
+    """
+    Tests for the asynchronous download and upload functions.
+    """
+
+    def test_ranged_download_reassembles_content(self, mock_s3_setup):
+        """
+        Test that content fetched in concurrent ranges is reassembled in
+        order, and that empty objects download as empty bytes.
+        """
+        content = bytes(range(256)) * 40
+        mock_s3_setup.put_object(
+            Bucket="mybucket", Key="big.bin", Body=content
+        )
+
+        assert (
+            asyncio.run(
+                download_s3_file_bytes_async(
+                    "s3://mybucket/big.bin", part_size=1000, max_concurrency=3
+                )
+            )
+            == content
+        )
+        assert (
+            asyncio.run(
+                download_s3_file_bytes_async("s3://mybucket/csv_empty.csv")
+            )
+            == b""
+        )
+
+    def test_cancellation_aborts_multipart_upload(
+        self, mock_s3_setup, monkeypatch
+    ):
+        """
+        Test that cancelling an upload waits for the parts being sent and
+        aborts the multipart upload, leaving no object or upload behind.
+        """
+        s3 = get_s3_client()
+        upload_part = s3.upload_part
+        started = threading.Event()
+
+        def slow_upload_part(**kwargs):
+            started.set()
+            time.sleep(0.1)
+            return upload_part(**kwargs)
+
+        monkeypatch.setattr(s3, "upload_part", slow_upload_part)
+
+        async def cancel_upload():
+            task = asyncio.create_task(
+                upload_bytes_to_s3_async(
+                    b"x" * 100,
+                    "s3://mybucket/out/cancelled.csv",
+                    part_size=10,
+                    max_concurrency=2,
+                )
+            )
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            task.cancel()
+            await task
+
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(cancel_upload())
+
+        uploads = mock_s3_setup.list_multipart_uploads(Bucket="mybucket")
+        assert uploads.get("Uploads", []) == []
+        objects = mock_s3_setup.list_objects_v2(
+            Bucket="mybucket", Prefix="out/"
+        )
+        assert objects["KeyCount"] == 0
@@ -0,0 +1,290 @@
+import pytest
+import threading
+import time
+import src.batch
+from src.batch import obfuscate_batch
+from src.manifest import Manifest, config_hash, head_s3_etag
+
+
+class TestObfuscateBatch:
+    """
+    Tests for the `obfuscate_batch` function.
+    """
+
+    expected_csv = (
+        b"student_id,name,course,cohort,graduation_date,email_address\n"
+        b"1234,******,Data Science,2023-08-15,2025-06-30,******\n"
+    )
+
+    def test_batch_of_uris_returns_result_per_file(self, mock_s3_setup):
+        """
+        Test that every file in a list of URIs gets its own result.
+        """
+        files = [
+            "s3://mybucket/csv_data.csv",
+            "s3://mybucket/parquet_data.parquet",
+        ]
+        results = {
+            result["file_to_obfuscate"]: result
+            for result in obfuscate_batch(files, ["name", "email_address"])
+        }
+
+        assert set(results) == set(files)
+        assert results["s3://mybucket/csv_data.csv"]["result"] == (
+            self.expected_csv
+        )
+        assert all(result["error"] is None for result in results.values())
+
+    def test_failures_are_reported_without_failing_the_batch(
+        self, mock_s3_setup
+    ):
+        """
+        Test that a prefix batch reports per-file errors and keeps going.
+        """
+        results = {
+            result["file_to_obfuscate"]: result
+            for result in obfuscate_batch(
+                "s3://mybucket/", ["name", "email_address"]
+            )
+        }
+
+        assert len(results) == 7
+        assert results["s3://mybucket/csv_data.csv"]["error"] is None
+        assert results["s3://mybucket/csv_empty_values.csv"]["result"] is None
+        assert (
+            "Input DataFrame is empty"
+            in results["s3://mybucket/csv_empty_values.csv"]["error"]
+        )
+
+    def test_in_flight_files_are_bounded(self, monkeypatch):
+        """
+        Test that no more than max_in_flight files are processed at once.
+        """
+        lock = threading.Lock()
+        counts = {"current": 0, "peak": 0}
+
+        def slow_obfuscate_one(file_to_obfuscate, pii_fields, cpu_pool):
+            with lock:
+                counts["current"] += 1
+                counts["peak"] = max(counts["peak"], counts["current"])
+            time.sleep(0.01)
+            with lock:
+                counts["current"] -= 1
+            return b""
+
+        monkeypatch.setattr(src.batch, "_obfuscate_one", slow_obfuscate_one)
+        files = [f"s3://mybucket/file_{i}.csv" for i in range(20)]
+        results = list(
+            obfuscate_batch(files, ["name"], io_workers=8, max_in_flight=3)
+        )
+
+        assert len(results) == 20
+        assert counts["peak"] <= 3
+
+    def test_masking_in_process_pool(self, mock_s3_setup):
+        """
+        Test that masking can be sent to a process pool.
+        """
+        results = list(
+            obfuscate_batch(
+                ["s3://mybucket/csv_data.csv"],
+                ["name", "email_address"],
+                cpu_workers=1,
+            )
+        )
+
+        assert results[0]["result"] == self.expected_csv
+
+    def test_invalid_inputs_return_error(self):
+        """
+        Test that missing PII fields or invalid limits raise a ValueError.
+        """
+        with pytest.raises(ValueError, match="'pii_fields' are required"):
+            list(obfuscate_batch(["s3://mybucket/csv_data.csv"], []))
+
+        with pytest.raises(ValueError, match="Invalid concurrency limits"):
+            list(
+                obfuscate_batch(
+                    ["s3://mybucket/csv_data.csv"], ["name"], io_workers=0
+                )
+            )
+
+        with pytest.raises(ValueError, match="'destination_for' is required"):
+            list(
+                obfuscate_batch(
+                    ["s3://mybucket/csv_data.csv"],
+                    ["name"],
+                    manifest=":memory:",
+                )
+            )
+
+
+class TestIncrementalBatch:
+    """
+    Tests for `obfuscate_batch` with a manifest of obfuscated files.
+    """
+
+    files = [
+        "s3://mybucket/csv_data.csv",
+        "s3://mybucket/parquet_data.parquet",
+    ]
+
+    def run(
+        self,
+        manifest,
+        pii_fields=("name", "email_address"),
+        masking=None,
+        prefix="s3://mybucket/obfuscated/",
+        write=None,
+    ):
+        results = list(
+            obfuscate_batch(
+                self.files,
+                list(pii_fields),
+                masking=masking,
+                manifest=manifest,
+                destination_for=lambda path: path.replace(
+                    "s3://mybucket/", prefix
+                ),
+            )
+        )
+        assert all(result["error"] is None for result in results)
+        for result in results:
+            if result["skipped"]:
+                assert result["record"] is None
+                continue
+            try:
+                if write is not None:
+                    write(result)
+            except OSError:
+                continue
+            result["record"]()
+        return {
+            result["file_to_obfuscate"]: result["skipped"]
+            for result in results
+        }
+
+    def test_unchanged_files_are_skipped_without_download(
+        self, mock_s3_setup, tmp_path, monkeypatch
+    ):
+        """
+        Test that a re-run skips every current file without downloading it.
+        """
+        manifest = str(tmp_path / "manifest.sqlite")
+        assert self.run(manifest) == dict.fromkeys(self.files, False)
+
+        monkeypatch.setattr(
+            src.batch,
+            "download_s3_file_bytes",
+            lambda *args, **kwargs: pytest.fail("A file was downloaded"),
+        )
+        assert self.run(manifest) == dict.fromkeys(self.files, True)
+
+    def test_changed_settings_invalidate_manifest(
+        self, mock_s3_setup, tmp_path
+    ):
+        """
+        Test that changing the PII fields or a masking strategy re-runs
+        every file, while reordering the fields does not.
+        """
+        manifest = str(tmp_path / "manifest.sqlite")
+        self.run(manifest)
+
+        assert self.run(manifest, ("email_address", "name")) == dict.fromkeys(
+            self.files, True
+        )
+        assert self.run(manifest, ("name", "email_address", "course")) == (
+            dict.fromkeys(self.files, False)
+        )
+        assert self.run(
+            manifest,
+            ("name", "email_address", "course"),
+            {"name": "keep_last"},
+        ) == dict.fromkeys(self.files, False)
+
+    def test_changed_objects_are_obfuscated_again(
+        self, mock_s3_setup, tmp_path
+    ):
+        """
+        Test that only an object replaced since the last run is obfuscated.
+        """
+        manifest = str(tmp_path / "manifest.sqlite")
+        self.run(manifest)
+        mock_s3_setup.put_object(
+            Bucket="mybucket",
+            Key="csv_data.csv",
+            Body=b"name,email_address\nAnn,a@example.com\n",
+        )
+
+        assert self.run(manifest) == {
+            "s3://mybucket/csv_data.csv": False,
+            "s3://mybucket/parquet_data.parquet": True,
+        }
+
+    def test_changed_destination_is_obfuscated_again(
+        self, mock_s3_setup, tmp_path
+    ):
+        """
+        Test that a file written to a new destination is obfuscated again.
+        """
+        manifest = str(tmp_path / "manifest.sqlite")
+        self.run(manifest)
+
+        assert self.run(manifest, prefix="s3://other/") == dict.fromkeys(
+            self.files, False
+        )
+        assert self.run(manifest, prefix="s3://other/") == dict.fromkeys(
+            self.files, True
+        )
+
+    def test_failed_writes_are_obfuscated_again(
+        self, mock_s3_setup, tmp_path
+    ):
+        """
+        Test that a file whose output fails to be written after its bytes
+        were yielded is obfuscated again on the next run.
+        """
+        manifest = str(tmp_path / "manifest.sqlite")
+
+        def write(result):
+            if result["file_to_obfuscate"].endswith(".csv"):
+                raise OSError("The upload failed.")
+
+        assert self.run(manifest, write=write) == dict.fromkeys(
+            self.files, False
+        )
+        assert self.run(manifest) == {
+            "s3://mybucket/csv_data.csv": False,
+            "s3://mybucket/parquet_data.parquet": True,
+        }
+
+    def test_unrecorded_results_are_not_current(
+        self, mock_s3_setup, tmp_path
+    ):
+        """
+        Test that a file is only current once its result is recorded, at
+        the destination it was recorded with.
+        """
+        destination = "s3://mybucket/obfuscated/csv_data.csv"
+        with Manifest(str(tmp_path / "manifest.sqlite")) as manifest:
+            results = obfuscate_batch(
+                self.files[:1],
+                ["name"],
+                manifest=manifest,
+                destination_for=lambda path: destination,
+            )
+            result = next(results)
+            results.close()
+            etag = head_s3_etag(self.files[0])
+            assert result["destination"] == destination
+            assert not manifest.is_current(
+                self.files[0], etag, config_hash(["name"]), destination
+            )
+
+            result["record"]()
+            assert manifest.is_current(
+                self.files[0], etag, config_hash(["name"]), destination
+            )
+            assert not manifest.is_current(
+                self.files[0], etag, config_hash(["name"]), "s3://other/a.csv"
+            )
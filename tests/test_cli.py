@@ -0,0 +1,219 @@
+import pytest
+import argparse
+import json
+import shutil
+import sys
+from src.cli import (
+    cli,
+    estimate_memory,
+    list_jobs,
+    memory_settings,
+    parse_size,
+)
+
+MASKED_CSV = (
+    b"student_id,name,course,cohort,graduation_date,email_address\n"
+    b"1234,******,Data Science,2023-08-15,2025-06-30,******\n"
+)
+
+
+@pytest.fixture
+def input_directory(tmp_path):
+    """
+    A local directory of test files, with one in a subdirectory and one
+    that is not a supported type.
+    """
+    directory = tmp_path / "in"
+    shutil.copytree("tests/dummy_test_data", directory)
+    (directory / "nested").mkdir()
+    shutil.copy(
+        "tests/dummy_test_data/csv_dummy.csv", directory / "nested/a.csv"
+    )
+    (directory / "README.txt").write_text("not data")
+    return directory
+
+
+class TestCli:
+    """
+    Tests for the `cli` function.
+    """
+
+    def test_directory_is_mirrored(self, input_directory, tmp_path, capsys):
+        """
+        Test that every supported file in a directory is obfuscated into
+        the same layout, with a line of progress and a summary row each.
+        """
+        summary_path = tmp_path / "summary.json"
+        status = cli(
+            [
+                str(input_directory),
+                str(tmp_path / "out"),
+                "--pii-fields",
+                "name",
+                "email_address",
+                "--workers",
+                "1",
+                "--summary-json",
+                str(summary_path),
+            ]
+        )
+
+        assert status == 0
+        assert sorted(
+            path.relative_to(tmp_path / "out").as_posix()
+            for path in (tmp_path / "out").rglob("*")
+            if path.is_file()
+        ) == [
+            "csv_dummy.csv",
+            "json_dummy.json",
+            "nested/a.csv",
+            "parquet_dummy.parquet",
+        ]
+        nested_output = (tmp_path / "out/nested/a.csv").read_bytes()
+        assert b"John Smith" not in nested_output
+
+        progress = capsys.readouterr().err
+        assert progress.count("[") == 5 and "[5/5]" in progress
+        assert "4 obfuscated, 0 failed, 1 skipped" in progress
+        summary = json.loads(summary_path.read_text())
+        assert {file["status"] for file in summary["files"]} == {
+            "ok",
+            "skipped",
+        }
+        assert all(file["seconds"] >= 0 for file in summary["files"])
+
+    def test_directory_in_parallel(self, input_directory, tmp_path):
+        """
+        Test that files are processed on worker processes with --workers.
+        """
+        assert (
+            cli(
+                [
+                    str(input_directory),
+                    f"file://{tmp_path}/out/",
+                    "-f",
+                    "name",
+                    "-w",
+                    "2",
+                    "--max-memory",
+                    "256M",
+                    "--quiet",
+                ]
+            )
+            == 0
+        )
+        assert len(list((tmp_path / "out").rglob("*.csv"))) == 2
+
+    def test_s3_prefix_reports_failures(self, mock_s3_setup, capsys):
+        """
+        Test that a prefix is obfuscated into another prefix, and that a
+        failed file gives a non-zero status without stopping the rest.
+        """
+        status = cli(
+            [
+                "s3://mybucket/",
+                "s3://mybucket/clean/",
+                "-f",
+                "name",
+                "email_address",
+                "-w",
+                "1",
+            ]
+        )
+
+        output = mock_s3_setup.get_object(
+            Bucket="mybucket", Key="clean/csv_data.csv"
+        )
+        assert output["Body"].read() == MASKED_CSV
+        assert status == 1
+        summary = capsys.readouterr().err
+        assert "failed  " in summary and "csv_empty_values.csv: " in summary
+
+    def test_standard_input_to_standard_output(
+        self, monkeypatch, capfdbinary
+    ):
+        """
+        Test that '-' reads standard input and writes standard output.
+        """
+        with open("tests/dummy_test_data/csv_dummy.csv") as stdin:
+            monkeypatch.setattr(sys, "stdin", stdin)
+            status = cli(["-", "-f", "name", "--file-type", "csv", "-q"])
+
+        assert status == 0
+        captured = capfdbinary.readouterr()
+        assert captured.out.splitlines()[1].startswith(b"1234,******,")
+        assert b"1 obfuscated" in captured.err
+
+    def test_invalid_arguments(self, input_directory, capsys):
+        """
+        Test that invalid arguments exit with status 2.
+        """
+        invalid_arguments = [
+            ["-", "-f", "name"],
+            [str(input_directory), "-f", "name"],
+            ["in.csv", "-f", "name", "--max-memory", "lots"],
+            ["in.csv", "-f", "name", "--workers", "0"],
+        ]
+        expected_error_messages = [
+            "--file-type is required",
+            "needs an output prefix or directory",
+            "Invalid memory size: lots",
+            "--workers must be at least 1",
+        ]
+
+        for arguments, expected_message in zip(
+            invalid_arguments, expected_error_messages
+        ):
+            with pytest.raises(SystemExit) as error:
+                cli(arguments)
+            assert error.value.code == 2
+            assert expected_message in capsys.readouterr().err
+
+
+class TestPlanning:
+    """
+    Tests for the job listing and memory planning of the CLI.
+    """
+
+    def test_single_file_into_directory(self, tmp_path):
+        """
+        Test that a single file written to a directory keeps its name.
+        """
+        (tmp_path / "a.csv").write_text("name\nAnn\n")
+        jobs = list_jobs(f"file://{tmp_path}/a.csv", f"file://{tmp_path}")
+
+        assert jobs == [
+            {
+                "source": f"file://{tmp_path}/a.csv",
+                "destination": f"file://{tmp_path}/a.csv",
+                "size": 9,
+                "skip_reason": None,
+            }
+        ]
+
+    def test_parse_size(self):
+        """
+        Test that memory sizes are read with binary units.
+        """
+        assert parse_size("1048576") == 1024**2
+        assert parse_size("512M") == parse_size("512MiB") == 512 * 1024**2
+        assert parse_size("1.5g") == int(1.5 * 1024**3)
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_size("-1G")
+
+    def test_memory_is_shared_between_workers(self):
+        """
+        Test that streamed files fit a share of the budget, and that files
+        masked whole are estimated from their size.
+        """
+        budget, settings = memory_settings(1024**3, 4)
+        assert budget == 256 * 1024**2
+        assert settings["download_part_size_mb"] * settings[
+            "download_concurrency"
+        ] * 3 <= 128
+        assert settings["part_size_mb"] >= 5
+
+        job = {"source": "s3://bucket/a.csv.gz", "size": 10**9}
+        assert estimate_memory(job, "csv", budget) == budget
+        job = {"source": "s3://bucket/a.parquet.gz", "size": 10**9}
+        assert estimate_memory(job, "parquet", budget) == 5 * 10**9
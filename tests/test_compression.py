@@ -0,0 +1,98 @@
+import pytest
+import bz2
+import gzip
+import io
+import zstandard
+from src.compression import (
+    compress_chunks,
+    decompress_bytes,
+    detect_compression,
+    open_decompressed_stream,
+)
+
+CODECS = {
+    "gzip": (gzip.compress, gzip.decompress),
+    "zstd": (
+        lambda data: zstandard.ZstdCompressor().compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(
+            data
+        ),
+    ),
+    "bz2": (bz2.compress, bz2.decompress),
+}
+
+
+class TestDetectCompression:
+    """
+    Tests for the `detect_compression` function.
+    """
+
+    def test_codecs_are_detected_from_magic_bytes(self):
+        """
+        Test that each codec is recognised, including empty compressed
+        content, and that plain text is not mistaken for bz2.
+        """
+        for codec, (compress, _) in CODECS.items():
+            assert detect_compression(compress(b"id,name\n")[:10]) == codec
+            assert detect_compression(compress(b"")[:10]) == codec
+
+        assert detect_compression(b"BZh1,name\n1,Alice") is None
+        assert detect_compression(b"id,name\n") is None
+
+
+class TestOpenDecompressedStream:
+    """
+    Tests for the `open_decompressed_stream` function.
+    """
+
+    def test_streams_are_decompressed_line_by_line(self):
+        """
+        Test that compressed streams are decompressed as they are read.
+        """
+        content = b"".join(b"%d,name\n" % i for i in range(10_000))
+
+        for codec, (compress, _) in CODECS.items():
+            stream, compression = open_decompressed_stream(
+                io.BytesIO(compress(content))
+            )
+            assert compression == codec
+            assert next(iter(stream)) == b"0,name\n"
+            assert b"0,name\n" + stream.read() == content
+
+        stream, compression = open_decompressed_stream(io.BytesIO(b"a\nb\n"))
+        assert compression is None
+        assert list(stream) == [b"a\n", b"b\n"]
+
+    def test_whole_content_is_decompressed(self):
+        """
+        Test that decompress_bytes returns the content and its codec.
+        """
+        assert decompress_bytes(bz2.compress(b"data")) == (b"data", "bz2")
+        assert decompress_bytes(b"data") == (b"data", None)
+
+
+class TestCompressChunks:
+    """
+    Tests for the `compress_chunks` function.
+    """
+
+    def test_chunks_are_compressed_incrementally(self):
+        """
+        Test that chunks compress to a single valid stream for each codec
+        and level, and pass through unchanged without a codec.
+        """
+        chunks = [b"id,name\n", b"1,******\n" * 1000]
+
+        for codec, (_, decompress) in CODECS.items():
+            for level in [None, 1]:
+                output = b"".join(compress_chunks(iter(chunks), codec, level))
+                assert decompress(output) == b"".join(chunks)
+
+        assert list(compress_chunks(chunks, None)) == chunks
+
+    def test_errors_with_invalid_level(self):
+        """
+        Test that a level out of range for the codec raises an error.
+        """
+        with pytest.raises(ValueError, match="must be between 0 and 9"):
+            list(compress_chunks([b"data"], "gzip", 10))
@@ -1,5 +1,7 @@
 import pytest
 import boto3
+from concurrent.futures import ThreadPoolExecutor
+from src import connection
 from botocore.exceptions import (
     NoCredentialsError,
     PartialCredentialsError,
@@ -45,3 +47,61 @@ class TestConnectingToAWSServices:
             ), "Response does not contain 'Buckets' key."
         except ClientError as e:
             pytest.fail(f"Error while listing buckets: {e}")
+
+
+class TestSharedS3Client:
+    """
+    Tests for the cached S3 client factory in connection.py.
+    """
+
+    def test_client_is_created_once_and_reused(self, aws_creds, monkeypatch):
+        """
+        Test that credentials are only retrieved for the first call.
+        """
+        calls = []
+        monkeypatch.setattr(
+            connection,
+            "get_aws_credentials",
+            lambda: calls.append(1) or boto3.Session(),
+        )
+        connection.configure_s3_client()
+
+        assert connection.s3_client() is connection.s3_client()
+        assert len(calls) == 1
+
+    def test_client_is_shared_across_threads(self, aws_creds):
+        """
+        Test that concurrent first calls all receive the same client.
+        """
+        connection.configure_s3_client()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            clients = list(
+                pool.map(lambda _: connection.s3_client(), range(16))
+            )
+
+        assert all(client is clients[0] for client in clients)
+
+    def test_configured_settings_are_applied(self, aws_creds):
+        """
+        Test that pool, retry and keep-alive settings reach the client.
+        """
+        connection.configure_s3_client(
+            max_pool_connections=64, retry_mode="adaptive", tcp_keepalive=False
+        )
+        config = connection.s3_client().meta.config
+        connection.configure_s3_client()
+
+        assert config.max_pool_connections == 64
+        assert config.retries["mode"] == "adaptive"
+        assert config.tcp_keepalive is False
+
+    def test_no_client_without_credentials(self, monkeypatch):
+        """
+        Test that no client is returned or cached without credentials.
+        """
+        monkeypatch.setattr(connection, "get_aws_credentials", lambda: None)
+        connection.configure_s3_client()
+
+        assert connection.s3_client() is None
+        assert connection._client is None
@@ -0,0 +1,250 @@
+import pytest
+import csv
+import json
+import pandas as pd
+from src.cli import cli
+from src.detection import (
+    detect_file_pii,
+    detect_pii_columns,
+    sample_file,
+)
+from src.main import main, propose_pii_fields
+
+
+@pytest.fixture
+def customers_csv(tmp_path):
+    """
+    A local CSV file with a column of each kind of PII and some that look
+    like PII but are not.
+    """
+    path = tmp_path / "customers.csv"
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(
+            [
+                "customer_id",
+                "contact",
+                "mobile",
+                "account",
+                "ni",
+                "postcode",
+                "joined",
+            ]
+        )
+        for i in range(200):
+            writer.writerow(
+                [
+                    f"{1000000000 + i}",
+                    f"customer{i}@example.com",
+                    f"+44 7700 900{i:03d}",
+                    "GB82 WEST 1234 5698 7654 32",
+                    "AB 12 34 56 C",
+                    "sw1a 1aa",
+                    "2024-03-31",
+                ]
+            )
+    return path
+
+
+class TestDetectPiiColumns:
+    """
+    Tests for the `detect_pii_columns` function.
+    """
+
+    def test_kinds_of_pii_are_detected(self):
+        """
+        Test that each kind of PII is detected, and that IDs and dates are
+        not mistaken for phone numbers.
+        """
+        samples = {
+            "id": ["12345678901", "12345678902"],
+            "email": ["a.b@example.co.uk", "c@example.com"],
+            "phone": ["07700 900123", "+44 (0)20 7946 0958"],
+            "iban": ["GB82WEST12345698765432", "de89 3704 0044 0532 0130 00"],
+            "ni": ["AB123456C", "ab 12 34 56 d"],
+            "postcode": ["SW1A 1AA", "M1 1AE"],
+            "date": ["2024-03-31", "2024-06-30"],
+        }
+
+        assert detect_pii_columns(samples) == {
+            "email": "email",
+            "phone": "phone",
+            "iban": "iban",
+            "ni": "uk_ni_number",
+            "postcode": "uk_postcode",
+        }
+
+    def test_validators_and_threshold(self):
+        """
+        Test that values failing a validator do not count as matches, and
+        that a column needs the threshold share of matching values.
+        """
+        samples = {
+            "bad_iban": ["GB00WEST12345698765432"] * 10,
+            "reserved_ni": ["GB123456C"] * 10,
+            "mostly_email": ["a@example.com"] * 7 + ["n/a"] * 3,
+            "with_missing": ["a@example.com", None, ""] * 5,
+        }
+
+        assert detect_pii_columns(samples) == {"with_missing": "email"}
+        assert detect_pii_columns(samples, threshold=0.7) == {
+            "mostly_email": "email",
+            "with_missing": "email",
+        }
+
+    def test_whole_sample_is_checked_after_the_head(self):
+        """
+        Test that a column whose first values match is still rejected if
+        the rest of its sample does not.
+        """
+        samples = {"notes": ["a@example.com"] * 32 + ["free text"] * 200}
+
+        assert detect_pii_columns(samples) == {}
+
+
+class TestSampleFile:
+    """
+    Tests for the `sample_file` and `detect_file_pii` functions.
+    """
+
+    def test_csv_sample_is_bounded(self, customers_csv):
+        """
+        Test that only whole rows from the start of a CSV file are sampled.
+        """
+        samples = sample_file(
+            f"file://{customers_csv}", "csv", sample_bytes=1024
+        )
+
+        assert list(samples) == [
+            "customer_id",
+            "contact",
+            "mobile",
+            "account",
+            "ni",
+            "postcode",
+            "joined",
+        ]
+        assert 0 < len(samples["contact"]) < 20
+        assert samples["contact"][-1].endswith("@example.com")
+        assert len(sample_file(f"file://{customers_csv}", "csv", 5)["ni"]) == 5
+
+    def test_parquet_and_json_samples(self, tmp_path):
+        """
+        Test that Parquet and JSON files are sampled as strings, with no
+        values for a Parquet column that cannot hold text.
+        """
+        data = pd.DataFrame(
+            {"id": [1, 2], "email": ["a@example.com", "b@example.com"]}
+        )
+        data.to_parquet(tmp_path / "data.parquet")
+        (tmp_path / "data.json").write_text(
+            json.dumps({"records": data.to_dict("records")})
+        )
+
+        assert sample_file(f"file://{tmp_path}/data.parquet", "parquet") == {
+            "id": [],
+            "email": ["a@example.com", "b@example.com"],
+        }
+        assert sample_file(f"file://{tmp_path}/data.json", "json") == {
+            "id": ["1", "2"],
+            "email": ["a@example.com", "b@example.com"],
+        }
+
+    def test_each_file_is_detected_from_its_own_sample(
+        self, customers_csv, tmp_path
+    ):
+        """
+        Test that a file with the same columns as an earlier one is still
+        detected from its own rows.
+        """
+        other = tmp_path / "other.csv"
+        other.write_text(
+            "customer_id,contact,mobile,account,ni,postcode,joined\n"
+            "1,,,,,,2024-03-31\n"
+            "2,n/a,,,,,2024-03-31\n"
+        )
+        expected = {
+            "contact": "email",
+            "mobile": "phone",
+            "account": "iban",
+            "ni": "uk_ni_number",
+            "postcode": "uk_postcode",
+        }
+
+        assert detect_file_pii(f"file://{other}", "csv") == {}
+        assert detect_file_pii(f"file://{customers_csv}", "csv") == expected
+
+    def test_standard_input_is_rejected(self):
+        """
+        Test that standard input, which cannot be read twice, is not
+        sampled.
+        """
+        with pytest.raises(ValueError) as error:
+            sample_file("-", "csv")
+        assert "cannot be detected in standard input" in str(error.value)
+
+
+class TestMainWithDetection:
+    """
+    Tests for obfuscating and proposing detected PII columns.
+    """
+
+    def test_detected_columns_are_obfuscated(self, mock_s3_setup):
+        """
+        Test that detected columns are obfuscated along with any listed
+        ones.
+        """
+        output = main(
+            json.dumps(
+                {
+                    "file_to_obfuscate": "s3://mybucket/csv_data.csv",
+                    "pii_fields": ["name"],
+                    "detect_pii": True,
+                }
+            )
+        )
+
+        assert b"1234,******,Data Science" in output
+        assert b"@" not in output
+
+    def test_no_pii_detected(self, tmp_path):
+        """
+        Test that a file with no detected or listed PII columns is an
+        error rather than copied unmasked.
+        """
+        (tmp_path / "ids.csv").write_text("id\n1\n2\n")
+
+        with pytest.raises(ValueError):
+            main(
+                json.dumps(
+                    {
+                        "file_to_obfuscate": f"file://{tmp_path}/ids.csv",
+                        "detect_pii": True,
+                    }
+                )
+            )
+
+    def test_propose_pii_fields(self, mock_s3_setup):
+        """
+        Test that the detected columns can be proposed without obfuscating.
+        """
+        assert propose_pii_fields(
+            json.dumps({"file_to_obfuscate": "s3://mybucket/csv_data.csv"})
+        ) == {"email_address": "email"}
+
+    def test_cli_propose_and_detect(self, customers_csv, tmp_path, capsys):
+        """
+        Test the --propose-pii and --detect-pii options of the CLI.
+        """
+        assert cli([str(customers_csv), "--propose-pii"]) == 0
+        proposal = json.loads(capsys.readouterr().out)
+        assert proposal["pii_fields"]["contact"] == "email"
+
+        output = tmp_path / "out.csv"
+        assert cli([str(customers_csv), str(output), "--detect-pii", "-q"]) == 0
+        masked = output.read_text()
+        assert "@" not in masked and "1000000000,***" in masked
+
+        with pytest.raises(SystemExit):
+            cli([str(customers_csv), str(output)])
+        assert "--pii-fields is required" in capsys.readouterr().err
@@ -3,10 +3,20 @@ import botocore.exceptions
 import pytest
 import io
 import pandas as pd
+import pyarrow.parquet as pq
+import moto.s3.models
+import src.file_handling
 from src.file_handling import (
+    S3RangeFile,
     download_s3_file_and_convert_to_pandas_dataframe,
+    download_s3_file_bytes,
     dataframe_to_bytes,
+    dataframe_to_chunks,
+    iter_s3_file_parts,
+    open_s3_file_stream,
+    upload_stream_to_s3,
 )
+from src.parquet_engine import obfuscate_parquet_row_groups
 
 
 class TestDownloadFromS3AndConvertToPandas:
@@ -192,3 +202,184 @@ class TestFinalUserOutputIsConvertedFromDataframeToByteStreamObject:
             b"student_id,name,course,cohort,graduation_date,email_address\n"
         )
         assert result == expected, "Empty DataFrame CSV conversion failed"
+
+
+class TestChunkedConversionAndMultipartUpload:
+    """
+    Tests for the functions dataframe_to_chunks and upload_stream_to_s3, which
+    write the obfuscated output without holding it in a single buffer.
+    """
+
+    df = pd.DataFrame(
+        {
+            "student_id": [1234, 5678, 9101],
+            "name": ["John Smith", "Jane Doe", None],
+            "email_address": ["j.smith@email.com", "j.doe@email.com", None],
+        }
+    )
+
+    def test_chunks_join_to_the_same_bytes_as_dataframe_to_bytes(self):
+        """
+        Test that chunked CSV and JSON conversion matches whole-frame conversion.
+        """
+        for file_type in ["csv", "json"]:
+            for df in [self.df, self.df.iloc[:0]]:
+                chunks = list(dataframe_to_chunks(df, file_type, chunksize=2))
+                assert b"".join(chunks) == dataframe_to_bytes(df, file_type)
+
+    def test_small_output_is_uploaded_in_one_request(self, mock_s3_setup):
+        """
+        Test that output smaller than one part is uploaded with put_object.
+        """
+        upload_stream_to_s3([b"a,b\n", b"1,2\n"], "s3://mybucket/out.csv")
+
+        body = mock_s3_setup.get_object(Bucket="mybucket", Key="out.csv")
+        assert body["Body"].read() == b"a,b\n1,2\n"
+
+    def test_large_output_is_uploaded_in_parts(
+        self, mock_s3_setup, monkeypatch
+    ):
+        """
+        Test that output larger than the part size uses a multipart upload.
+        """
+        monkeypatch.setattr(moto.s3.models, "S3_UPLOAD_PART_MIN_SIZE", 10)
+        chunks = [bytes([i]) * 7 for i in range(10)]
+        upload_stream_to_s3(
+            chunks, "s3://mybucket/out.bin", part_size=16, max_concurrency=2
+        )
+
+        head = mock_s3_setup.head_object(Bucket="mybucket", Key="out.bin")
+        body = mock_s3_setup.get_object(Bucket="mybucket", Key="out.bin")
+        assert body["Body"].read() == b"".join(chunks)
+        assert head["ETag"].endswith('-5"')
+
+    def test_failed_stream_aborts_the_multipart_upload(
+        self, mock_s3_setup, monkeypatch
+    ):
+        """
+        Test that an error while producing chunks aborts the upload.
+        """
+        monkeypatch.setattr(moto.s3.models, "S3_UPLOAD_PART_MIN_SIZE", 10)
+
+        def failing_chunks():
+            yield b"x" * 32
+            raise ValueError("Masking failed")
+
+        with pytest.raises(ValueError, match="Masking failed"):
+            upload_stream_to_s3(
+                failing_chunks(), "s3://mybucket/out.bin", part_size=16
+            )
+
+        uploads = mock_s3_setup.list_multipart_uploads(Bucket="mybucket")
+        assert "Uploads" not in uploads
+        with pytest.raises(botocore.exceptions.ClientError):
+            mock_s3_setup.head_object(Bucket="mybucket", Key="out.bin")
+
+
+class TestRangedDownloads:
+    """
+    Tests for the functions iter_s3_file_parts, open_s3_file_stream,
+    download_s3_file_bytes and the S3RangeFile class, which fetch S3
+    objects with concurrent ranged GETs.
+    """
+
+    content = bytes(range(256)) * 40
+
+    def test_parts_are_fetched_by_range_in_order(self, mock_s3_setup):
+        """
+        Test that an object is fetched in parts of the given size, in order,
+        and that an empty object gives no parts.
+        """
+        mock_s3_setup.put_object(Bucket="mybucket", Key="big", Body=self.content)
+        mock_s3_setup.put_object(Bucket="mybucket", Key="empty", Body=b"")
+
+        parts = list(
+            iter_s3_file_parts("s3://mybucket/big", 1000, max_concurrency=3)
+        )
+        stream = open_s3_file_stream("s3://mybucket/big", 1000, 3)
+
+        assert [len(part) for part in parts] == [1000] * 10 + [240]
+        assert b"".join(parts) == self.content
+        assert stream.read() == self.content
+        assert download_s3_file_bytes("s3://mybucket/big", 999) == self.content
+        assert list(iter_s3_file_parts("s3://mybucket/empty")) == []
+
+    def test_object_changed_mid_download_fails(self, mock_s3_setup):
+        """
+        Test that an object replaced during a download raises an error
+        rather than mixing parts of both versions.
+        """
+        mock_s3_setup.put_object(Bucket="mybucket", Key="big", Body=self.content)
+        parts = iter_s3_file_parts("s3://mybucket/big", 1000, max_concurrency=1)
+        next(parts)
+        mock_s3_setup.put_object(Bucket="mybucket", Key="big", Body=b"x" * 5000)
+
+        with pytest.raises(
+            botocore.exceptions.ClientError, match="PreconditionFailed"
+        ):
+            list(parts)
+
+    def test_missing_object_fails_on_opening(self, mock_s3_setup):
+        """
+        Test that opening a stream of a missing object raises straight away.
+        """
+        with pytest.raises(botocore.exceptions.ClientError):
+            open_s3_file_stream("s3://mybucket/missing.csv")
+
+    def test_parquet_reads_fetch_only_needed_column_chunks(
+        self, mock_s3_setup, monkeypatch
+    ):
+        """
+        Test that a Parquet file is obfuscated through ranged reads without
+        fetching PII column chunks that are masked from statistics.
+        """
+        df = pd.DataFrame(
+            {
+                "id": range(20_000),
+                "name": [f"name {i}" * 20 for i in range(20_000)],
+            }
+        )
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False, row_group_size=4000)
+        mock_s3_setup.put_object(
+            Bucket="mybucket", Key="wide.parquet", Body=buffer.getvalue()
+        )
+
+        fetched = []
+        get_s3_range = src.file_handling._get_s3_range
+
+        def recording_get_s3_range(bucket_name, key, byte_range, etag=None):
+            fetched.append(byte_range)
+            return get_s3_range(bucket_name, key, byte_range, etag)
+
+        monkeypatch.setattr(
+            src.file_handling, "_get_s3_range", recording_get_s3_range
+        )
+        output = b"".join(
+            obfuscate_parquet_row_groups(
+                S3RangeFile("s3://mybucket/wide.parquet", tail_size=1024),
+                ["name"],
+            )
+        )
+
+        # Apart from the footer, no fetched range overlaps a name chunk
+        metadata = pq.ParquetFile(io.BytesIO(buffer.getvalue())).metadata
+        name_chunks = [
+            (column.dictionary_page_offset, column.total_compressed_size)
+            for column in (
+                metadata.row_group(i).column(1)
+                for i in range(metadata.num_row_groups - 1)
+            )
+        ]
+        ranges = [
+            tuple(map(int, byte_range.split("-")))
+            for byte_range in fetched
+            if not byte_range.startswith("-")
+        ]
+        for start, size in name_chunks:
+            for first, last in ranges:
+                if first < len(buffer.getvalue()) - 64 * 1024:
+                    assert last < start or first >= start + size
+        result_df = pd.read_parquet(io.BytesIO(output))
+        assert list(result_df["id"]) == list(range(20_000))
+        assert set(result_df["name"]) == {"******"}
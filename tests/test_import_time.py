@@ -0,0 +1,53 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+# Cold-start budget for `import src.main`, in seconds. The deferred imports
+# keep it well below this; pandas alone takes several times longer to load.
+IMPORT_TIME_BUDGET = 0.2
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow", "boto3", "botocore.config"]
+
+
+def _import_main_in_fresh_interpreter():
+    """
+    Import src.main in a new interpreter and report how long it took and
+    which heavy modules were loaded.
+    """
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import src.main\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(json.dumps({'elapsed': elapsed, 'heavy': heavy}))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        check=True,
+        cwd=Path(__file__).resolve().parents[1],
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+class TestImportTime:
+    """
+    Tests that importing the obfuscator entry point stays cheap.
+    """
+
+    def test_importing_main_defers_heavy_dependencies(self):
+        """
+        Test that pandas, numpy, pyarrow and boto3 are not loaded on import.
+        """
+        assert _import_main_in_fresh_interpreter()["heavy"] == []
+
+    def test_importing_main_is_within_budget(self):
+        """
+        Test that the best of three cold imports is within the time budget.
+        """
+        elapsed = min(
+            _import_main_in_fresh_interpreter()["elapsed"] for _ in range(3)
+        )
+        assert elapsed < IMPORT_TIME_BUDGET
@@ -0,0 +1,179 @@
+import pytest
+import io
+import json
+import tracemalloc
+from src.instrumentation import (
+    METRIC_FIELDS,
+    add_metrics_hook,
+    collect_metrics,
+    emf_metrics_hook,
+    remove_metrics_hook,
+    stage,
+)
+from src.main import main_with_metrics
+
+
+class TestStage:
+    """
+    Tests for the `stage` context manager and metrics hooks.
+    """
+
+    def test_nothing_is_recorded_without_hooks(self, monkeypatch):
+        """
+        Test that stages take no measurements while no hook is registered.
+        """
+        monkeypatch.setattr(
+            "src.instrumentation.time.perf_counter",
+            lambda: pytest.fail("A stage was timed without a hook"),
+        )
+
+        with stage("download", bytes_in=1) as metrics:
+            metrics["bytes_out"] = 2
+
+    def test_hooks_receive_every_field(self):
+        """
+        Test that hooks receive each stage with every metric field, in the
+        order the stages finished, and are removed again.
+        """
+        with collect_metrics() as collected:
+            with stage("outer", bytes_in=10):
+                with stage("inner") as metrics:
+                    metrics["rows"] = 3
+        with stage("after"):
+            pass
+
+        assert [metrics["stage"] for metrics in collected] == [
+            "inner",
+            "outer",
+        ]
+        assert all(list(metrics) == METRIC_FIELDS for metrics in collected)
+        assert collected[0]["rows"] == 3 and collected[1]["bytes_in"] == 10
+        assert collected[1]["wall_seconds"] >= collected[0]["wall_seconds"]
+
+    def test_traced_peak_includes_nested_stages(self):
+        """
+        Test that an outer stage's traced peak covers the allocations of
+        the stages nested inside it.
+        """
+        tracemalloc.start()
+        try:
+            with collect_metrics() as collected:
+                with stage("outer"):
+                    with stage("inner"):
+                        data = bytearray(5_000_000)
+                        del data
+        finally:
+            tracemalloc.stop()
+
+        inner, outer = collected
+        assert inner["peak_traced_mb"] >= 5
+        assert outer["peak_traced_mb"] >= inner["peak_traced_mb"]
+
+    def test_failing_hook_does_not_fail_the_stage(self):
+        """
+        Test that an error in a hook is logged rather than raised.
+        """
+
+        def broken_hook(metrics):
+            raise RuntimeError("sink unavailable")
+
+        add_metrics_hook(broken_hook)
+        try:
+            with stage("download"):
+                pass
+        finally:
+            remove_metrics_hook(broken_hook)
+
+    def test_emf_records(self):
+        """
+        Test that the EMF hook writes one CloudWatch record per stage, only
+        declaring the metrics the stage has.
+        """
+        output = io.StringIO()
+        hook = emf_metrics_hook("Test", output)
+        add_metrics_hook(hook)
+        try:
+            with stage("serialise", rows=5):
+                pass
+        finally:
+            remove_metrics_hook(hook)
+
+        record = json.loads(output.getvalue())
+        directive = record["_aws"]["CloudWatchMetrics"][0]
+        assert directive["Namespace"] == "Test"
+        assert record["stage"] == "serialise" and record["rows"] == 5
+        assert {"Name": "rows", "Unit": "Count"} in directive["Metrics"]
+        assert "bytes_in" not in record
+
+    def test_emf_records_go_to_standard_error(self, capsys):
+        """
+        Test that the EMF hook leaves standard output, which may be carrying
+        the obfuscated file, alone.
+        """
+        hook = emf_metrics_hook()
+        add_metrics_hook(hook)
+        try:
+            with stage("serialise", rows=5):
+                pass
+        finally:
+            remove_metrics_hook(hook)
+
+        captured = capsys.readouterr()
+        assert captured.out == ""
+        assert json.loads(captured.err)["stage"] == "serialise"
+
+
+class TestMainWithMetrics:
+    """
+    Tests for the `main_with_metrics` function.
+    """
+
+    def test_stages_of_pandas_pipeline(self, mock_s3_setup):
+        """
+        Test that main reports the download, parse, mask and serialise
+        stages with their sizes and row counts.
+        """
+        result, metrics = main_with_metrics(
+            json.dumps(
+                {
+                    "file_to_obfuscate": "s3://mybucket/csv_data.csv",
+                    "pii_fields": ["name"],
+                    "fast_path_max_bytes": 0,
+                }
+            )
+        )
+
+        stages = {
+            stage_metrics["stage"]: stage_metrics for stage_metrics in metrics
+        }
+        assert list(stages) == ["download", "parse", "mask", "serialise"]
+        assert stages["download"]["bytes_out"] == stages["parse"]["bytes_in"]
+        assert stages["parse"]["rows"] == stages["mask"]["rows"] == 1
+        assert stages["serialise"]["bytes_out"] == len(result)
+        assert all(
+            stage_metrics["process_cpu_seconds"] >= 0
+            and stage_metrics["process_peak_rss_mb"] > 0
+            and stage_metrics["peak_rss_growth_mb"] >= 0
+            for stage_metrics in metrics
+        )
+
+    def test_upload_stage_counts_output(self, mock_s3_setup):
+        """
+        Test that streaming to a destination is reported as one stage with
+        the number of bytes uploaded.
+        """
+        _, metrics = main_with_metrics(
+            json.dumps(
+                {
+                    "file_to_obfuscate": "s3://mybucket/csv_data.csv",
+                    "pii_fields": ["name"],
+                    "destination": "s3://mybucket/out.csv",
+                }
+            )
+        )
+
+        uploaded = mock_s3_setup.get_object(Bucket="mybucket", Key="out.csv")
+        assert [stage_metrics["stage"] for stage_metrics in metrics] == [
+            "obfuscate_and_upload"
+        ]
+        assert metrics[0]["bytes_out"] == uploaded["ContentLength"]
@@ -0,0 +1,205 @@
+import pytest
+import gzip
+import io
+import json
+import os
+import sys
+import pandas as pd
+from src.local_files import (
+    MemoryFile,
+    local_file_path,
+    open_local_content,
+    write_local_file,
+)
+from src.main import main, main_stream
+
+CSV_DATA = (
+    b"student_id,name,course,email_address\n"
+    b"1234,John Smith,Software,j.smith@email.com\n"
+    b"5678,Jane Doe,Data Science,jane.doe@email.com\n"
+)
+MASKED_CSV = (
+    b"student_id,name,course,email_address\n"
+    b"1234,******,Software,******\n"
+    b"5678,******,Data Science,******\n"
+)
+
+
+def local_input(path, **options):
+    return json.dumps(
+        {
+            "file_to_obfuscate": f"file://{path}",
+            "pii_fields": ["name", "email_address"],
+            **options,
+        }
+    )
+
+
+class TestOpenLocalContent:
+    """
+    Tests for the `open_local_content` context manager and `MemoryFile`.
+    """
+
+    def test_file_is_memory_mapped(self, tmp_path):
+        """
+        Test that a file is mapped rather than read, and that a MemoryFile
+        over the map reads it in place.
+        """
+        path = tmp_path / "data.csv"
+        path.write_bytes(CSV_DATA)
+
+        with open_local_content(f"file://{path}") as content:
+            assert not isinstance(content, bytes)
+            with io.BufferedReader(MemoryFile(content)) as stream:
+                assert stream.readline() == CSV_DATA.split(b"\n")[0] + b"\n"
+                stream.seek(-3, io.SEEK_END)
+                assert stream.read() == b"om\n"
+
+    def test_empty_and_missing_files(self, tmp_path):
+        """
+        Test that an empty file gives empty bytes and a missing file raises.
+        """
+        path = tmp_path / "empty.csv"
+        path.write_bytes(b"")
+
+        with open_local_content(f"file://{path}") as content:
+            assert content == b""
+        with pytest.raises(FileNotFoundError):
+            with open_local_content(f"file://{tmp_path}/missing.csv"):
+                pass
+
+    def test_file_uris(self):
+        """
+        Test that file URIs give absolute, relative and localhost paths.
+        """
+        assert local_file_path("file:///data/a.csv") == "/data/a.csv"
+        assert local_file_path("file://data/a.csv") == "data/a.csv"
+        assert local_file_path("file://localhost/data/a.csv") == "/data/a.csv"
+
+    def test_failed_write_leaves_no_file(self, tmp_path):
+        """
+        Test that a write that fails part way leaves no file behind.
+        """
+
+        def failing_chunks():
+            yield b"partial"
+            raise ValueError("masking failed")
+
+        with pytest.raises(ValueError, match="masking failed"):
+            write_local_file(failing_chunks(), f"file://{tmp_path}/out.csv")
+        assert list(tmp_path.iterdir()) == []
+
+
+    def test_written_file_mode(self, tmp_path):
+        """
+        Test that a new file gets the mode the umask gives, and that an
+        overwritten file keeps its mode, as with open().
+        """
+        umask = os.umask(0o027)
+        try:
+            write_local_file([b"a"], f"file://{tmp_path}/new.csv")
+        finally:
+            os.umask(umask)
+        existing = tmp_path / "existing.csv"
+        existing.write_bytes(b"old")
+        existing.chmod(0o604)
+        write_local_file([b"new"], f"file://{existing}")
+
+        assert (tmp_path / "new.csv").stat().st_mode & 0o777 == 0o640
+        assert existing.stat().st_mode & 0o777 == 0o604
+        assert existing.read_bytes() == b"new"
+
+
+class TestMainWithLocalFiles:
+    """
+    Tests for `main` and `main_stream` with local files and standard
+    input and output.
+    """
+
+    def test_every_path_gives_the_same_output(self, tmp_path):
+        """
+        Test that a local CSV file is masked the same way whether it is
+        returned, written, streamed, compressed, spliced or partitioned.
+        """
+        path = tmp_path / "data.csv"
+        path.write_bytes(CSV_DATA)
+        (tmp_path / "data.csv.gz").write_bytes(gzip.compress(CSV_DATA))
+
+        assert main(local_input(path)) == MASKED_CSV
+        assert main(local_input(path, fast_path_max_bytes=0)) == MASKED_CSV
+        assert main(local_input(path, csv_engine="splice")) == MASKED_CSV
+        assert main(local_input(path, workers=2)) == MASKED_CSV
+        assert b"".join(main_stream(local_input(path))) == MASKED_CSV
+        assert gzip.decompress(main(local_input(f"{path}.gz"))) == MASKED_CSV
+
+        for csv_engine in ["pandas", "splice"]:
+            with pytest.raises(ValueError, match="Missing columns: phone"):
+                main(
+                    json.dumps(
+                        {
+                            "file_to_obfuscate": f"file://{path}",
+                            "pii_fields": ["phone"],
+                            "csv_engine": csv_engine,
+                            "workers": 2,
+                        }
+                    )
+                )
+
+        for options in [{}, {"workers": 2}]:
+            destination = f"file://{tmp_path}/out.csv"
+            assert (
+                main(local_input(path, destination=destination, **options))
+                == destination
+            )
+            assert (tmp_path / "out.csv").read_bytes() == MASKED_CSV
+
+    def test_parquet_and_json_files(self, tmp_path):
+        """
+        Test that local Parquet and JSON files are masked, including Parquet
+        written through pyarrow's memory map.
+        """
+        parquet_path = tmp_path / "data.parquet"
+        pd.read_csv(io.BytesIO(CSV_DATA)).to_parquet(parquet_path)
+        json_path = tmp_path / "data.json"
+        json_path.write_text(
+            json.dumps([{"name": "Ann", "email_address": "a@example.com"}])
+        )
+
+        returned = pd.read_parquet(
+            io.BytesIO(main(local_input(parquet_path)))
+        )
+        destination = f"file://{tmp_path}/out.parquet"
+        main(local_input(parquet_path, destination=destination))
+        written = pd.read_parquet(tmp_path / "out.parquet")
+        assert list(returned["name"]) == ["******"] * 2
+        assert returned.equals(written)
+        assert json.loads(main(local_input(json_path))) == [
+            {"name": "******", "email_address": "******"}
+        ]
+
+    def test_standard_input_and_output(
+        self, tmp_path, monkeypatch, capfdbinary
+    ):
+        """
+        Test that '-' reads the file from standard input and writes the
+        output to standard output.
+        """
+        path = tmp_path / "data.csv"
+        path.write_bytes(CSV_DATA)
+        input_json = json.dumps(
+            {
+                "file_to_obfuscate": "-",
+                "file_type": "csv",
+                "pii_fields": ["name", "email_address"],
+                "destination": "-",
+            }
+        )
+
+        with open(path) as stdin:
+            monkeypatch.setattr(sys, "stdin", stdin)
+            assert main(input_json) == "-"
+        assert capfdbinary.readouterr().out == MASKED_CSV
+
+        with open(path) as stdin:
+            monkeypatch.setattr(sys, "stdin", stdin)
+            assert b"".join(main_stream(input_json)) == MASKED_CSV
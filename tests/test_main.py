@@ -1,5 +1,12 @@
 import pytest
-from src.main import main
+import bz2
+import gzip
+import io
+import json
+import pandas as pd
+import zstandard
+from src.compression import decompress_bytes, detect_compression
+from src.main import main, main_stream
 
 
 def test_overall_main_function_flow(mock_s3_setup):
@@ -86,3 +93,365 @@ def test_integration_csv_with_columns_but_no_values(mock_s3_setup):
         match="Input DataFrame is empty. Cannot proceed with processing.",
     ):
         main(input_json)
+
+
+def test_main_stream_yields_same_content_as_main(mock_s3_setup):
+    """Test that streaming mode produces the same CSV content as main.
+
+    Args:
+        mock_s3_setup: Pytest fixture to mock AWS S3 interactions.
+    """
+    input_json = '{"file_to_obfuscate": "s3://mybucket/csv_data.csv", "pii_fields": ["email_address", "name"]}'
+    streamed_bytes = b"".join(main_stream(input_json, chunksize=1))
+
+    assert streamed_bytes == main(input_json)
+
+
+def test_main_stream_keeps_integers_with_missing_values(mock_s3_setup):
+    """Test that an integer column with missing values in only some chunks
+    is written the same way by streaming mode and by main, with or without
+    the standard library engine.
+
+    Args:
+        mock_s3_setup: Pytest fixture to mock AWS S3 interactions.
+    """
+    mock_s3_setup.put_object(
+        Bucket="mybucket",
+        Key="ages.csv",
+        Body=b"id,name,age\n1,a,30\n2,b,\n3,c,31\n",
+    )
+    input_json = json.dumps(
+        {"file_to_obfuscate": "s3://mybucket/ages.csv", "pii_fields": ["name"]}
+    )
+    expected = b"id,name,age\n1,******,30\n2,******,\n3,******,31\n"
+
+    assert b"".join(main_stream(input_json, chunksize=1)) == expected
+    assert main(input_json) == expected
+    assert (
+        main(json.dumps({**json.loads(input_json), "fast_path_max_bytes": 0}))
+        == expected
+    )
+
+
+def test_float_column_is_written_the_same_whole_or_streamed(
+    tmp_path, monkeypatch
+):
+    """Test that a column that only turns float in its last row is written
+    the same way by main and by streaming mode in chunks of any size, both
+    when the float is in the head the column types are inferred from and
+    when it only comes after it.
+
+    Args:
+        tmp_path: Pytest fixture for a temporary directory.
+        monkeypatch: Pytest fixture to shrink the head types are inferred from.
+    """
+    content = b"id,name,score\n" + b"".join(
+        b"%d,n%d,%d\n" % (i, i, i) for i in range(5)
+    )
+    content += b"5,n5,1.5\n"
+    (tmp_path / "scores.csv").write_bytes(content)
+    input_json = json.dumps(
+        {
+            "file_to_obfuscate": f"file://{tmp_path}/scores.csv",
+            "pii_fields": ["name"],
+        }
+    )
+    unchunked_json = json.dumps(
+        {**json.loads(input_json), "fast_path_max_bytes": 0}
+    )
+
+    def outputs():
+        return [
+            main(input_json),
+            main(unchunked_json),
+            *(
+                b"".join(main_stream(input_json, chunksize=chunksize))
+                for chunksize in [1, 2, 4]
+            ),
+        ]
+
+    floats = b"id,name,score\n" + b"".join(
+        b"%d,******,%d.0\n" % (i, i) for i in range(5)
+    )
+    assert outputs() == [floats + b"5,******,1.5\n"] * 5
+
+    # Types are only inferred from the header and the first two rows
+    monkeypatch.setattr("src.streaming.CSV_DTYPE_SAMPLE_BYTES", 30)
+    monkeypatch.setattr("src.main.CSV_DTYPE_SAMPLE_BYTES", 30)
+    integers = b"id,name,score\n" + b"".join(
+        b"%d,******,%d\n" % (i, i) for i in range(5)
+    )
+    assert outputs() == [integers + b"5,******,1.5\n"] * 5
+
+
+def test_main_stream_rejects_unsupported_file_type(mock_s3_setup):
+    """Test that streaming mode raises a ValueError for non-CSV files.
+
+    Args:
+        mock_s3_setup: Pytest fixture to mock AWS S3 interactions.
+    """
+    input_json = '{"file_to_obfuscate": "s3://mybucket/json_data.json", "pii_fields": ["name"]}'
+    with pytest.raises(ValueError, match="Unsupported file type for streaming"):
+        list(main_stream(input_json))
+
+
+def test_main_obfuscates_parquet_file(mock_s3_setup):
+    """Test that main obfuscates a Parquet file through the row-group engine.
+
+    Args:
+        mock_s3_setup: Pytest fixture to mock AWS S3 interactions.
+    """
+    input_json = '{"file_to_obfuscate": "s3://mybucket/parquet_data.parquet", "pii_fields": ["name", "email_address"]}'
+    result_df = pd.read_parquet(io.BytesIO(main(input_json)))
+
+    assert list(result_df["name"]) == ["******"]
+    assert list(result_df["email_address"]) == ["******"]
+    assert list(result_df["course"]) == ["Data Analytics"]
+
+
+def test_main_uploads_to_destination(mock_s3_setup):
+    """Test that main streams the output to a destination for every format.
+
+    Args:
+        mock_s3_setup: Pytest fixture to mock AWS S3 interactions.
+    """
+    files = {
+        "csv_data.csv": ["name"],
+        "json_data.json": ["data"],
+        "parquet_data.parquet": ["name"],
+    }
+    for key, pii_fields in files.items():
+        input_json = json.dumps(
+            {
+                "file_to_obfuscate": f"s3://mybucket/{key}",
+                "pii_fields": pii_fields,
+            }
+        )
+        expected_bytes = main(input_json)
+
+        input_json = json.dumps(
+            {
+                "file_to_obfuscate": f"s3://mybucket/{key}",
+                "pii_fields": pii_fields,
+                "destination": f"s3://mybucket/obfuscated/{key}",
+            }
+        )
+        assert main(input_json) == f"s3://mybucket/obfuscated/{key}"
+
+        uploaded = mock_s3_setup.get_object(
+            Bucket="mybucket", Key=f"obfuscated/{key}"
+        )["Body"].read()
+        if key.endswith(".parquet"):
+            pd.testing.assert_frame_equal(
+                pd.read_parquet(io.BytesIO(uploaded)),
+                pd.read_parquet(io.BytesIO(expected_bytes)),
+            )
+        else:
+            assert uploaded == expected_bytes
+
+
+def test_main_applies_masking_strategies(mock_s3_setup, monkeypatch):
+    """Test that main applies the masking strategy chosen for each field.
+
+    Args:
+        mock_s3_setup: Pytest fixture to mock AWS S3 interactions.
+        monkeypatch: Pytest fixture to set the hashing key.
+    """
+    monkeypatch.setenv("GDPR_OBFUSCATOR_HASH_KEY", "test-key")
+    for key in ["csv_data.csv", "parquet_data.parquet"]:
+        input_json = json.dumps(
+            {
+                "file_to_obfuscate": f"s3://mybucket/{key}",
+                "pii_fields": ["name", "email_address"],
+                "masking": {
+                    "name": {"strategy": "hash", "length": 16},
+                    "email_address": "email",
+                },
+            }
+        )
+        result = main(input_json)
+        if key.endswith(".parquet"):
+            result_df = pd.read_parquet(io.BytesIO(result))
+        else:
+            result_df = pd.read_csv(io.BytesIO(result))
+
+        assert result_df["name"].str.fullmatch("[0-9a-f]{16}").all()
+        assert result_df["email_address"].str.startswith("******@").all()
+
+
+def test_main_obfuscates_gzip_ndjson_file(mock_s3_setup):
+    """Test that gzip compressed JSON Lines files are obfuscated line by line,
+    whether returned, streamed or uploaded to a destination.
+
+    Args:
+        mock_s3_setup: Pytest fixture to mock AWS S3 interactions.
+    """
+    lines = b'{"id":1,"name":"Alice"}\n{"id":2,"name":null}\n'
+    mock_s3_setup.put_object(
+        Bucket="mybucket", Key="events.jsonl.gz", Body=gzip.compress(lines)
+    )
+    input_json = json.dumps(
+        {
+            "file_to_obfuscate": "s3://mybucket/events.jsonl.gz",
+            "pii_fields": ["name"],
+        }
+    )
+    expected = b'{"id":1,"name":"******"}\n{"id":2,"name":"MISSING VALUE"}\n'
+
+    assert gzip.decompress(main(input_json)) == expected
+    assert gzip.decompress(b"".join(main_stream(input_json, 1))) == expected
+
+    input_json = json.dumps(
+        {
+            "file_to_obfuscate": "s3://mybucket/events.jsonl.gz",
+            "pii_fields": ["name"],
+            "destination": "s3://mybucket/obfuscated/events.jsonl.gz",
+        }
+    )
+    main(input_json)
+    uploaded = mock_s3_setup.get_object(
+        Bucket="mybucket", Key="obfuscated/events.jsonl.gz"
+    )["Body"].read()
+    assert gzip.decompress(uploaded) == expected
+
+
+def test_main_obfuscates_compressed_files(mock_s3_setup):
+    """Test that compressed files give the same output as uncompressed files,
+    compressed again with the same codec, whether returned or uploaded.
+
+    Args:
+        mock_s3_setup: Pytest fixture to mock AWS S3 interactions.
+    """
+    compressors = {
+        "csv_data.csv": ("zst", zstandard.ZstdCompressor().compress),
+        "json_data.json": ("gz", gzip.compress),
+        "parquet_data.parquet": ("bz2", bz2.compress),
+    }
+    for key, (extension, compress) in compressors.items():
+        pii_fields = ["data"] if key.endswith(".json") else ["name"]
+        content = mock_s3_setup.get_object(Bucket="mybucket", Key=key)[
+            "Body"
+        ].read()
+        mock_s3_setup.put_object(
+            Bucket="mybucket", Key=f"{key}.{extension}", Body=compress(content)
+        )
+        expected = main(
+            json.dumps(
+                {
+                    "file_to_obfuscate": f"s3://mybucket/{key}",
+                    "pii_fields": pii_fields,
+                }
+            )
+        )
+
+        input_json = {
+            "file_to_obfuscate": f"s3://mybucket/{key}.{extension}",
+            "pii_fields": pii_fields,
+            "compression_level": 1,
+        }
+        returned = main(json.dumps(input_json))
+        main(
+            json.dumps(
+                {**input_json, "destination": f"s3://mybucket/out/{key}"}
+            )
+        )
+        uploaded = mock_s3_setup.get_object(
+            Bucket="mybucket", Key=f"out/{key}"
+        )["Body"].read()
+
+        for output in [returned, uploaded]:
+            decompressed, _ = decompress_bytes(output)
+            assert detect_compression(output[:10]) == detect_compression(
+                compress(b"")[:10]
+            )
+            if key.endswith(".parquet"):
+                pd.testing.assert_frame_equal(
+                    pd.read_parquet(io.BytesIO(decompressed)),
+                    pd.read_parquet(io.BytesIO(expected)),
+                )
+            else:
+                assert decompressed == expected
+
+
+def test_main_downloads_large_files_by_range(mock_s3_setup):
+    """Test that files fetched with many small ranged GETs give the same
+    output as a single download, for every streamed format.
+
+    Args:
+        mock_s3_setup: Pytest fixture to mock AWS S3 interactions.
+    """
+    contents = {
+        "big.csv": b"id,name\n"
+        + b"".join(b"%d,Name %d\n" % (i, i) for i in range(2000)),
+        "big.ndjson": b"".join(
+            b'{"id":%d,"name":"Name %d"}\n' % (i, i) for i in range(2000)
+        ),
+    }
+    for key, content in contents.items():
+        mock_s3_setup.put_object(Bucket="mybucket", Key=key, Body=content)
+        input_json = {
+            "file_to_obfuscate": f"s3://mybucket/{key}",
+            "pii_fields": ["name"],
+        }
+        expected = main(json.dumps(input_json))
+
+        main(
+            json.dumps(
+                {
+                    **input_json,
+                    "destination": f"s3://mybucket/out/{key}",
+                    "download_part_size_mb": 0.001,
+                    "download_concurrency": 3,
+                }
+            )
+        )
+        uploaded = mock_s3_setup.get_object(
+            Bucket="mybucket", Key=f"out/{key}"
+        )["Body"].read()
+        assert uploaded == expected
+
+
+def test_main_strings_csv_engine_keeps_values(mock_s3_setup):
+    """Test that the 'strings' CSV engine writes the values of columns that
+    are not masked back unchanged, whichever path the file takes, while
+    missing PII values are still reported.
+
+    Args:
+        mock_s3_setup: Pytest fixture to mock AWS S3 interactions.
+    """
+    content = (
+        b"id,name,amount,joined,note\n"
+        b"007,Ann,1.50,2024-01-02,NULL\n"
+        b"008,,2.00,2024-01-03,\n"
+    )
+    mock_s3_setup.put_object(Bucket="mybucket", Key="raw.csv", Body=content)
+    mock_s3_setup.put_object(
+        Bucket="mybucket", Key="raw.csv.gz", Body=gzip.compress(content)
+    )
+    expected = (
+        b"id,name,amount,joined,note\n"
+        b"007,******,1.50,2024-01-02,NULL\n"
+        b"008,MISSING VALUE,2.00,2024-01-03,\n"
+    )
+    input_json = {
+        "file_to_obfuscate": "s3://mybucket/raw.csv",
+        "pii_fields": ["name"],
+        "csv_engine": "strings",
+    }
+
+    assert main(json.dumps(input_json)) == expected
+    assert b"".join(main_stream(json.dumps(input_json))) == expected
+    assert main(json.dumps({**input_json, "workers": 2})) == expected
+    compressed = main(
+        json.dumps(
+            {**input_json, "file_to_obfuscate": "s3://mybucket/raw.csv.gz"}
+        )
+    )
+    assert gzip.decompress(compressed) == expected
+    main(json.dumps({**input_json, "destination": "s3://mybucket/out.csv"}))
+    uploaded = mock_s3_setup.get_object(Bucket="mybucket", Key="out.csv")
+    assert uploaded["Body"].read() == expected
+    # The default engine infers the types of the same columns
+    assert b"7,******,1.5," in main(
+        json.dumps({**input_json, "csv_engine": "pandas"})
+    )
@@ -0,0 +1,332 @@
+import pytest
+import io
+import pandas as pd
+import pyarrow as pa
+from src.masking import (
+    TokenCache,
+    configure_token_cache,
+    hash_values,
+    mask_arrow_column_with_strategy,
+    mask_series,
+    redact_text,
+    resolve_masking,
+    token_cache_stats,
+)
+from src.parquet_engine import obfuscate_parquet_bytes
+from src.utils import obfuscate_pii_fields
+
+
+@pytest.fixture
+def hash_key(monkeypatch):
+    """
+    Set the secret key used for keyed hashing and start an empty token cache.
+    """
+    monkeypatch.setenv("GDPR_OBFUSCATOR_HASH_KEY", "test-key")
+    configure_token_cache()
+
+
+class TestResolveMasking:
+    """
+    Tests for the `resolve_masking` function.
+    """
+
+    def test_fields_default_to_mask(self):
+        """
+        Test that fields without a strategy use the default mask, and that
+        strategy names and options are expanded with their defaults.
+        """
+        resolved = resolve_masking(
+            ["name", "email", "phone"],
+            {"email": "email", "phone": {"strategy": "keep_last", "keep": 2}},
+        )
+
+        assert resolved == {
+            "name": {"strategy": "mask"},
+            "email": {"strategy": "email"},
+            "phone": {"strategy": "keep_last", "keep": 2},
+        }
+
+    def test_errors_with_invalid_masking(self):
+        """
+        Test that invalid strategies and options raise appropriate errors.
+        """
+        invalid_masking = [
+            {"name": "scramble"},
+            {"course": "mask"},
+            {"name": {"strategy": "truncate"}},
+            {"name": {"strategy": "keep_last", "keep": 0}},
+            {"name": {"strategy": "truncate", "length": True}},
+            {"name": {"strategy": "hash", "algorithm": "md5"}},
+            {"name": {"strategy": "email", "domain": True}},
+            {"name": {"strategy": "redact", "patterns": ["passport"]}},
+            {"name": {"strategy": "redact", "patterns": [], "terms": []}},
+            {"name": {"strategy": "redact", "terms": "Acme"}},
+        ]
+        expected_error_messages = [
+            "Unknown masking strategy 'scramble'",
+            "refers to fields not in 'pii_fields': course",
+            "'length' for 'name' must be a positive integer",
+            "'keep' for 'name' must be a positive integer",
+            "'length' for 'name' must be a positive integer",
+            "Unknown hash algorithm 'md5'",
+            "unknown options for 'email' masking: domain",
+            "Unknown redaction patterns for 'name': passport",
+            "'redact' masking for 'name' needs 'patterns' or 'terms'",
+            "'patterns' and 'terms' for 'name' must be lists",
+        ]
+
+        for masking, expected_message in zip(
+            invalid_masking, expected_error_messages
+        ):
+            with pytest.raises(ValueError, match=expected_message):
+                resolve_masking(["name"], masking)
+
+
+class TestHashValues:
+    """
+    Tests for the `hash_values` function.
+    """
+
+    def test_hashing_is_deterministic_and_keyed(self, hash_key, monkeypatch):
+        """
+        Test that the same value always maps to the same token, and that
+        changing the key changes the tokens.
+        """
+        tokens = hash_values(["alice", "bob", "alice"])
+
+        assert tokens[0] == tokens[2] != tokens[1]
+        assert all(len(token) == 32 for token in tokens)
+        assert hash_values(["alice"], "hmac-sha256", 8)[0] != tokens[0][:8]
+
+        monkeypatch.setenv("GDPR_OBFUSCATOR_HASH_KEY", "other-key")
+        assert hash_values(["alice"])[0] != tokens[0]
+
+    def test_errors_without_key(self, monkeypatch):
+        """
+        Test that hashing without a key raises an error.
+        """
+        monkeypatch.setattr("src.masking.load_dotenv", lambda: None)
+        monkeypatch.delenv("GDPR_OBFUSCATOR_HASH_KEY", raising=False)
+
+        with pytest.raises(ValueError, match="GDPR_OBFUSCATOR_HASH_KEY"):
+            hash_values(["alice"])
+
+    def test_errors_with_key_too_long_for_blake2b(self, hash_key, monkeypatch):
+        """
+        Test that a key longer than BLAKE2b accepts raises an error rather
+        than being cut short, while HMAC-SHA256 still accepts it.
+        """
+        monkeypatch.setenv("GDPR_OBFUSCATOR_HASH_KEY", "k" * 65)
+
+        with pytest.raises(ValueError, match="at most 64 bytes"):
+            hash_values(["alice"])
+        assert len(hash_values(["alice"], "hmac-sha256")[0]) == 32
+
+
+class TestTokenCache:
+    """
+    Tests for the `TokenCache` class and the shared token cache.
+    """
+
+    def test_least_recently_used_values_are_evicted(self):
+        """
+        Test that the cache keeps at most max_size digests, evicting the
+        least recently used, and counts hits and misses.
+        """
+        cache = TokenCache(max_size=2)
+        cache.put_many("ns", ["a", "b"], ["1", "2"])
+        assert cache.get_many("ns", ["a"]) == ["1"]
+
+        cache.put_many("ns", ["c"], ["3"])
+        assert cache.get_many("ns", ["a", "b", "c"]) == ["1", None, "3"]
+        assert cache.get_many("other", ["a"]) == [None]
+        assert cache.stats() == {
+            "size": 2,
+            "max_size": 2,
+            "hits": 3,
+            "misses": 2,
+            "evictions": 1,
+            "hit_rate": 0.6,
+        }
+
+    def test_repeated_values_are_hashed_once(self, hash_key, monkeypatch):
+        """
+        Test that values hashed in one column are served from the cache for
+        another column, whatever the token length.
+        """
+        first = hash_values(["alice", "bob"])
+        calls = []
+        original_put_many = TokenCache.put_many
+
+        def counting_put_many(self, namespace, values, digests):
+            calls.extend(values)
+            original_put_many(self, namespace, values, digests)
+
+        monkeypatch.setattr(TokenCache, "put_many", counting_put_many)
+        second = hash_values(["bob", "carol", "alice"], length=8)
+
+        assert second[0] == first[1][:8] and second[2] == first[0][:8]
+        assert calls == ["carol"]
+        assert token_cache_stats()["hits"] == 2
+
+    def test_cache_can_be_disabled(self, hash_key):
+        """
+        Test that a cache size of 0 turns caching off without changing tokens.
+        """
+        cached = hash_values(["alice"])
+        configure_token_cache(0)
+
+        assert hash_values(["alice"]) == hash_values(["alice"]) == cached
+        assert token_cache_stats()["size"] == 0
+
+
+class TestMaskingStrategies:
+    """
+    Tests for masking whole columns with each strategy.
+    """
+
+    values = ["jane.doe@example.com", None, "07700900123", "ab"]
+
+    @pytest.mark.parametrize(
+        "options, expected",
+        [
+            (
+                {"strategy": "email"},
+                ["******@example.com", "MISSING VALUE", "******", "******"],
+            ),
+            (
+                {"strategy": "keep_last", "keep": 4},
+                [
+                    "****************.com",
+                    "MISSING VALUE",
+                    "*******0123",
+                    "******",
+                ],
+            ),
+            (
+                {"strategy": "truncate", "length": 3},
+                ["jan", "MISSING VALUE", "077", "ab"],
+            ),
+            (
+                {"strategy": "redact", "patterns": ["email"], "terms": []},
+                ["******", "MISSING VALUE", "07700900123", "ab"],
+            ),
+        ],
+    )
+    def test_pandas_and_arrow_columns_match(self, options, expected):
+        """
+        Test that pandas and Arrow columns are masked the same way.
+        """
+        series = pd.Series(self.values, index=[10, 11, 12, 13])
+        column = pa.chunked_array([self.values[:2], self.values[2:]])
+
+        assert list(mask_series(series, options)) == expected
+        assert (
+            mask_arrow_column_with_strategy(column, options).to_pylist()
+            == expected
+        )
+
+    def test_hashed_values_are_consistent_across_formats(self, hash_key):
+        """
+        Test that equal values get equal tokens in DataFrames and Parquet files.
+        """
+        df = pd.DataFrame(
+            {"id": [1, 2, 3], "name": ["Alice", "Bob", "Alice"]}
+        )
+        masking = {"name": "hash"}
+
+        obfuscated_df = obfuscate_pii_fields(df, ["name"], masking)
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False)
+        parquet_df = pd.read_parquet(
+            io.BytesIO(
+                obfuscate_parquet_bytes(buffer.getvalue(), ["name"], masking)
+            )
+        )
+
+        names = list(obfuscated_df["name"])
+        assert names[0] == names[2] != names[1]
+        assert list(parquet_df["name"]) == names
+        assert list(obfuscated_df["id"]) == [1, 2, 3]
+
+
+class TestRedaction:
+    """
+    Tests for redacting PII inside free text with the 'redact' strategy.
+    """
+
+    def test_pii_inside_text_is_redacted(self):
+        """
+        Test that each kind of PII is replaced in place, keeping the rest
+        of the text, and that order numbers and dates are kept.
+        """
+        notes = pa.array(
+            [
+                "Call +44 7700 900123 or 020 7946 0958 about order 12345678901.",
+                "Refund to GB82 WEST 1234 5698 7654 32, NI AB 12 34 56 C.",
+                "Moved to SW1A 1AA on 2024-03-31, email j.smith@email.com",
+                None,
+            ]
+        )
+        options = resolve_masking(["notes"], {"notes": "redact"})["notes"]
+
+        assert redact_text(
+            notes, options["patterns"], options["terms"]
+        ).to_pylist() == [
+            "Call ****** or ****** about order 12345678901.",
+            "Refund to ******, NI ******.",
+            "Moved to ****** on 2024-03-31, email ******",
+            None,
+        ]
+
+    def test_terms_are_matched_as_whole_words(self):
+        """
+        Test that dictionary terms are matched case-insensitively as whole
+        words, preferring the longest term.
+        """
+        notes = pa.array(["ACME Corp. and Acme bought Acmeware from Acme"])
+
+        assert redact_text(
+            notes, [], ["Acme", "acme corp."]
+        ).to_pylist() == ["****** and ****** bought Acmeware from ******"]
+
+    def test_terms_with_accented_letters_are_redacted(self):
+        """
+        Test that terms starting or ending with letters outside ASCII, which
+        RE2's word boundaries do not know, are still redacted.
+        """
+        notes = pa.array(["met Émile and ZOË today", "émile, Émile"])
+
+        assert redact_text(notes, [], ["Émile", "Zoë"]).to_pylist() == [
+            "met ****** and ****** today",
+            "******, ******",
+        ]
+
+    def test_other_columns_are_kept(self):
+        """
+        Test that a redacted column keeps its text in a DataFrame and a
+        Parquet file, while other PII fields are masked whole.
+        """
+        df = pd.DataFrame(
+            {
+                "name": ["Jane Doe", "John Smith"],
+                "notes": ["Reach me at jane@example.com", "No contact"],
+            }
+        )
+        masking = {"notes": {"strategy": "redact", "terms": ["Jane"]}}
+
+        obfuscated_df = obfuscate_pii_fields(df, ["name", "notes"], masking)
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False)
+        parquet_df = pd.read_parquet(
+            io.BytesIO(
+                obfuscate_parquet_bytes(
+                    buffer.getvalue(), ["name", "notes"], masking
+                )
+            )
+        )
+
+        expected = ["Reach me at ******", "No contact"]
+        assert list(obfuscated_df["notes"]) == expected
+        assert list(parquet_df["notes"]) == expected
+        assert list(parquet_df["name"]) == ["******", "******"]
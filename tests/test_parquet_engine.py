@@ -0,0 +1,119 @@
+import pytest
+import io
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.parquet_engine import obfuscate_parquet_bytes
+
+
+def _parquet_bytes(df, **kwargs):
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False, **kwargs)
+    return buffer.getvalue()
+
+
+class TestObfuscateParquetBytes:
+    """
+    Tests for the `obfuscate_parquet_bytes` function.
+    """
+
+    df = pd.DataFrame(
+        {
+            "student_id": list(range(10)),
+            "name": ["Alice", None] * 5,
+            "score": [1.5, 2.5] * 5,
+            "email_address": ["a@example.com"] * 10,
+        }
+    )
+
+    def test_pii_fields_are_obfuscated(self):
+        """
+        Test that PII fields are masked and missing values are marked.
+        """
+        result = obfuscate_parquet_bytes(
+            _parquet_bytes(self.df), ["name", "email_address"]
+        )
+        result_df = pd.read_parquet(io.BytesIO(result))
+
+        assert list(result_df["name"]) == ["******", "MISSING VALUE"] * 5
+        assert list(result_df["email_address"]) == ["******"] * 10
+
+    def test_non_pii_fields_pass_through_unchanged(self):
+        """
+        Test that columns not listed as PII keep their values and types.
+        """
+        result = obfuscate_parquet_bytes(_parquet_bytes(self.df), ["name"])
+        result_df = pd.read_parquet(io.BytesIO(result))
+
+        pd.testing.assert_frame_equal(
+            result_df.drop(columns="name"), self.df.drop(columns="name")
+        )
+
+    def test_row_groups_compression_and_metadata_are_preserved(self):
+        """
+        Test that the source row-group layout, codec and metadata are kept.
+        """
+        source = _parquet_bytes(self.df, row_group_size=4, compression="zstd")
+        result = obfuscate_parquet_bytes(source, ["student_id"])
+
+        source_file = pq.ParquetFile(io.BytesIO(source))
+        result_file = pq.ParquetFile(io.BytesIO(result))
+
+        assert result_file.metadata.num_row_groups == 3
+        assert [
+            result_file.metadata.row_group(i).num_rows for i in range(3)
+        ] == [4, 4, 2]
+        assert result_file.metadata.row_group(0).column(2).compression == (
+            "ZSTD"
+        )
+        assert pa.types.is_dictionary(
+            result_file.schema_arrow.field("student_id").type
+        )
+        assert (
+            result_file.schema_arrow.metadata.keys()
+            == source_file.schema_arrow.metadata.keys()
+        )
+
+    def test_missing_columns_returns_error(self):
+        """
+        Test that PII fields absent from the file raise a ValueError.
+        """
+        with pytest.raises(ValueError, match="Missing columns: phone"):
+            obfuscate_parquet_bytes(_parquet_bytes(self.df), ["phone"])
+
+    def test_empty_file_returns_error(self):
+        """
+        Test that a Parquet file with no rows raises a ValueError.
+        """
+        with pytest.raises(
+            ValueError,
+            match="Input DataFrame is empty. Cannot proceed with processing.",
+        ):
+            obfuscate_parquet_bytes(
+                _parquet_bytes(self.df.iloc[:0]), ["name"]
+            )
+
+    def test_pii_chunks_without_nulls_are_not_decoded(self, monkeypatch):
+        """
+        Test that PII column chunks with no nulls are masked from statistics
+        while float PII columns, whose NaNs are not counted, are decoded.
+        """
+        read_columns = []
+        original_read_row_group = pq.ParquetFile.read_row_group
+
+        def recording_read_row_group(self, i, columns=None, **kwargs):
+            read_columns.append(columns)
+            return original_read_row_group(self, i, columns=columns, **kwargs)
+
+        monkeypatch.setattr(
+            pq.ParquetFile, "read_row_group", recording_read_row_group
+        )
+        df = self.df.assign(score=[1.5, float("nan")] * 5)
+        result = obfuscate_parquet_bytes(
+            _parquet_bytes(df), ["email_address", "name", "score"]
+        )
+        result_df = pd.read_parquet(io.BytesIO(result))
+
+        assert read_columns == [["student_id", "name", "score"]]
+        assert list(result_df["email_address"]) == ["******"] * 10
+        assert list(result_df["score"]) == ["******", "MISSING VALUE"] * 5
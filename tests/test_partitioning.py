@@ -0,0 +1,254 @@
+import pytest
+import gzip
+import io
+import json
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor
+from src.main import main, obfuscate_file_content
+from src.partitioning import (
+    _map_partitions,
+    obfuscate_partitioned,
+    split_record_ranges,
+)
+
+
+class TestSplitRecordRanges:
+    """
+    Tests for the `split_record_ranges` function.
+    """
+
+    def test_ranges_cover_content_on_record_boundaries(self):
+        """
+        Test that the ranges are contiguous, cover the content after the
+        start offset and never split a quoted newline.
+        """
+        content = b'id,note\n1,"a\nb"\n2,c\n3,"d\n\ne"\n4,f'
+
+        ranges = split_record_ranges(content, 8, 4, quoted=True)
+
+        assert ranges[0][0] == 8 and ranges[-1][1] == len(content)
+        assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+        assert [content[start:end] for start, end in ranges] == [
+            b'1,"a\nb"\n',
+            b"2,c\n",
+            b'3,"d\n\ne"\n',
+            b"4,f",
+        ]
+        assert split_record_ranges(content, 8, 4) != ranges
+
+
+class TestMapPartitions:
+    """
+    Tests for the `_map_partitions` function.
+    """
+
+    def test_partitions_in_flight_are_bounded(self, monkeypatch):
+        """
+        Test that results are yielded in order with no more than twice as
+        many partitions as workers submitted ahead.
+        """
+        submitted = []
+
+        class RecordingPool(ThreadPoolExecutor):
+            def __init__(self, max_workers, mp_context):
+                super().__init__(max_workers)
+
+            def submit(self, function, *args):
+                submitted.append(args)
+                return super().submit(function, *args)
+
+        monkeypatch.setattr(
+            "src.partitioning.ProcessPoolExecutor", RecordingPool
+        )
+        results = _map_partitions(pow, [(i, 2) for i in range(20)], 2)
+
+        assert next(results) == 0
+        assert len(submitted) == 4
+        assert list(results) == [i**2 for i in range(1, 20)]
+
+
+class TestObfuscatePartitioned:
+    """
+    Tests for the `obfuscate_partitioned` function.
+    """
+
+    df = pd.DataFrame(
+        {
+            "student_id": range(400),
+            "name": [f"Student {i}" for i in range(400)],
+            "notes": ["line one\nline two", None, "plain", "x,y"] * 100,
+            "email_address": [None, "a@example.com"] * 200,
+        }
+    )
+
+    def test_csv_output_matches_single_process(self):
+        """
+        Test that a CSV file masked in several processes is identical to
+        the single-process output.
+        """
+        content = self.df.to_csv(index=False).encode("utf-8")
+
+        result = b"".join(
+            obfuscate_partitioned(
+                content,
+                "csv",
+                ["name", "email_address"],
+                workers=2,
+                min_partition_size=1024,
+            )
+        )
+
+        assert result == obfuscate_file_content(
+            content, "csv", ["name", "email_address"], fast_path_max_bytes=0
+        )
+
+    def test_csv_missing_values_in_one_partition(self):
+        """
+        Test that a numeric column with missing values in only one
+        partition is written the same way as in a single process.
+        """
+        content = b"id,name,age\n1,a,30\n2,b,\n3,c,31\n"
+
+        result = b"".join(
+            obfuscate_partitioned(
+                content, "csv", ["name"], workers=3, min_partition_size=1
+            )
+        )
+
+        assert result == b"id,name,age\n1,******,30\n2,******,\n3,******,31\n"
+        assert result == obfuscate_file_content(
+            content, "csv", ["name"], fast_path_max_bytes=0
+        )
+
+    def test_csv_column_that_turns_float_in_a_later_partition(
+        self, monkeypatch
+    ):
+        """
+        Test that a column that only turns float in a later partition is
+        written the same way as in a single process, whether or not the
+        float is in the head the column types are inferred from.
+        """
+        content = b"id,name,score\n" + b"".join(
+            b"%d,n%d,%s\n" % (i, i, b"1.5" if i == 45 else b"%d" % i)
+            for i in range(50)
+        )
+
+        for sample_bytes, score in [(1024 * 1024, b"3.0"), (100, b"3")]:
+            monkeypatch.setattr(
+                "src.streaming.CSV_DTYPE_SAMPLE_BYTES", sample_bytes
+            )
+            result = b"".join(
+                obfuscate_partitioned(
+                    content, "csv", ["name"], workers=3, min_partition_size=1
+                )
+            )
+
+            assert b"\n3,******,%s\n" % score in result
+            assert b"\n45,******,1.5\n" in result
+            assert result == obfuscate_file_content(
+                content, "csv", ["name"], fast_path_max_bytes=0
+            )
+
+    def test_parquet_keeps_row_group_order(self):
+        """
+        Test that Parquet row groups masked in several processes are written
+        back in order, with the source row-group layout.
+        """
+        buffer = io.BytesIO()
+        pq.write_table(
+            pa.Table.from_pandas(self.df, preserve_index=False),
+            buffer,
+            row_group_size=50,
+        )
+
+        result = b"".join(
+            obfuscate_partitioned(
+                buffer.getvalue(),
+                "parquet",
+                ["name"],
+                workers=2,
+                min_partition_size=1024,
+            )
+        )
+
+        metadata = pq.ParquetFile(io.BytesIO(result)).metadata
+        result_df = pd.read_parquet(io.BytesIO(result))
+        assert metadata.num_row_groups == 8
+        assert list(result_df["student_id"]) == list(range(400))
+        assert set(result_df["name"]) == {"******"}
+        assert result == obfuscate_file_content(
+            buffer.getvalue(), "parquet", ["name"]
+        )
+
+    def test_compressed_ndjson_is_recompressed(self):
+        """
+        Test that compressed JSON Lines content is split after being
+        decompressed, and errors keep their original line numbers.
+        """
+        lines = [
+            json.dumps({"id": i, "name": f"Student {i}"}) for i in range(200)
+        ]
+        content = gzip.compress(("\n".join(lines) + "\n").encode("utf-8"))
+
+        result = gzip.decompress(
+            b"".join(
+                obfuscate_partitioned(
+                    content,
+                    "jsonl",
+                    ["name"],
+                    workers=2,
+                    min_partition_size=512,
+                )
+            )
+        )
+
+        records = [json.loads(line) for line in result.splitlines()]
+        assert [record["id"] for record in records] == list(range(200))
+        assert {record["name"] for record in records} == {"******"}
+
+        lines[150] = "not json"
+        with pytest.raises(ValueError, match="line 151 is not valid JSON"):
+            b"".join(
+                obfuscate_partitioned(
+                    "\n".join(lines).encode("utf-8"),
+                    "jsonl",
+                    ["name"],
+                    workers=2,
+                    min_partition_size=512,
+                )
+            )
+
+    def test_errors_with_unsupported_file_type(self):
+        """
+        Test that JSON documents cannot be partitioned.
+        """
+        with pytest.raises(ValueError, match="Unsupported file type"):
+            next(obfuscate_partitioned(b"{}", "json", ["name"], workers=2))
+
+    def test_main_uses_workers(self, mock_s3_setup, monkeypatch):
+        """
+        Test that main splits the file between workers when asked to.
+        """
+        calls = []
+
+        def spy(*args, **kwargs):
+            calls.append(args[1:])
+            return obfuscate_partitioned(*args, **kwargs)
+
+        monkeypatch.setattr("src.main.obfuscate_partitioned", spy)
+        result = main(
+            json.dumps(
+                {
+                    "file_to_obfuscate": "s3://mybucket/parquet_data.parquet",
+                    "pii_fields": ["name", "email_address"],
+                    "workers": 4,
+                }
+            )
+        )
+
+        result_df = pd.read_parquet(io.BytesIO(result))
+        assert list(result_df["name"]) == ["******"]
+        assert list(result_df["student_id"]) == [7890]
+        assert calls == [("parquet", ["name", "email_address"], None, None, 4)]
@@ -0,0 +1,201 @@
+import pytest
+import gzip
+import json
+import mmap
+from src.main import main, main_stream
+from src.splice_engine import (
+    find_header_end,
+    obfuscate_csv_splice,
+    splice_csv_block,
+)
+from src.streaming import obfuscate_csv_parts
+
+CRAFTED_CSV = (
+    b"id,name,amount,notes,email_address\r\n"
+    b'007,Alice,1.50,"likes, commas\nand newlines",a@example.com\r\n'
+    b"\r\n"
+    b'008,"NULL",2.00,"say ""hi""",\r\n'
+    b'009,"Bob, Jr",3,plain,"b@example.com"\r\n'
+    b"010,Carol\r\n"
+)
+MASKED_CSV = (
+    b"id,name,amount,notes,email_address\r\n"
+    b'007,******,1.50,"likes, commas\nand newlines",******\r\n'
+    b"\r\n"
+    b'008,MISSING VALUE,2.00,"say ""hi""",MISSING VALUE\r\n'
+    b"009,******,3,plain,******\r\n"
+    b"010,******\r\n"
+)
+
+
+class TestObfuscateCsvSplice:
+    """
+    Tests for the `obfuscate_csv_splice` function.
+    """
+
+    def test_only_pii_cells_change(self):
+        """
+        Test that every byte outside the PII cells is copied unchanged,
+        including quoting, line endings, blank lines and short records,
+        whatever the block size.
+        """
+        for block_size in [1, 10, 1024]:
+            output = b"".join(
+                obfuscate_csv_splice(
+                    CRAFTED_CSV,
+                    ["name", "email_address"],
+                    block_size=block_size,
+                )
+            )
+            assert output == MASKED_CSV
+
+    def test_reads_from_mmap(self, tmp_path):
+        """
+        Test that a memory-mapped file is masked without being read first.
+        """
+        path = tmp_path / "data.csv"
+        path.write_bytes(CRAFTED_CSV)
+        with open(path, "rb") as file, mmap.mmap(
+            file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mapped:
+            output = b"".join(
+                obfuscate_csv_splice(mapped, ["name", "email_address"])
+            )
+        assert output == MASKED_CSV
+
+    def test_masking_strategies_are_quoted(self):
+        """
+        Test that strategies other than 'mask' transform the unquoted value
+        and quote their output where CSV needs it.
+        """
+        output = b"".join(
+            obfuscate_csv_splice(
+                CRAFTED_CSV,
+                ["name", "email_address"],
+                {
+                    "name": {"strategy": "truncate", "length": 5},
+                    "email_address": "email",
+                },
+            )
+        )
+        assert b'009,"Bob, ",3,plain,******@example.com\r\n' in output
+        assert b"008,MISSING VALUE,2.00" in output
+
+    def test_errors_with_invalid_files(self):
+        """
+        Test that empty files, files without records and missing columns
+        raise the same errors as the pandas engine.
+        """
+        invalid_files = [b"", b"id,name\n", b"id,other\n1,2\n"]
+        expected_error_messages = [
+            "No columns to parse from file",
+            "Input DataFrame is empty",
+            "Missing columns: name",
+        ]
+
+        for file_content, expected_message in zip(
+            invalid_files, expected_error_messages
+        ):
+            with pytest.raises(ValueError, match=expected_message):
+                list(obfuscate_csv_splice(file_content, ["name"]))
+
+    def test_stray_quote_does_not_leak_pii(self):
+        """
+        Test that a quote in the middle of an unquoted field, which pandas
+        reads as a plain character, does not hide the rest of the file
+        from masking, whatever the block or part size.
+        """
+        content = (
+            b"item,name,email\n"
+            b'12" pizza,Alice,alice@example.com\n'
+            b"soda,Bob,bob@example.com\n"
+            b'"tea, ""hot""",Carol,carol@example.com\n'
+        ) + b"".join(b"cake %d,Dan,dan@example.com\n" % i for i in range(20))
+
+        outputs = [
+            b"".join(
+                obfuscate_csv_splice(
+                    content, ["name", "email"], block_size=block_size
+                )
+            )
+            for block_size in [1, 40, 1024]
+        ] + [
+            b"".join(
+                obfuscate_csv_parts(
+                    [content[i : i + 30] for i in range(0, len(content), 30)],
+                    ["name", "email"],
+                    csv_engine="splice",
+                )
+            )
+        ]
+
+        for output in outputs:
+            assert b"@" not in output
+            assert b"Alice" not in output and b"Dan" not in output
+            assert output.count(b"******,******") == 23
+
+    def test_header_quotes(self):
+        """
+        Test that the header ends at the first newline outside a quoted
+        name, where quotes only open a name at its start.
+        """
+        assert find_header_end(b'a,b"c,d\n1,2,3\n') == 8
+        assert find_header_end(b'"a\n""b""",c\n1,2\n') == 12
+        assert find_header_end(b"a,b") == 3
+
+    def test_block_counts_records(self):
+        """
+        Test that a block of records is masked without its header.
+        """
+        output, rows = splice_csv_block(
+            b"id,name\n", b"1,Ann\n\n2,\n", ["name"]
+        )
+        assert output == b"1,******\n\n2,MISSING VALUE\n"
+        assert rows == 2
+
+
+def test_main_splice_engine_on_every_path(mock_s3_setup):
+    """
+    Test that main gives the same spliced output whether the file is
+    returned, streamed, compressed, partitioned or uploaded by ranged
+    download.
+    """
+    mock_s3_setup.put_object(
+        Bucket="mybucket", Key="crafted.csv", Body=CRAFTED_CSV
+    )
+    mock_s3_setup.put_object(
+        Bucket="mybucket",
+        Key="crafted.csv.gz",
+        Body=gzip.compress(CRAFTED_CSV),
+    )
+    input_json = {
+        "file_to_obfuscate": "s3://mybucket/crafted.csv",
+        "pii_fields": ["name", "email_address"],
+        "csv_engine": "splice",
+    }
+
+    assert main(json.dumps(input_json)) == MASKED_CSV
+    assert b"".join(main_stream(json.dumps(input_json))) == MASKED_CSV
+    assert main(json.dumps({**input_json, "workers": 2})) == MASKED_CSV
+    compressed = main(
+        json.dumps(
+            {
+                **input_json,
+                "file_to_obfuscate": "s3://mybucket/crafted.csv.gz",
+            }
+        )
+    )
+    assert gzip.decompress(compressed) == MASKED_CSV
+    main(
+        json.dumps(
+            {
+                **input_json,
+                "destination": "s3://mybucket/out/crafted.csv",
+                "download_part_size_mb": 0.00002,
+            }
+        )
+    )
+    uploaded = mock_s3_setup.get_object(
+        Bucket="mybucket", Key="out/crafted.csv"
+    )
+    assert uploaded["Body"].read() == MASKED_CSV
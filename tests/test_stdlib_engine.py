@@ -0,0 +1,137 @@
+import pytest
+import json
+import src.main
+from src.file_handling import bytes_to_dataframe, dataframe_to_bytes
+from src.main import main
+from src.stdlib_engine import obfuscate_csv_bytes, obfuscate_json_bytes
+from src.streaming import infer_csv_dtypes
+from src.utils import apply_csv_dtypes, csv_read_options, obfuscate_pii_fields
+
+
+def _pandas_output(file_content, file_type, pii_fields):
+    df = bytes_to_dataframe(
+        file_content, file_type, csv_read_options(pii_fields)
+    )
+    if file_type == "csv":
+        df = apply_csv_dtypes(df, infer_csv_dtypes(file_content))
+    return dataframe_to_bytes(obfuscate_pii_fields(df, pii_fields), file_type)
+
+
+class TestObfuscateCsvBytes:
+    """
+    Tests for the `obfuscate_csv_bytes` function.
+    """
+
+    def test_output_is_byte_identical_to_pandas(self):
+        """
+        Test that supported CSV files give exactly the pandas output.
+        """
+        with open("tests/dummy_test_data/csv_dummy.csv", "rb") as file:
+            dummy_csv = file.read()
+        crafted_csv = (
+            b"id,name,notes,score,email_address\r\n"
+            b'1,Alice,"likes, commas",7,a@example.com\r\n'
+            b'2,,"say ""hi""",NA,\r\n'
+            b"3,Carol,null,12,c@example.com\r\n"
+        )
+
+        for file_content in [dummy_csv, crafted_csv]:
+            pii_fields = ["name", "email_address"]
+            assert obfuscate_csv_bytes(
+                file_content, pii_fields
+            ) == _pandas_output(file_content, "csv", pii_fields)
+
+    def test_unsupported_files_are_left_to_pandas(self):
+        """
+        Test that files whose pandas round trip differs return None.
+        """
+        unsupported_files = [
+            b"id,score\n1,1.50\n",
+            b"id,flag\n1,true\n",
+            b"id,code\n1,007\n",
+            b"id,name\n1,Alice,extra\n",
+            b"id,id\n1,2\n",
+            b"id,name\n",
+            b"",
+        ]
+        for file_content in unsupported_files:
+            assert obfuscate_csv_bytes(file_content, ["name"]) is None
+
+
+class TestObfuscateJsonBytes:
+    """
+    Tests for the `obfuscate_json_bytes` function.
+    """
+
+    def test_output_is_byte_identical_to_pandas(self):
+        """
+        Test that supported JSON files give exactly the pandas output.
+        """
+        records = [
+            {"id": 1, "name": "Alice", "url": "a/b", "email_address": None},
+            {"id": 2, "name": None, "url": None, "email_address": "b@x.com"},
+            {"id": 3, "name": "Zoë", "url": "c", "email_address": "c@x.com"},
+        ]
+        file_content = json.dumps(records).encode("utf-8")
+        pii_fields = ["name", "email_address"]
+
+        assert obfuscate_json_bytes(
+            file_content, pii_fields
+        ) == _pandas_output(file_content, "json", pii_fields)
+
+    def test_unsupported_files_are_left_to_pandas(self):
+        """
+        Test that files whose pandas round trip differs return None.
+        """
+        unsupported_files = [
+            {"data": [{"id": 1, "name": "Alice"}]},
+            [{"id": 1, "name": "Alice"}, {"name": "Bob", "id": 2}],
+            [{"id": 1.5, "name": "Alice"}],
+            [{"id": "12", "name": "Alice"}],
+            [{"created_at": "2024-01-01", "name": "Alice"}],
+            [],
+        ]
+        for records in unsupported_files:
+            file_content = json.dumps(records).encode("utf-8")
+            assert obfuscate_json_bytes(file_content, ["name"]) is None
+
+
+class TestMainFastPath:
+    """
+    Tests that main picks the standard library engine for small files.
+    """
+
+    input_json = '{"file_to_obfuscate": "s3://mybucket/csv_data.csv", "pii_fields": ["email_address", "name"]}'
+
+    def test_small_files_skip_pandas(self, mock_s3_setup, monkeypatch):
+        """
+        Test that a small CSV file is obfuscated without building a DataFrame.
+        """
+
+        def fail_bytes_to_dataframe(file_content, file_type):
+            raise AssertionError("pandas path should not be used")
+
+        monkeypatch.setattr(
+            src.main, "bytes_to_dataframe", fail_bytes_to_dataframe
+        )
+
+        assert main(self.input_json) == (
+            b"student_id,name,course,cohort,graduation_date,email_address\n"
+            b"1234,******,Data Science,2023-08-15,2025-06-30,******\n"
+        )
+
+    def test_threshold_of_zero_disables_fast_path(
+        self, mock_s3_setup, monkeypatch
+    ):
+        """
+        Test that a fast path threshold of zero always uses pandas.
+        """
+        monkeypatch.setattr(
+            src.main,
+            "obfuscate_small_file",
+            lambda *args: pytest.fail("fast path should not be used"),
+        )
+        input_json = json.loads(self.input_json)
+        input_json["fast_path_max_bytes"] = 0
+
+        assert main(json.dumps(input_json)).startswith(b"student_id,name")
@@ -0,0 +1,267 @@
+import pytest
+import gzip
+import io
+import pandas as pd
+from src.main import obfuscate_file_content
+from src.streaming import (
+    obfuscate_csv_parts,
+    obfuscate_csv_stream,
+    obfuscate_ndjson_parts,
+    obfuscate_ndjson_stream,
+    split_record_blocks,
+)
+
+
+class TestObfuscateCsvStream:
+    """
+    Tests for the `obfuscate_csv_stream` function.
+    """
+
+    def test_streamed_output_matches_whole_file_output(self):
+        """
+        Test that chunked output joins up to the same CSV as a single pass.
+        """
+        file_path = "tests/dummy_test_data/csv_dummy.csv"
+        pii_fields = ["name", "email_address"]
+
+        with open(file_path, "rb") as stream:
+            chunks = list(obfuscate_csv_stream(stream, pii_fields, 1))
+
+        expected = (
+            pd.read_csv(file_path)
+            .assign(name="******", email_address="******")
+            .to_csv(index=False)
+            .encode("utf-8")
+        )
+        assert len(chunks) == 3
+        assert b"".join(chunks) == expected
+
+    def test_header_only_written_in_first_chunk(self):
+        """
+        Test that the CSV header is emitted once, at the start of the stream.
+        """
+        stream = io.BytesIO(b"id,name\n1,Alice\n2,\n3,Carol\n")
+        chunks = list(obfuscate_csv_stream(stream, ["name"], 2))
+
+        assert chunks == [
+            b"id,name\n1,******\n2,MISSING VALUE\n",
+            b"3,******\n",
+        ]
+
+    def test_stream_with_no_rows_returns_error(self):
+        """
+        Test that a CSV stream with a header but no rows raises a ValueError.
+        """
+        stream = io.BytesIO(b"id,name")
+
+        with pytest.raises(
+            ValueError,
+            match="Input DataFrame is empty. Cannot proceed with processing.",
+        ):
+            list(obfuscate_csv_stream(stream, ["name"]))
+
+
+class TestObfuscateNdjsonStream:
+    """
+    Tests for the `obfuscate_ndjson_stream` function.
+    """
+
+    lines = (
+        b'{"id":1,"name":"Alice","note":"caf\xc3\xa9"}\n'
+        b"\n"
+        b'{"id":2,"name":null}\n'
+        b'{"id":3}\n'
+    )
+
+    def test_records_are_masked_line_by_line(self):
+        """
+        Test that PII fields are masked in each record, chunk by chunk,
+        and that records without the field are left as they are.
+        """
+        chunks = list(
+            obfuscate_ndjson_stream(io.BytesIO(self.lines), ["name"], 2)
+        )
+
+        assert chunks == [
+            b'{"id":1,"name":"******","note":"caf\xc3\xa9"}\n'
+            b'{"id":2,"name":"MISSING VALUE"}\n',
+            b'{"id":3}\n',
+        ]
+
+    def test_gzip_stream_is_decompressed_and_recompressed(self):
+        """
+        Test that a gzip compressed stream gives gzip compressed output.
+        """
+        output = b"".join(
+            obfuscate_ndjson_stream(
+                io.BytesIO(gzip.compress(self.lines)), ["name"]
+            )
+        )
+
+        assert output[:2] == b"\x1f\x8b"
+        assert gzip.decompress(output) == b"".join(
+            obfuscate_ndjson_stream(io.BytesIO(self.lines), ["name"])
+        )
+
+    def test_errors_with_invalid_streams(self):
+        """
+        Test that invalid lines, empty streams and missing fields raise errors.
+        """
+        invalid_streams = [
+            (b'{"name":"Alice"}\n{"name":\n', ["name"]),
+            (b'["Alice"]\n', ["name"]),
+            (b"\n", ["name"]),
+            (self.lines, ["email_address"]),
+        ]
+        expected_error_messages = [
+            "line 2 is not valid JSON",
+            "line 1 is not a JSON object",
+            "Input DataFrame is empty",
+            "Missing columns: email_address",
+        ]
+
+        for (content, pii_fields), expected_message in zip(
+            invalid_streams, expected_error_messages
+        ):
+            with pytest.raises(ValueError, match=expected_message):
+                list(obfuscate_ndjson_stream(io.BytesIO(content), pii_fields))
+
+
+class TestObfuscateParts:
+    """
+    Tests for the `split_record_blocks`, `obfuscate_csv_parts` and
+    `obfuscate_ndjson_parts` functions.
+    """
+
+    def test_blocks_end_on_record_boundaries(self):
+        """
+        Test that parts are re-split after the last complete record, and
+        that newlines inside quoted CSV fields do not end a record.
+        """
+        parts = [b'a\nb,"x\ny', b'"\nc\nd']
+
+        assert list(split_record_blocks(parts)) == [
+            b'a\nb,"x\n',
+            b'y"\nc\n',
+            b"d",
+        ]
+        assert list(split_record_blocks(parts, quoted=True)) == [
+            b"a\n",
+            b'b,"x\ny"\nc\n',
+            b"d",
+        ]
+
+    def test_csv_parts_match_whole_file_output(self):
+        """
+        Test that CSV split into small parts, with quoted newlines, gives
+        the same output as obfuscating the whole file.
+        """
+        content = b"id,name,note\n" + b"".join(
+            b'%d,Name %d,"line one\nline, two"\n' % (i, i) for i in range(50)
+        )
+        parts = [content[i : i + 17] for i in range(0, len(content), 17)]
+
+        expected = (
+            pd.read_csv(io.BytesIO(content))
+            .assign(name="******")
+            .to_csv(index=False)
+            .encode("utf-8")
+        )
+        output = b"".join(obfuscate_csv_parts(parts, ["name"], max_workers=3))
+        assert output == expected
+
+    def test_csv_parts_with_missing_values_in_some_parts(self):
+        """
+        Test that a numeric column with missing values in only some parts
+        is written the same way whatever the part size.
+        """
+        content = b"id,name,age\n" + b"".join(
+            b"%d,Name %d,%s\n" % (i, i, b"" if i >= 40 else b"%d" % (20 + i))
+            for i in range(50)
+        )
+        expected = (
+            b"id,name,age\n"
+            + b"".join(
+                b"%d,******,%s\n" % (i, b"" if i >= 40 else b"%d" % (20 + i))
+                for i in range(50)
+            )
+        )
+
+        for part_size in [len(content), 100, 17]:
+            parts = [
+                content[i : i + part_size]
+                for i in range(0, len(content), part_size)
+            ]
+            output = b"".join(
+                obfuscate_csv_parts(parts, ["name"], max_workers=3)
+            )
+            assert output == expected
+
+    def test_csv_column_that_turns_float_in_a_later_part(self, monkeypatch):
+        """
+        Test that a column that only turns float in a later part is written
+        the same way whatever the part size, and the same way as the whole
+        file, whether or not the float is in the head the column types are
+        inferred from.
+        """
+        content = b"id,name,score\n" + b"".join(
+            b"%d,Name %d,%s\n" % (i, i, b"1.5" if i == 45 else b"%d" % i)
+            for i in range(50)
+        )
+
+        def outputs():
+            return [
+                obfuscate_file_content(
+                    content, "csv", ["name"], fast_path_max_bytes=0
+                )
+            ] + [
+                b"".join(
+                    obfuscate_csv_parts(
+                        [
+                            content[i : i + part_size]
+                            for i in range(0, len(content), part_size)
+                        ],
+                        ["name"],
+                        max_workers=3,
+                    )
+                )
+                for part_size in [len(content), 100, 17]
+            ]
+
+        floats = outputs()
+        assert floats == [floats[0]] * 4
+        assert b"\n3,******,3.0\n" in floats[0]
+        assert b"\n45,******,1.5\n" in floats[0]
+
+        monkeypatch.setattr("src.streaming.CSV_DTYPE_SAMPLE_BYTES", 100)
+        integers = outputs()
+        assert integers == [integers[0]] * 4
+        assert b"\n3,******,3\n" in integers[0]
+        assert b"\n45,******,1.5\n" in integers[0]
+
+    def test_ndjson_parts_match_stream_output(self):
+        """
+        Test that NDJSON split into small parts gives the same output as the
+        stream, and that errors report the right line number.
+        """
+        content = b"".join(
+            b'{"id":%d,"name":"Name %d"}\n' % (i, i) for i in range(50)
+        )
+        parts = [content[i : i + 13] for i in range(0, len(content), 13)]
+
+        assert b"".join(obfuscate_ndjson_parts(parts, ["name"])) == b"".join(
+            obfuscate_ndjson_stream(io.BytesIO(content), ["name"])
+        )
+        with pytest.raises(ValueError, match="line 3 is not valid JSON"):
+            list(obfuscate_ndjson_parts([b"{}\n{}\n", b'{"a":\n'], ["a"]))
+
+    def test_compressed_parts_are_streamed(self):
+        """
+        Test that compressed parts, which cannot be split, still give
+        compressed output.
+        """
+        content = gzip.compress(b"id,name\n1,Alice\n")
+        parts = [content[:5], content[5:]]
+
+        output = b"".join(obfuscate_csv_parts(parts, ["name"]))
+        assert gzip.decompress(output) == b"id,name\n1,******\n"
@@ -1,6 +1,11 @@
 import pytest
 import pandas as pd
-from src.utils import read_json_input, obfuscate_pii_fields
+from src.utils import (
+    get_file_type,
+    read_json_input,
+    read_optional_input,
+    obfuscate_pii_fields,
+)
 
 
 class TestReadJsonInputFunction:
@@ -71,6 +76,134 @@ class TestReadJsonInputFunction:
             with pytest.raises(ValueError, match=expected_message):
                 read_json_input(input_data)
 
+    def test_json_lines_and_compressed_files_are_supported(self):
+        """
+        Test that JSON Lines and compressed files are accepted.
+        """
+        for file_path in [
+            "s3://bucket/a.jsonl",
+            "s3://bucket/a.NDJSON.gz",
+            "s3://bucket/a.csv.zst",
+            "s3://bucket/a.parquet.bz2",
+        ]:
+            assert read_json_input(
+                f'{{"file_to_obfuscate": "{file_path}", "pii_fields": ["name"]}}'
+            ) == (file_path, ["name"])
+
+        with pytest.raises(ValueError, match="Unsupported file type: gz"):
+            read_json_input(
+                '{"file_to_obfuscate": "s3://bucket/a.gz", "pii_fields": ["name"]}'
+            )
+
+    def test_local_files_and_standard_input_are_supported(self):
+        """
+        Test that file URIs and '-' are accepted, that standard input needs
+        a file type and that other paths are rejected.
+        """
+        for input_data in [
+            '{"file_to_obfuscate": "file:///data/a.csv", "pii_fields": ["name"]}',
+            '{"file_to_obfuscate": "file:///data/a", "file_type": "parquet", "pii_fields": ["name"]}',
+            '{"file_to_obfuscate": "-", "file_type": "jsonl", "pii_fields": ["name"]}',
+        ]:
+            assert read_json_input(input_data)[1] == ["name"]
+
+        invalid_inputs = [
+            '{"file_to_obfuscate": "-", "pii_fields": ["name"]}',
+            '{"file_to_obfuscate": "/data/a.csv", "pii_fields": ["name"]}',
+        ]
+        expected_error_messages = [
+            "'file_type' is required when reading from standard input",
+            "Invalid S3 or local path in 'file_to_obfuscate'",
+        ]
+        for input_data, expected_message in zip(
+            invalid_inputs, expected_error_messages
+        ):
+            with pytest.raises(ValueError, match=expected_message):
+                read_json_input(input_data)
+
+
+class TestGetFileType:
+    """
+    Tests for the `get_file_type` function.
+    """
+
+    def test_file_type_comes_from_extension(self):
+        """
+        Test that the file type is the lower-case extension, ignoring a
+        compression suffix.
+        """
+        assert get_file_type("s3://bucket/dir.v2/file.CSV") == "csv"
+        assert get_file_type("s3://bucket/events.ndjson.gz") == "ndjson"
+        assert get_file_type("s3://bucket/events.json.ZST") == "json"
+        assert get_file_type("s3://bucket/events.tar") == "tar"
+
+
+class TestReadOptionalInputFunction:
+    """
+    Tests for the `read_optional_input` function.
+    """
+
+    def test_optional_settings_default_to_none(self):
+        """
+        Test that settings that are not provided are returned as None.
+        """
+        options = read_optional_input(
+            '{"file_to_obfuscate": "s3://bucket/file.csv", "pii_fields": ["name"]}'
+        )
+        assert options == {
+            "destination": None,
+            "part_size_mb": None,
+            "upload_concurrency": None,
+            "fast_path_max_bytes": None,
+            "masking": None,
+            "compression_level": None,
+            "download_part_size_mb": None,
+            "download_concurrency": None,
+            "workers": None,
+            "csv_engine": None,
+            "file_type": None,
+            "detect_pii": None,
+        }
+
+    def test_errors_with_invalid_optional_settings(self):
+        """
+        Test that invalid optional settings raise appropriate errors.
+        """
+        invalid_inputs = [
+            '{"destination": "/tmp/output.csv"}',
+            '{"destination": "s3://bucket/out.csv", "part_size_mb": 1}',
+            '{"destination": "s3://bucket/out.csv", "upload_concurrency": 0}',
+            '{"fast_path_max_bytes": -1}',
+            '{"masking": ["name"]}',
+            '{"compression_level": "fast"}',
+            '{"download_part_size_mb": 0}',
+            '{"download_concurrency": 1.5}',
+            '{"workers": true}',
+            '{"csv_engine": "pyarrow"}',
+            '{"file_type": "xlsx"}',
+            '{"detect_pii": "yes"}',
+        ]
+        expected_error_messages = [
+            "Invalid S3 or local path in 'destination'.",
+            "'part_size_mb' must be a number of at least 5",
+            "'upload_concurrency' must be a positive integer",
+            "'fast_path_max_bytes' must be a non-negative integer",
+            "'masking' must map PII fields to strategies",
+            "'compression_level' must be an integer",
+            "'download_part_size_mb' must be a positive number",
+            "'download_concurrency' must be a positive integer",
+            "'workers' must be a positive integer",
+            "'csv_engine' must be one of pandas, strings",
+            "Unsupported file type: xlsx",
+            "'detect_pii' must be true or false",
+        ]
+
+        for input_data, expected_message in zip(
+            invalid_inputs, expected_error_messages
+        ):
+            with pytest.raises(ValueError, match=expected_message):
+                read_optional_input(input_data)
+
 
 class TestObfuscatePiiFields:
     """
@@ -165,3 +298,23 @@ class TestObfuscatePiiFields:
         assert list(parquet_results["email_address"]) == expected_parquet_email
         assert list(json_results["name"]) == expected_json_name
         assert list(json_results["email_address"]) == expected_json_email
+
+    def test_masked_columns_are_categorical_and_input_is_unchanged(self):
+        """
+        Test that masked columns are two-category categoricals with int8 codes
+        and that only the PII columns of the input are replaced.
+        """
+        csv_data = pd.read_csv("tests/dummy_test_data/csv_dummy.csv")
+        original = csv_data.copy()
+
+        results = obfuscate_pii_fields(csv_data, ["name"])
+
+        assert results["name"].dtype == "category"
+        assert results["name"].cat.codes.dtype == "int8"
+        assert list(results["name"].cat.categories) == [
+            "******",
+            "MISSING VALUE",
+        ]
+        assert results["course"] is not None
+        assert results["course"].values.base is csv_data["course"].values.base
+        pd.testing.assert_frame_equal(csv_data, original)